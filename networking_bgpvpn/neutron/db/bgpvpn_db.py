@@ -13,16 +13,27 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import copy
+
+from neutron.db.models import l3 as l3_models
+from neutron.db import models_v2
 from oslo_db import exception as db_exc
+from oslo_db.sqlalchemy import utils as sa_utils
 from oslo_log import log
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
 
+from neutron_lib.api import attributes
 from neutron_lib.api.definitions import bgpvpn as bgpvpn_def
 from neutron_lib.api.definitions import bgpvpn_routes_control as bgpvpn_rc_def
 from neutron_lib.api.definitions import bgpvpn_vni as bgpvpn_vni_def
+from neutron_lib import constants as const
 from neutron_lib.db import api as db_api
 from neutron_lib.db import constants as db_const
 from neutron_lib.db import model_base
@@ -34,11 +45,33 @@ from neutron_lib.plugins import directory
 from networking_bgpvpn.neutron.extensions import bgpvpn as bgpvpn_ext
 from networking_bgpvpn.neutron.extensions\
     import bgpvpn_routes_control as bgpvpn_rc_ext
+from networking_bgpvpn.neutron.services.common import constants
 from networking_bgpvpn.neutron.services.common import utils
 
 LOG = log.getLogger(__name__)
 
 
+# BGPVPN API attributes stored as is in a column of the bgpvpns table
+BGPVPN_COLUMN_FIELDS = ('id', 'project_id', 'name', 'type')
+# BGPVPN API attributes stored as a comma-separated string
+BGPVPN_RTRD_FIELDS = ('route_targets', 'import_targets', 'export_targets',
+                      'route_distinguishers')
+# BGPVPN API attributes also stored in the bgpvpn_route_targets table
+BGPVPN_RT_FIELDS = ('route_targets', 'import_targets', 'export_targets')
+# BGPVPN API attributes derived from the associations of the BGPVPN
+BGPVPN_ASSOC_FIELDS = ('networks', 'routers', 'ports')
+# BGPVPN API attributes kept in the BGPVPN dict cache, those not derived
+# from the associations (which can change without a new BGPVPN revision)
+BGPVPN_CACHED_FIELDS = (BGPVPN_COLUMN_FIELDS + BGPVPN_RTRD_FIELDS +
+                        (bgpvpn_vni_def.VNI, bgpvpn_rc_def.LOCAL_PREF_KEY))
+
+BGPVPN_CACHE_SIZE = 1024
+
+# Process-local cache of the BGPVPN dicts built by get_bgpvpn, by BGPVPN id,
+# each valid for the revision_number of the BGPVPN it was built from
+_bgpvpn_cache = utils.LRUCache(BGPVPN_CACHE_SIZE)
+
+
 class HasProjectNotNullable(model_base.HasProject):
 
     project_id = sa.Column(sa.String(db_const.PROJECT_ID_FIELD_SIZE),
@@ -57,7 +90,8 @@ class BGPVPNNetAssociation(standard_attr.HasStandardAttributes,
                           nullable=False)
     network_id = sa.Column(sa.String(36),
                            sa.ForeignKey('networks.id', ondelete='CASCADE'),
-                           nullable=False)
+                           nullable=False,
+                           index=True)
     sa.UniqueConstraint(bgpvpn_id, network_id)
     network = orm.relationship("Network",
                                backref=orm.backref('bgpvpn_associations',
@@ -82,7 +116,8 @@ class BGPVPNRouterAssociation(standard_attr.HasStandardAttributes,
                           nullable=False)
     router_id = sa.Column(sa.String(36),
                           sa.ForeignKey('routers.id', ondelete='CASCADE'),
-                          nullable=False)
+                          nullable=False,
+                          index=True)
     sa.UniqueConstraint(bgpvpn_id, router_id)
     advertise_extra_routes = sa.Column(sa.Boolean(), nullable=False,
                                        server_default=sa.true())
@@ -109,7 +144,8 @@ class BGPVPNPortAssociation(standard_attr.HasStandardAttributes,
                           nullable=False)
     port_id = sa.Column(sa.String(36),
                         sa.ForeignKey('ports.id', ondelete='CASCADE'),
-                        nullable=False)
+                        nullable=False,
+                        index=True)
     sa.UniqueConstraint(bgpvpn_id, port_id)
     advertise_fixed_ips = sa.Column(sa.Boolean(), nullable=False,
                                     server_default=sa.true())
@@ -150,6 +186,9 @@ class BGPVPN(standard_attr.HasStandardAttributes, model_base.BASEV2,
                                          backref="bgpvpn",
                                          lazy='select',
                                          cascade='all, delete-orphan')
+    route_target_entries = orm.relationship("BGPVPNRouteTarget",
+                                            lazy='select',
+                                            cascade='all, delete-orphan')
 
     # standard attributes support:
     api_collections = [bgpvpn_def.COLLECTION_NAME]
@@ -157,6 +196,25 @@ class BGPVPN(standard_attr.HasStandardAttributes, model_base.BASEV2,
                                bgpvpn_def.RESOURCE_NAME}
 
 
+class BGPVPNRouteTarget(model_base.BASEV2):
+    """Represents one of the route targets of a BGPVPN
+
+    The route targets of a BGPVPN are stored as comma-separated strings in
+    the bgpvpns table; this table holds the same information with one row
+    per route target, to allow indexed lookups of BGPVPNs by route target.
+    """
+    __tablename__ = 'bgpvpn_route_targets'
+
+    bgpvpn_id = sa.Column(sa.String(36),
+                          sa.ForeignKey('bgpvpns.id', ondelete='CASCADE'),
+                          primary_key=True)
+    # the BGPVPN attribute the route target comes from
+    kind = sa.Column(sa.Enum(*BGPVPN_RT_FIELDS,
+                             name="bgpvpn_route_target_kinds"),
+                     primary_key=True)
+    value = sa.Column(sa.String(64), primary_key=True, index=True)
+
+
 class BGPVPNPortAssociationRoute(model_base.BASEV2, model_base.HasId):
     """Represents an item of the 'routes' attribute of a port association."""
     __tablename__ = 'bgpvpn_port_association_routes'
@@ -192,27 +250,111 @@ class BGPVPNPortAssociationRoute(model_base.BASEV2, model_base.HasId):
         lazy='joined')
 
 
-def _list_bgpvpns_result_filter_hook(query, filters):
-    values = filters and filters.get('networks', [])
-    if values:
-        query = query.join(BGPVPNNetAssociation)
-        query = query.filter(BGPVPNNetAssociation.network_id.in_(values))
+class BGPVPNJournalEntry(model_base.BASEV2):
+    """Represents a driver postcommit hook which remains to be run
+
+    Entries are written in the transaction of the change they relate to,
+    and deleted once the hook succeeds.
+    """
+    __tablename__ = 'bgpvpn_journal'
+
+    id = sa.Column(sa.Integer(), primary_key=True, autoincrement=True)
+    # not a foreign key: the entry of a BGPVPN deletion outlives the BGPVPN
+    bgpvpn_id = sa.Column(sa.String(36), nullable=False, index=True)
+    resource_id = sa.Column(sa.String(36), nullable=False)
+    # the name of the driver postcommit hook
+    operation = sa.Column(sa.String(64), nullable=False)
+    # the JSON-serialized arguments of the hook, besides the context; those
+    # of bulk association creations, or of port associations with many
+    # routes, do not fit in a MySQL TEXT
+    data = sa.Column(sa.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'),
+                     nullable=False)
+    attempts = sa.Column(sa.Integer(), nullable=False, default=0)
+    next_attempt_at = sa.Column(sa.DateTime(), nullable=False)
+    created_at = sa.Column(sa.DateTime(), nullable=False)
+    last_error = sa.Column(sa.String(255), nullable=True)
 
-    values = filters and filters.get('routers', [])
-    if values:
-        query = query.join(BGPVPNRouterAssociation)
-        query = query.filter(BGPVPNRouterAssociation.router_id.in_(values))
 
-    values = filters and filters.get('ports', [])
-    if values:
-        query = query.join(BGPVPNRouterAssociation)
-        query = query.filter(BGPVPNPortAssociation.port_id.in_(values))
+def _list_bgpvpns_result_filter_hook(query, filters):
+    # NOTE: correlated EXISTS subqueries rather than JOINs, so that a
+    # BGPVPN is returned only once when several of its associations match
+    for key, model, column in (
+            ('networks', BGPVPNNetAssociation,
+             BGPVPNNetAssociation.network_id),
+            ('routers', BGPVPNRouterAssociation,
+             BGPVPNRouterAssociation.router_id),
+            ('ports', BGPVPNPortAssociation,
+             BGPVPNPortAssociation.port_id)):
+        values = filters and filters.get(key, [])
+        if values:
+            query = query.filter(sa.exists().where(
+                model.bgpvpn_id == BGPVPN.id,
+                column.in_(values)))
 
     return query
 
 
-@db_api.CONTEXT_WRITER
-def _add_port_assoc_route_db_from_dict(context, route, port_association_id):
+def _paginate_query(query, model, sorts=None, limit=None, marker_obj=None,
+                    page_reverse=False):
+    """Apply DB-side sorting and keyset pagination to a query
+
+    This does what model_query.get_collection_query does, for queries
+    which are not built with it.
+    """
+    if not sorts:
+        return query
+    sort_keys = db_utils.get_and_validate_sort_keys(sorts, model)
+    sort_dirs = db_utils.get_sort_dirs(sorts, page_reverse)
+    # the id is unique, and makes the sort order deterministic
+    if 'id' not in sort_keys:
+        sort_keys.append('id')
+        sort_dirs.append('asc')
+    return sa_utils.paginate_query(query, model, limit,
+                                   marker=marker_obj,
+                                   sort_keys=sort_keys,
+                                   sort_dirs=sort_dirs)
+
+
+def _bgpvpn_rt_filter(kind, values):
+    """Filter on BGPVPNs having one of the values in their 'kind' RTs"""
+    return sa.exists().where(
+        BGPVPNRouteTarget.bgpvpn_id == BGPVPN.id,
+        BGPVPNRouteTarget.kind == kind,
+        BGPVPNRouteTarget.value.in_(values))
+
+
+def _set_bgpvpn_route_targets(bgpvpn_db, kind, values):
+    """Sync the bgpvpn_route_targets rows of a BGPVPN for one kind of RTs"""
+    values = set(utils.rtrd_str2list(values))
+    current = {entry.value: entry for entry in bgpvpn_db.route_target_entries
+               if entry.kind == kind}
+    for value, entry in current.items():
+        if value not in values:
+            bgpvpn_db.route_target_entries.remove(entry)
+    for value in values - set(current):
+        bgpvpn_db.route_target_entries.append(
+            BGPVPNRouteTarget(kind=kind, value=value))
+
+
+def _find_already_associated(context, model, column, bgpvpn_id,
+                             resource_ids):
+    """Return a resource which can't be associated again to a BGPVPN
+
+    This is the first of resource_ids which is either repeated, or already
+    associated to the BGPVPN, or None if there is no such resource.
+    """
+    seen = set()
+    for resource_id in resource_ids:
+        if resource_id in seen:
+            return resource_id
+        seen.add(resource_id)
+    row = context.session.query(column).filter(
+        model.bgpvpn_id == bgpvpn_id,
+        column.in_(seen)).first()
+    return row[0] if row else None
+
+
+def _port_assoc_route_db_from_dict(route, port_association_id=None):
     kwargs = {}
     if route['type'] == 'prefix':
         kwargs = {'prefix': route['prefix']}
@@ -222,12 +364,18 @@ def _add_port_assoc_route_db_from_dict(context, route, port_association_id):
         # not reached
         pass
 
-    context.session.add(BGPVPNPortAssociationRoute(
+    return BGPVPNPortAssociationRoute(
         port_association_id=port_association_id,
         type=route['type'],
         local_pref=route.get('local_pref', None),
         **kwargs
-    ))
+    )
+
+
+@db_api.CONTEXT_WRITER
+def _add_port_assoc_route_db_from_dict(context, route, port_association_id):
+    context.session.add(
+        _port_assoc_route_db_from_dict(route, port_association_id))
 
 
 def port_assoc_route_dict_from_db(route_db):
@@ -242,6 +390,30 @@ def port_assoc_route_dict_from_db(route_db):
     return route
 
 
+def _port_assoc_route_key(route):
+    if route['type'] == 'prefix':
+        value = route['prefix']
+    else:
+        value = route['bgpvpn_id']
+    return (route['type'], value, route.get('local_pref'))
+
+
+def port_assoc_routes_diff(old_routes, new_routes):
+    """Compute the routes added and removed by a port association update
+
+    Routes are compared on their type, prefix or BGPVPN, and local_pref: a
+    route for which only the local_pref changed is both removed and added.
+    """
+    old_routes = {_port_assoc_route_key(route): route for route in old_routes}
+    new_routes = {_port_assoc_route_key(route): route for route in new_routes}
+    return {
+        'added': [route for key, route in new_routes.items()
+                  if key not in old_routes],
+        'removed': [route for key, route in old_routes.items()
+                    if key not in new_routes],
+    }
+
+
 class BGPVPNPluginDb():
     """BGPVPN service plugin database class using SQLAlchemy models."""
 
@@ -266,40 +438,85 @@ class BGPVPNPluginDb():
                 for bgpvpn in bgpvpns]
 
     @db_api.CONTEXT_READER
-    def _make_bgpvpn_dict(self, bgpvpn_db, fields=None):
-        net_list = [net_assocs.network_id for net_assocs in
-                    bgpvpn_db.network_associations]
-        router_list = [router_assocs.router_id for router_assocs in
-                       bgpvpn_db.router_associations]
-        port_list = [port_assocs.port_id for port_assocs in
-                     bgpvpn_db.port_associations]
-        res = {
-            'id': bgpvpn_db['id'],
-            'project_id': bgpvpn_db['project_id'],
-            'networks': net_list,
-            'routers': router_list,
-            'ports': port_list,
-            'name': bgpvpn_db['name'],
-            'type': bgpvpn_db['type'],
-            'route_targets':
-                utils.rtrd_str2list(bgpvpn_db['route_targets']),
-            'route_distinguishers':
-                utils.rtrd_str2list(bgpvpn_db['route_distinguishers']),
-            'import_targets':
-                utils.rtrd_str2list(bgpvpn_db['import_targets']),
-            'export_targets':
-                utils.rtrd_str2list(bgpvpn_db['export_targets'])
-        }
+    def _get_bgpvpns_associations(self, context, bgpvpn_ids):
+        """Fetch the associated resource ids of several BGPVPNs at once
+
+        Returns a dict mapping each BGPVPN id to a dict with 'networks',
+        'routers' and 'ports' lists, with a single query per association
+        type instead of one lazy load per BGPVPN and association type.
+        """
+        assocs = {bgpvpn_id: {'networks': [], 'routers': [], 'ports': []}
+                  for bgpvpn_id in bgpvpn_ids}
+        if not assocs:
+            return assocs
+        for key, model, column in (
+                ('networks', BGPVPNNetAssociation,
+                 BGPVPNNetAssociation.network_id),
+                ('routers', BGPVPNRouterAssociation,
+                 BGPVPNRouterAssociation.router_id),
+                ('ports', BGPVPNPortAssociation,
+                 BGPVPNPortAssociation.port_id)):
+            query = (context.session.query(model.bgpvpn_id, column).
+                     filter(model.bgpvpn_id.in_(list(assocs))))
+            for bgpvpn_id, resource_id in query:
+                assocs[bgpvpn_id][key].append(resource_id)
+        return assocs
+
+    def _make_bgpvpn_dict(self, bgpvpn_db, fields=None, associations=None):
+        """Build the API dict of a BGPVPN
+
+        bgpvpn_db can either be a BGPVPN object or the mapping of a row
+        produced by a query restricted to the columns required for the
+        requested fields (see _bgpvpn_columns).
+        """
+        def wanted(key):
+            return not fields or key in fields
+
+        res = {key: bgpvpn_db[key] for key in BGPVPN_COLUMN_FIELDS
+               if wanted(key)}
+        res.update({key: utils.rtrd_str2list(bgpvpn_db[key])
+                    for key in BGPVPN_RTRD_FIELDS if wanted(key)})
+
+        if any(wanted(key) for key in BGPVPN_ASSOC_FIELDS):
+            if associations is None:
+                associations = {
+                    'networks': [net_assocs.network_id for net_assocs in
+                                 bgpvpn_db.network_associations],
+                    'routers': [router_assocs.router_id for router_assocs in
+                                bgpvpn_db.router_associations],
+                    'ports': [port_assocs.port_id for port_assocs in
+                              bgpvpn_db.port_associations],
+                }
+            res.update({key: associations[key]
+                        for key in BGPVPN_ASSOC_FIELDS if wanted(key)})
 
         plugin = directory.get_plugin(bgpvpn_def.ALIAS)
-        if utils.is_extension_supported(plugin, bgpvpn_vni_def.ALIAS):
+        if (wanted(bgpvpn_vni_def.VNI) and
+                utils.is_extension_supported(plugin, bgpvpn_vni_def.ALIAS)):
             res[bgpvpn_vni_def.VNI] = bgpvpn_db.get(bgpvpn_vni_def.VNI)
-        if utils.is_extension_supported(plugin, bgpvpn_rc_def.ALIAS):
+        if (wanted(bgpvpn_rc_def.LOCAL_PREF_KEY) and
+                utils.is_extension_supported(plugin, bgpvpn_rc_def.ALIAS)):
             res[bgpvpn_rc_def.LOCAL_PREF_KEY] = bgpvpn_db.get(
                 bgpvpn_rc_def.LOCAL_PREF_KEY)
 
         return db_utils.resource_fields(res, fields)
 
+    @staticmethod
+    def _bgpvpn_columns(fields):
+        """Columns of the bgpvpns table needed to render the given fields
+
+        The id is always selected, as associations are looked up by BGPVPN id.
+        """
+        keys = {'id'}
+        keys.update(key for key in fields
+                    if key in BGPVPN_COLUMN_FIELDS + BGPVPN_RTRD_FIELDS +
+                    (bgpvpn_vni_def.VNI, bgpvpn_rc_def.LOCAL_PREF_KEY))
+        return [getattr(BGPVPN, key) for key in sorted(keys)]
+
+    @staticmethod
+    def _needs_associations(fields):
+        return not fields or any(key in fields for key in BGPVPN_ASSOC_FIELDS)
+
     @db_api.CONTEXT_WRITER
     def create_bgpvpn(self, context, bgpvpn):
         rt = utils.rtrd_list2str(bgpvpn['route_targets'])
@@ -319,14 +536,67 @@ class BGPVPNPluginDb():
             vni=bgpvpn.get(bgpvpn_vni_def.VNI),
             local_pref=bgpvpn.get(bgpvpn_rc_def.LOCAL_PREF_KEY),
         )
+        for kind in BGPVPN_RT_FIELDS:
+            _set_bgpvpn_route_targets(bgpvpn_db, kind, bgpvpn[kind])
         context.session.add(bgpvpn_db)
         return self._make_bgpvpn_dict(bgpvpn_db)
 
+    def _get_bgpvpns_query(self, context, filters=None):
+        filters = dict(filters or {})
+        # route target filters match any of the route targets of a BGPVPN
+        # and are looked up in the bgpvpn_route_targets table, rather than
+        # compared to the comma-separated column of the bgpvpns table
+        rt_filters = {kind: filters.pop(kind) for kind in BGPVPN_RT_FIELDS
+                      if kind in filters}
+        query = model_query.query_with_hooks(context, BGPVPN)
+        for kind, values in rt_filters.items():
+            query = query.filter(_bgpvpn_rt_filter(kind, values))
+        return model_query.apply_filters(query, BGPVPN, filters, context)
+
     @db_api.CONTEXT_READER
-    def get_bgpvpns(self, context, filters=None, fields=None):
-        return model_query.get_collection(
-            context, BGPVPN, self._make_bgpvpn_dict,
-            filters=filters, fields=fields)
+    def router_and_network_bound_to_bgpvpns(self, context, router_id,
+                                            network_id):
+        """Tell if a router and a network are both bound to BGPVPNs
+
+        True if the router is associated to a BGPVPN and the network is
+        associated to an L3 BGPVPN, answered with a single EXISTS query.
+        """
+        router_query = self._get_bgpvpns_query(
+            context, filters={'routers': [router_id]})
+        network_query = self._get_bgpvpns_query(
+            context, filters={'networks': [network_id],
+                              'type': [constants.BGPVPN_L3]})
+        return context.session.query(
+            sa.and_(router_query.exists(), network_query.exists())).scalar()
+
+    @db_api.CONTEXT_READER
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
+        marker_obj = db_utils.get_marker_obj(self, context, 'bgpvpn',
+                                             limit, marker)
+        query = self._get_bgpvpns_query(context, filters)
+        if fields:
+            # only select the columns needed for the requested fields
+            query = query.with_entities(*self._bgpvpn_columns(fields))
+        query = _paginate_query(query, BGPVPN, sorts, limit, marker_obj,
+                                page_reverse)
+        if fields:
+            bgpvpns_db = [row._mapping for row in query]
+        else:
+            bgpvpns_db = query.all()
+        if limit and page_reverse:
+            bgpvpns_db.reverse()
+        assocs = {}
+        if self._needs_associations(fields):
+            assocs = self._get_bgpvpns_associations(
+                context, [bgpvpn_db['id'] for bgpvpn_db in bgpvpns_db])
+        return [
+            attributes.populate_project_info(
+                self._make_bgpvpn_dict(bgpvpn_db, fields,
+                                       associations=assocs.get(
+                                           bgpvpn_db['id'])))
+            for bgpvpn_db in bgpvpns_db
+        ]
 
     @db_api.CONTEXT_READER
     def _get_bgpvpn(self, context, id):
@@ -335,15 +605,51 @@ class BGPVPNPluginDb():
         except exc.NoResultFound as no_res:
             raise bgpvpn_ext.BGPVPNNotFound(id=id) from no_res
 
+    @db_api.CONTEXT_READER
+    def _get_cached_bgpvpn(self, context, id):
+        """Get the dict of a BGPVPN, without its associations
+
+        The dict is only built if it isn't already in the cache for the
+        current revision_number of the BGPVPN, which is the only thing
+        fetched from the database otherwise.
+        """
+        try:
+            revision_number = (
+                model_query.query_with_hooks(context, BGPVPN).
+                join(BGPVPN.standard_attr).
+                with_entities(standard_attr.StandardAttribute.revision_number).
+                filter(BGPVPN.id == id).one())[0]
+        except exc.NoResultFound as no_res:
+            raise bgpvpn_ext.BGPVPNNotFound(id=id) from no_res
+        bgpvpn = _bgpvpn_cache.get(id, revision_number)
+        if bgpvpn is None:
+            bgpvpn = self._make_bgpvpn_dict(self._get_bgpvpn(context, id),
+                                            fields=BGPVPN_CACHED_FIELDS)
+            _bgpvpn_cache.set(id, bgpvpn, revision_number)
+        # callers get their own copy, which they are free to modify
+        return {key: copy.copy(value) for key, value in bgpvpn.items()}
+
+    @staticmethod
+    def get_bgpvpn_cache_stats():
+        return _bgpvpn_cache.stats()
+
     @db_api.CONTEXT_READER
     def get_bgpvpn(self, context, id, fields=None):
-        bgpvpn_db = self._get_bgpvpn(context, id)
-        return self._make_bgpvpn_dict(bgpvpn_db, fields)
+        bgpvpn = self._get_cached_bgpvpn(context, id)
+        if self._needs_associations(fields):
+            bgpvpn.update(self._get_bgpvpns_associations(context, [id])[id])
+        return db_utils.resource_fields(bgpvpn, fields)
 
     @db_api.CONTEXT_WRITER
     def update_bgpvpn(self, context, id, bgpvpn):
+        # NOTE: the update also bumps the revision_number of the BGPVPN, which
+        # invalidates its dicts cached by other processes
+        _bgpvpn_cache.invalidate(id)
         bgpvpn_db = self._get_bgpvpn(context, id)
         if bgpvpn:
+            for kind in BGPVPN_RT_FIELDS:
+                if kind in bgpvpn:
+                    _set_bgpvpn_route_targets(bgpvpn_db, kind, bgpvpn[kind])
             # Format Route Target lists to string
             if 'route_targets' in bgpvpn:
                 rt = utils.rtrd_list2str(bgpvpn['route_targets'])
@@ -362,11 +668,69 @@ class BGPVPNPluginDb():
 
     @db_api.CONTEXT_WRITER
     def delete_bgpvpn(self, context, id):
+        _bgpvpn_cache.invalidate(id)
         bgpvpn_db = self._get_bgpvpn(context, id)
         bgpvpn = self._make_bgpvpn_dict(bgpvpn_db)
         context.session.delete(bgpvpn_db)
         return bgpvpn
 
+    @db_api.CONTEXT_READER
+    def get_networks_router_bgpvpns(self, context, network_ids):
+        """Find the L3 BGPVPNs associated to a router of some networks
+
+        Returns a dict mapping the id of each of the networks having an
+        interface on a router associated to L3 BGPVPN(s) of the project of
+        the network, to the ids of these BGPVPNs.
+        """
+        query = (context.session.query(models_v2.Port.network_id,
+                                       BGPVPN.id).
+                 join(BGPVPNRouterAssociation,
+                      BGPVPNRouterAssociation.router_id ==
+                      models_v2.Port.device_id).
+                 join(BGPVPN,
+                      BGPVPN.id == BGPVPNRouterAssociation.bgpvpn_id).
+                 join(models_v2.Network,
+                      models_v2.Network.id == models_v2.Port.network_id).
+                 filter(models_v2.Port.network_id.in_(network_ids),
+                        models_v2.Port.device_owner ==
+                        const.DEVICE_OWNER_ROUTER_INTF,
+                        BGPVPN.type == constants.BGPVPN_L3,
+                        BGPVPN.project_id == models_v2.Network.project_id).
+                 distinct())
+        bgpvpns = collections.defaultdict(list)
+        for network_id, bgpvpn_id in query:
+            bgpvpns[network_id].append(bgpvpn_id)
+        return dict(bgpvpns)
+
+    @db_api.CONTEXT_READER
+    def get_routers_network_bgpvpns(self, context, router_ids):
+        """Find the L3 BGPVPNs associated to a network of some routers
+
+        Returns a dict mapping (router_id, network_id) tuples, for each of
+        the routers having an interface on a network associated to L3
+        BGPVPN(s) of the project of the router, to the ids of these BGPVPNs.
+        """
+        query = (context.session.query(models_v2.Port.device_id,
+                                       models_v2.Port.network_id,
+                                       BGPVPN.id).
+                 join(BGPVPNNetAssociation,
+                      BGPVPNNetAssociation.network_id ==
+                      models_v2.Port.network_id).
+                 join(BGPVPN,
+                      BGPVPN.id == BGPVPNNetAssociation.bgpvpn_id).
+                 join(l3_models.Router,
+                      l3_models.Router.id == models_v2.Port.device_id).
+                 filter(models_v2.Port.device_id.in_(router_ids),
+                        models_v2.Port.device_owner ==
+                        const.DEVICE_OWNER_ROUTER_INTF,
+                        BGPVPN.type == constants.BGPVPN_L3,
+                        BGPVPN.project_id == l3_models.Router.project_id).
+                 distinct())
+        bgpvpns = collections.defaultdict(list)
+        for router_id, network_id, bgpvpn_id in query:
+            bgpvpns[(router_id, network_id)].append(bgpvpn_id)
+        return dict(bgpvpns)
+
     @db_api.CONTEXT_READER
     def _make_net_assoc_dict(self, net_assoc_db, fields=None):
         res = {'id': net_assoc_db['id'],
@@ -405,20 +769,58 @@ class BGPVPNPluginDb():
                 bgpvpn_id=bgpvpn_id,
                 net_id=net_assoc['network_id']) from db_dup_exc
 
+    def create_net_assocs(self, context, bgpvpn_id, net_assocs):
+        network_ids = [net_assoc['network_id'] for net_assoc in net_assocs]
+        try:
+            with db_api.CONTEXT_WRITER.using(context):
+                net_id = _find_already_associated(
+                    context, BGPVPNNetAssociation,
+                    BGPVPNNetAssociation.network_id, bgpvpn_id, network_ids)
+                if net_id:
+                    raise bgpvpn_ext.BGPVPNNetAssocAlreadyExists(
+                        bgpvpn_id=bgpvpn_id, net_id=net_id)
+                net_assocs_db = [
+                    BGPVPNNetAssociation(
+                        id=uuidutils.generate_uuid(),
+                        project_id=net_assoc['project_id'],
+                        bgpvpn_id=bgpvpn_id,
+                        network_id=net_assoc['network_id'])
+                    for net_assoc in net_assocs]
+                # a single flush lets SQLAlchemy batch the INSERTs
+                context.session.add_all(net_assocs_db)
+                context.session.flush()
+            return [self._make_net_assoc_dict(net_assoc_db)
+                    for net_assoc_db in net_assocs_db]
+        except db_exc.DBDuplicateEntry as db_dup_exc:
+            LOG.warning("one of networks %(net_ids)s is already associated "
+                        "to BGPVPN %(bgpvpn_id)s",
+                        {'net_ids': network_ids,
+                         'bgpvpn_id': bgpvpn_id})
+            raise bgpvpn_ext.BGPVPNNetAssocAlreadyExists(
+                bgpvpn_id=bgpvpn_id,
+                net_id=', '.join(network_ids)) from db_dup_exc
+
     @db_api.CONTEXT_READER
     def get_net_assoc(self, context, assoc_id, bgpvpn_id, fields=None):
         net_assoc_db = self._get_net_assoc(context, assoc_id, bgpvpn_id)
         return self._make_net_assoc_dict(net_assoc_db, fields)
 
     @db_api.CONTEXT_READER
-    def get_net_assocs(self, context, bgpvpn_id, filters=None, fields=None):
+    def get_net_assocs(self, context, bgpvpn_id, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
         if not filters:
             filters = {}
         filters['bgpvpn_id'] = [bgpvpn_id]
+        marker_obj = None
+        if limit and marker:
+            marker_obj = self._get_net_assoc(context, marker, bgpvpn_id)
         return model_query.get_collection(
             context, BGPVPNNetAssociation,
             self._make_net_assoc_dict,
-            filters, fields)
+            filters, fields,
+            sorts=sorts, limit=limit, marker_obj=marker_obj,
+            page_reverse=page_reverse)
 
     @db_api.CONTEXT_WRITER
     def delete_net_assoc(self, context, assoc_id, bgpvpn_id):
@@ -473,20 +875,59 @@ class BGPVPNPluginDb():
                 bgpvpn_id=bgpvpn_id,
                 router_id=router_association['router_id']) from db_dup_exc
 
+    @db_api.CONTEXT_WRITER
+    def create_router_assocs(self, context, bgpvpn_id, router_associations):
+        router_ids = [router_assoc['router_id']
+                      for router_assoc in router_associations]
+        router_id = _find_already_associated(
+            context, BGPVPNRouterAssociation,
+            BGPVPNRouterAssociation.router_id, bgpvpn_id, router_ids)
+        if router_id:
+            raise bgpvpn_ext.BGPVPNRouterAssocAlreadyExists(
+                bgpvpn_id=bgpvpn_id, router_id=router_id)
+        try:
+            router_assocs_db = [
+                BGPVPNRouterAssociation(
+                    id=uuidutils.generate_uuid(),
+                    project_id=router_assoc['project_id'],
+                    bgpvpn_id=bgpvpn_id,
+                    router_id=router_assoc['router_id'])
+                for router_assoc in router_associations]
+            # a single flush lets SQLAlchemy batch the INSERTs
+            context.session.add_all(router_assocs_db)
+            context.session.flush()
+            return [self._make_router_assoc_dict(router_assoc_db)
+                    for router_assoc_db in router_assocs_db]
+        except db_exc.DBDuplicateEntry as db_dup_exc:
+            LOG.warning("one of routers %(router_ids)s is already "
+                        "associated to BGPVPN %(bgpvpn_id)s",
+                        {'router_ids': router_ids,
+                         'bgpvpn_id': bgpvpn_id})
+            raise bgpvpn_ext.BGPVPNRouterAssocAlreadyExists(
+                bgpvpn_id=bgpvpn_id,
+                router_id=', '.join(router_ids)) from db_dup_exc
+
     @db_api.CONTEXT_READER
     def get_router_assoc(self, context, assoc_id, bgpvpn_id, fields=None):
         router_assoc_db = self._get_router_assoc(context, assoc_id, bgpvpn_id)
         return self._make_router_assoc_dict(router_assoc_db, fields)
 
     @db_api.CONTEXT_READER
-    def get_router_assocs(self, context, bgpvpn_id, filters=None, fields=None):
+    def get_router_assocs(self, context, bgpvpn_id, filters=None, fields=None,
+                          sorts=None, limit=None, marker=None,
+                          page_reverse=False):
         if not filters:
             filters = {}
         filters['bgpvpn_id'] = [bgpvpn_id]
+        marker_obj = None
+        if limit and marker:
+            marker_obj = self._get_router_assoc(context, marker, bgpvpn_id)
         return model_query.get_collection(
             context, BGPVPNRouterAssociation,
             self._make_router_assoc_dict,
-            filters, fields)
+            filters, fields,
+            sorts=sorts, limit=limit, marker_obj=marker_obj,
+            page_reverse=page_reverse)
 
     @db_api.CONTEXT_WRITER
     def update_router_assoc(self, context, assoc_id, bgpvpn_id, router_assoc):
@@ -556,31 +997,89 @@ class BGPVPNPluginDb():
                 context, route, port_assoc_db.id)
         return self._make_port_assoc_dict(port_assoc_db)
 
+    def create_port_assocs(self, context, bgpvpn_id, port_associations):
+        port_ids = [port_assoc['port_id'] for port_assoc in port_associations]
+        try:
+            with db_api.CONTEXT_WRITER.using(context):
+                port_id = _find_already_associated(
+                    context, BGPVPNPortAssociation,
+                    BGPVPNPortAssociation.port_id, bgpvpn_id, port_ids)
+                if port_id:
+                    raise bgpvpn_rc_ext.BGPVPNPortAssocAlreadyExists(
+                        bgpvpn_id=bgpvpn_id, port_id=port_id)
+                port_assocs_db = [
+                    BGPVPNPortAssociation(
+                        id=uuidutils.generate_uuid(),
+                        project_id=port_assoc['project_id'],
+                        bgpvpn_id=bgpvpn_id,
+                        port_id=port_assoc['port_id'],
+                        advertise_fixed_ips=port_assoc['advertise_fixed_ips'],
+                        routes=[_port_assoc_route_db_from_dict(route)
+                                for route in port_assoc['routes']])
+                    for port_assoc in port_associations]
+                # a single flush lets SQLAlchemy batch the INSERTs of the
+                # associations, and then of their routes
+                context.session.add_all(port_assocs_db)
+                context.session.flush()
+                return [self._make_port_assoc_dict(port_assoc_db)
+                        for port_assoc_db in port_assocs_db]
+        except db_exc.DBDuplicateEntry as db_dup_exc:
+            LOG.warning("one of ports %(port_ids)s is already associated to "
+                        "BGPVPN %(bgpvpn_id)s",
+                        {'port_ids': port_ids,
+                         'bgpvpn_id': bgpvpn_id})
+            raise bgpvpn_rc_ext.BGPVPNPortAssocAlreadyExists(
+                bgpvpn_id=bgpvpn_id,
+                port_id=', '.join(port_ids)) from db_dup_exc
+
     @db_api.CONTEXT_READER
     def get_port_assoc(self, context, assoc_id, bgpvpn_id, fields=None):
         port_assoc_db = self._get_port_assoc(context, assoc_id, bgpvpn_id)
         return self._make_port_assoc_dict(port_assoc_db, fields)
 
     @db_api.CONTEXT_READER
-    def get_port_assocs(self, context, bgpvpn_id, filters=None, fields=None):
+    def get_port_assocs(self, context, bgpvpn_id, filters=None, fields=None,
+                        sorts=None, limit=None, marker=None,
+                        page_reverse=False):
         if not filters:
             filters = {}
         filters['bgpvpn_id'] = [bgpvpn_id]
+        marker_obj = None
+        if limit and marker:
+            marker_obj = self._get_port_assoc(context, marker, bgpvpn_id)
         return model_query.get_collection(
             context, BGPVPNPortAssociation,
             self._make_port_assoc_dict,
-            filters, fields)
+            filters, fields,
+            sorts=sorts, limit=limit, marker_obj=marker_obj,
+            page_reverse=page_reverse)
 
     def update_port_assoc(self, context, assoc_id, bgpvpn_id, port_assoc):
+        # the routes are popped from a copy, the caller keeps using its dict
+        port_assoc = dict(port_assoc)
         with db_api.CONTEXT_WRITER.using(context):
             port_assoc_db = self._get_port_assoc(context, assoc_id, bgpvpn_id)
-            for route_db in port_assoc_db.routes:
-                context.session.delete(route_db)
-            for route in port_assoc.pop('routes', []):
-                _add_port_assoc_route_db_from_dict(context, route, assoc_id)
+            if 'routes' in port_assoc:
+                self._update_port_assoc_routes(context, port_assoc_db,
+                                               port_assoc.pop('routes'))
             port_assoc_db.update(port_assoc)
-        context.session.refresh(port_assoc_db)
-        return self._make_port_assoc_dict(port_assoc_db)
+            return self._make_port_assoc_dict(port_assoc_db)
+
+    @staticmethod
+    def _update_port_assoc_routes(context, port_assoc_db, routes):
+        # only the rows of the routes which changed are deleted or inserted,
+        # the routes collection is kept in sync so that it does not need to
+        # be loaded again
+        routes_db = {
+            _port_assoc_route_key(port_assoc_route_dict_from_db(route_db)):
+            route_db for route_db in port_assoc_db.routes}
+        routes = {_port_assoc_route_key(route): route for route in routes}
+        for key, route_db in routes_db.items():
+            if key not in routes:
+                context.session.delete(route_db)
+        port_assoc_db.routes = [
+            routes_db.get(key) or _port_assoc_route_db_from_dict(route)
+            for key, route in routes.items()]
 
     @db_api.CONTEXT_WRITER
     def delete_port_assoc(self, context, assoc_id, bgpvpn_id):
@@ -592,3 +1091,91 @@ class BGPVPNPluginDb():
         port_assoc = self._make_port_assoc_dict(port_assoc_db)
         context.session.delete(port_assoc_db)
         return port_assoc
+
+    @db_api.CONTEXT_WRITER
+    def create_journal_entry(self, context, bgpvpn_id, resource_id,
+                             operation, args, kwargs, next_attempt_at):
+        entry_db = BGPVPNJournalEntry(
+            bgpvpn_id=bgpvpn_id,
+            resource_id=resource_id,
+            operation=operation,
+            data=jsonutils.dumps({'args': args, 'kwargs': kwargs}),
+            attempts=0,
+            next_attempt_at=next_attempt_at,
+            created_at=timeutils.utcnow())
+        context.session.add(entry_db)
+        context.session.flush()
+        return entry_db.id
+
+    @staticmethod
+    def _make_journal_entry_dict(entry_db):
+        data = jsonutils.loads(entry_db.data)
+        return {'id': entry_db.id,
+                'bgpvpn_id': entry_db.bgpvpn_id,
+                'resource_id': entry_db.resource_id,
+                'operation': entry_db.operation,
+                'args': data['args'],
+                'kwargs': data['kwargs'],
+                'attempts': entry_db.attempts,
+                'next_attempt_at': entry_db.next_attempt_at,
+                'last_error': entry_db.last_error}
+
+    @db_api.CONTEXT_READER
+    def get_journal_entries(self, context, limit=None):
+        """Get the oldest journal entries, in the order they were written"""
+        query = context.session.query(BGPVPNJournalEntry).order_by(
+            BGPVPNJournalEntry.id)
+        if limit:
+            query = query.limit(limit)
+        return [self._make_journal_entry_dict(entry_db)
+                for entry_db in query]
+
+    @db_api.CONTEXT_READER
+    def journal_has_older_entries(self, context, bgpvpn_id, entry_id):
+        return context.session.query(
+            sa.exists().where(BGPVPNJournalEntry.bgpvpn_id == bgpvpn_id,
+                              BGPVPNJournalEntry.id < entry_id)).scalar()
+
+    @db_api.CONTEXT_WRITER
+    def claim_journal_entries(self, context, entry_ids, now, lease_until):
+        """Postpone the next attempt of due entries, for this process only
+
+        Returns False if some of the entries are not due, or were claimed
+        or deleted in the meantime.
+        """
+        count = context.session.query(BGPVPNJournalEntry).filter(
+            BGPVPNJournalEntry.id.in_(entry_ids),
+            BGPVPNJournalEntry.next_attempt_at <= now).update(
+            {'next_attempt_at': lease_until}, synchronize_session=False)
+        return count == len(entry_ids)
+
+    @db_api.CONTEXT_WRITER
+    def claim_journal_entry(self, context, entry_id, next_attempt_at,
+                            lease_until):
+        """Postpone the next attempt of an entry not claimed yet
+
+        next_attempt_at is the time of the next attempt recorded with the
+        entry. Returns False if the entry was claimed, failed or deleted in
+        the meantime.
+        """
+        count = context.session.query(BGPVPNJournalEntry).filter(
+            BGPVPNJournalEntry.id == entry_id,
+            BGPVPNJournalEntry.next_attempt_at == next_attempt_at).update(
+            {'next_attempt_at': lease_until}, synchronize_session=False)
+        return count == 1
+
+    @db_api.CONTEXT_WRITER
+    def journal_entries_failed(self, context, entry_ids, error,
+                               next_attempt_at):
+        context.session.query(BGPVPNJournalEntry).filter(
+            BGPVPNJournalEntry.id.in_(entry_ids)).update(
+            {'attempts': BGPVPNJournalEntry.attempts + 1,
+             'last_error': error[:255],
+             'next_attempt_at': next_attempt_at},
+            synchronize_session=False)
+
+    @db_api.CONTEXT_WRITER
+    def delete_journal_entries(self, context, entry_ids):
+        context.session.query(BGPVPNJournalEntry).filter(
+            BGPVPNJournalEntry.id.in_(entry_ids)).delete(
+            synchronize_session=False)
@@ -0,0 +1,62 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+from alembic import op
+import sqlalchemy as sa
+
+"""Populate bgpvpn_route_targets from the bgpvpns RT columns
+
+Revision ID: e5d1c8a04b6f
+Revises: 9d7f1ae5fa56
+Create Date: 2026-10-18 09:14:02.861730
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e5d1c8a04b6f'
+down_revision = '9d7f1ae5fa56'
+depends_on = ('b3f2a7c91d4e',)
+
+
+RT_KINDS = ('route_targets', 'import_targets', 'export_targets')
+
+bgpvpns = sa.Table(
+    'bgpvpns', sa.MetaData(),
+    sa.Column('id', sa.String(length=36), nullable=False),
+    *[sa.Column(kind, sa.String(length=255)) for kind in RT_KINDS])
+
+bgpvpn_route_targets = sa.Table(
+    'bgpvpn_route_targets', sa.MetaData(),
+    sa.Column('bgpvpn_id', sa.String(length=36), nullable=False),
+    sa.Column('kind', sa.String(length=255), nullable=False),
+    sa.Column('value', sa.String(length=64), nullable=False))
+
+
+def upgrade():
+    connection = op.get_bind()
+    # the table was filled in by the expand phase, but the servers not
+    # upgraded yet kept changing only the comma-separated columns, which
+    # remain the reference: rebuild the whole table from them
+    connection.execute(bgpvpn_route_targets.delete())
+    rows = []
+    for bgpvpn in connection.execute(sa.select(bgpvpns)):
+        for kind in RT_KINDS:
+            values = getattr(bgpvpn, kind)
+            for value in set(values.split(',') if values else []):
+                rows.append({'bgpvpn_id': bgpvpn.id,
+                             'kind': kind,
+                             'value': value})
+    if rows:
+        connection.execute(bgpvpn_route_targets.insert(), rows)
@@ -0,0 +1,38 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+from alembic import op
+
+"""add indexes to the resource ids of associations
+
+Revision ID: 6c4e9d2b7f81
+Revises: b3f2a7c91d4e
+Create Date: 2026-10-18 11:02:47.519304
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6c4e9d2b7f81'
+down_revision = 'b3f2a7c91d4e'
+
+
+def upgrade():
+    for table, column in [
+        ('bgpvpn_network_associations', 'network_id'),
+        ('bgpvpn_router_associations', 'router_id'),
+        ('bgpvpn_port_associations', 'port_id'),
+    ]:
+        op.create_index(op.f('ix_%s_%s' % (table, column)),
+                        table, [column], unique=False)
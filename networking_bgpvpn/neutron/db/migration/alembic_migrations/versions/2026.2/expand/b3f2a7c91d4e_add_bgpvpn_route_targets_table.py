@@ -0,0 +1,68 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+from alembic import op
+import sqlalchemy as sa
+
+"""Add bgpvpn_route_targets table
+
+Revision ID: b3f2a7c91d4e
+Revises: 7a9482036ecd
+Create Date: 2026-10-18 09:12:31.284519
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3f2a7c91d4e'
+down_revision = '7a9482036ecd'
+
+
+RT_KINDS = ('route_targets', 'import_targets', 'export_targets')
+
+bgpvpns = sa.Table(
+    'bgpvpns', sa.MetaData(),
+    sa.Column('id', sa.String(length=36), nullable=False),
+    *[sa.Column(kind, sa.String(length=255)) for kind in RT_KINDS])
+
+
+def upgrade():
+    route_targets = op.create_table(
+        'bgpvpn_route_targets',
+        sa.Column('bgpvpn_id', sa.String(length=36), nullable=False),
+        sa.Column('kind', sa.Enum('route_targets', 'import_targets',
+                                  'export_targets',
+                                  name='bgpvpn_route_target_kinds'),
+                  nullable=False),
+        sa.Column('value', sa.String(length=64), nullable=False),
+        sa.ForeignKeyConstraint(['bgpvpn_id'], ['bgpvpns.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('bgpvpn_id', 'kind', 'value')
+    )
+    op.create_index(op.f('ix_bgpvpn_route_targets_value'),
+                    'bgpvpn_route_targets', ['value'], unique=False)
+
+    # the table is filled in for the existing BGPVPNs right away, so that
+    # the route target filters of the servers upgraded before the contract
+    # phase find them
+    rows = []
+    for bgpvpn in op.get_bind().execute(sa.select(bgpvpns)):
+        for kind in RT_KINDS:
+            values = getattr(bgpvpn, kind)
+            for value in set(values.split(',') if values else []):
+                rows.append({'bgpvpn_id': bgpvpn.id,
+                             'kind': kind,
+                             'value': value})
+    if rows:
+        op.bulk_insert(route_targets, rows)
@@ -0,0 +1,49 @@
+# Copyright 2026 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+"""Add bgpvpn_journal table
+
+Revision ID: d7a2e5f13c68
+Revises: 6c4e9d2b7f81
+Create Date: 2026-10-18 16:40:12.603857
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2e5f13c68'
+down_revision = '6c4e9d2b7f81'
+
+
+def upgrade():
+    op.create_table(
+        'bgpvpn_journal',
+        sa.Column('id', sa.Integer(), nullable=False, autoincrement=True),
+        sa.Column('bgpvpn_id', sa.String(length=36), nullable=False),
+        sa.Column('resource_id', sa.String(length=36), nullable=False),
+        sa.Column('operation', sa.String(length=64), nullable=False),
+        sa.Column('data', sa.Text().with_variant(mysql.MEDIUMTEXT(), 'mysql'),
+                  nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.String(length=255), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_bgpvpn_journal_bgpvpn_id'),
+                    'bgpvpn_journal', ['bgpvpn_id'], unique=False)
@@ -13,6 +13,14 @@
 from neutron.conf.services import provider_configuration
 from oslo_config import cfg
 
+from networking_bgpvpn.neutron.services.common import config
+
+
+def list_bgpvpn_opts():
+    return [
+        ('bgpvpn', config.bgpvpn_opts),
+    ]
+
 
 def list_service_provider():
     return [
@@ -0,0 +1,85 @@
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may
+#  not use this file except in compliance with the License. You may obtain
+#  a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#  License for the specific language governing permissions and limitations
+#  under the License.
+
+from oslo_config import cfg
+
+from networking_bgpvpn._i18n import _
+
+
+bgpvpn_opts = [
+    cfg.BoolOpt('async_postcommit', default=False,
+                help=_("Run the postcommit hooks of the service drivers "
+                       "persisting BGPVPNs in the Neutron database in a "
+                       "pool of workers, rather than before answering API "
+                       "requests. The hooks relating to a same BGPVPN are "
+                       "run in order.")),
+    cfg.IntOpt('postcommit_workers', default=4, min=1,
+               help=_("Number of workers running the postcommit hooks, "
+                      "when async_postcommit is enabled.")),
+    cfg.IntOpt('postcommit_max_pending', default=1000, min=0,
+               help=_("Maximum number of postcommit hooks waiting to be "
+                      "run, when async_postcommit is enabled; API requests "
+                      "wait for room in the queue past this number. 0 "
+                      "means no limit.")),
+    cfg.IntOpt('postcommit_drain_timeout', default=30, min=0,
+               help=_("Number of seconds to wait, on shutdown, for the "
+                      "pending postcommit hooks to be run, when "
+                      "async_postcommit is enabled.")),
+    cfg.BoolOpt('postcommit_journal', default=False,
+                help=_("Record the postcommit hooks of the service drivers "
+                       "persisting BGPVPNs in the Neutron database in a "
+                       "journal, in the transaction of the change they "
+                       "relate to, so that the hooks which fail are run "
+                       "again by a journal worker.")),
+    cfg.IntOpt('journal_retry_interval', default=10, min=1,
+               help=_("Number of seconds between two runs of the journal "
+                      "worker, and before a failed postcommit hook is run "
+                      "again for the first time; the delay doubles after "
+                      "each failure.")),
+    cfg.IntOpt('journal_max_retry_interval', default=600, min=1,
+               help=_("Maximum number of seconds before a failed "
+                      "postcommit hook is run again.")),
+    cfg.IntOpt('journal_batch_size', default=100, min=1,
+               help=_("Maximum number of journal entries processed by a "
+                      "run of the journal worker.")),
+    cfg.FloatOpt('push_coalesce_window', default=0.0, min=0.0,
+                 help=_("Number of seconds during which the bagpipe_v2 "
+                        "driver collects the associations to push to the "
+                        "agents, before pushing them together; an "
+                        "association pushed several times in a window is "
+                        "pushed once, with its last state. 0 means "
+                        "associations are pushed right away.")),
+    cfg.IntOpt('push_chunk_size', default=0, min=0,
+               help=_("Maximum number of associations of a BGPVPN that "
+                      "the bagpipe_v2 driver loads and pushes to the agents "
+                      "at once, when the BGPVPN is updated or deleted. 0 "
+                      "means all the associations of the BGPVPN are pushed "
+                      "at once.")),
+    cfg.FloatOpt('port_rpc_batch_window', default=0.0, min=0.0,
+                 help=_("Number of seconds during which the bagpipe driver "
+                        "collects the port attach and detach notifications "
+                        "of each compute host, before sending them together, "
+                        "as a single RPC to the agents advertising support "
+                        "for it and one by one to the others. 0 means "
+                        "notifications are sent right away.")),
+    cfg.BoolOpt('host_scoped_push', default=False,
+                help=_("Have the bagpipe_v2 driver push each association "
+                       "only to the compute hosts on which ports of its "
+                       "networks are bound, rather than to all the agents. "
+                       "Associations are still pushed to all the agents if "
+                       "the agents of any of these hosts do not advertise "
+                       "that they consume per-host pushes.")),
+]
+
+
+def register_bgpvpn_opts(conf=cfg.CONF):
+    conf.register_opts(bgpvpn_opts, group='bgpvpn')
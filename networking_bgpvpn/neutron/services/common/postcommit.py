@@ -0,0 +1,187 @@
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may
+#  not use this file except in compliance with the License. You may obtain
+#  a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#  License for the specific language governing permissions and limitations
+#  under the License.
+
+import collections
+import threading
+import time
+
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class _Task():
+
+    def __init__(self, hook, args, kwargs, coalesce_key):
+        self.hook = hook
+        self.args = args
+        self.kwargs = kwargs
+        self.coalesce_key = coalesce_key
+        self.submitted_at = time.monotonic()
+
+    def run(self):
+        self.hook(*self.args, **self.kwargs)
+
+
+class PostcommitExecutor():
+    """Run postcommit hooks in a pool of worker threads
+
+    Hooks are submitted with a key, typically a BGPVPN id: the hooks
+    submitted with a same key are run one at a time, in the order they were
+    submitted, while hooks with different keys are run concurrently.
+
+    A hook submitted with a coalesce_key replaces the last hook pending for
+    the same key if it has the same coalesce_key, the arguments of the two
+    hooks being combined with the merge callable if one is given.
+    """
+
+    def __init__(self, workers, max_pending=0, name='bgpvpn-postcommit'):
+        self.max_pending = max_pending
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failures = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self._pending = {}
+        self._pending_count = 0
+        self._ready = collections.deque()
+        # keys in _ready, each key being queued at most once
+        self._ready_keys = set()
+        self._running = set()
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._work,
+                                          name='%s-%d' % (name, i),
+                                          daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key, hook, *args, coalesce_key=None, merge=None,
+               **kwargs):
+        with self._cond:
+            # wait for room in the queue, unless the hook replaces a
+            # pending one
+            while (self.max_pending and
+                   self._pending_count >= self.max_pending and
+                   not self._stopped and
+                   not self._coalescable(key, coalesce_key)):
+                self._cond.wait()
+            run_now = self._stopped
+            if not run_now:
+                tasks = self._pending.setdefault(key, collections.deque())
+                if self._coalescable(key, coalesce_key):
+                    previous = tasks.pop()
+                    self._pending_count -= 1
+                    self.coalesced += 1
+                    if merge:
+                        args, kwargs = merge(previous.args, previous.kwargs,
+                                             args, kwargs)
+                tasks.append(_Task(hook, args, kwargs, coalesce_key))
+                self._pending_count += 1
+                self.submitted += 1
+                if key not in self._running:
+                    self._make_ready(key)
+        if run_now:
+            # once stopped, hooks are run by the caller
+            hook(*args, **kwargs)
+
+    def _make_ready(self, key):
+        # called with _cond held
+        if key not in self._ready_keys:
+            self._ready.append(key)
+            self._ready_keys.add(key)
+            self._cond.notify_all()
+
+    def _coalescable(self, key, coalesce_key):
+        tasks = self._pending.get(key)
+        return (coalesce_key is not None and bool(tasks) and
+                tasks[-1].coalesce_key == coalesce_key)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopped:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                self._ready_keys.discard(key)
+                tasks = self._pending.get(key)
+                if not tasks:
+                    continue
+                task = tasks.popleft()
+                self._pending_count -= 1
+                self._running.add(key)
+                self._cond.notify_all()
+            try:
+                task.run()
+                failed = False
+            except Exception:
+                LOG.exception("Error running postcommit hook %s for %s",
+                              getattr(task.hook, '__name__', task.hook), key)
+                failed = True
+            with self._cond:
+                latency = time.monotonic() - task.submitted_at
+                self.completed += 1
+                self.failures += failed
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+                self._running.discard(key)
+                if self._pending.get(key):
+                    self._make_ready(key)
+                else:
+                    self._pending.pop(key, None)
+                self._cond.notify_all()
+
+    def _idle(self):
+        return not self._pending_count and not self._running
+
+    def drain(self, timeout=None):
+        """Wait for all the pending hooks to be run
+
+        Returns False if some hooks are still pending after timeout seconds.
+        """
+        with self._cond:
+            return self._cond.wait_for(self._idle, timeout)
+
+    def stop(self, timeout=None):
+        """Drain the pending hooks, then stop the workers
+
+        The hooks submitted afterwards are run by the caller.
+        """
+        drained = self.drain(timeout)
+        if not drained:
+            LOG.warning("Stopping with %d postcommit hooks still pending",
+                        self._pending_count)
+        with self._cond:
+            self._stopped = True
+            self._ready.clear()
+            self._ready_keys.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        return drained
+
+    def stats(self):
+        with self._cond:
+            return {'pending': self._pending_count,
+                    'running': len(self._running),
+                    'submitted': self.submitted,
+                    'coalesced': self.coalesced,
+                    'completed': self.completed,
+                    'failures': self.failures,
+                    'latency_avg': (self.latency_total / self.completed
+                                    if self.completed else 0.0),
+                    'latency_max': self.latency_max}
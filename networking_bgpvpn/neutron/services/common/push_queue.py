@@ -0,0 +1,122 @@
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may
+#  not use this file except in compliance with the License. You may obtain
+#  a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#  License for the specific language governing permissions and limitations
+#  under the License.
+
+import threading
+
+from neutron.api.rpc.callbacks import events as rpc_events
+from neutron_lib import context as n_context
+from oslo_log import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# order in which the objects of a window are pushed
+PUSH_ORDER = (rpc_events.CREATED, rpc_events.UPDATED, rpc_events.DELETED)
+
+
+def net_effect(previous_event, event):
+    """Event to push for an object pushed twice in a window
+
+    Returns None if the two events cancel each other out.
+    """
+    if previous_event == rpc_events.CREATED:
+        # the object was not pushed yet, it is either pushed with its last
+        # state or not at all
+        return None if event == rpc_events.DELETED else rpc_events.CREATED
+    if event == rpc_events.DELETED:
+        return rpc_events.DELETED
+    return rpc_events.UPDATED
+
+
+class CoalescingPushQueue():
+    """Collect the objects pushed during a window of time
+
+    The objects pushed during a window are pushed together when it ends, an
+    object pushed several times being pushed once, with its last state and
+    the net effect of its events. An object is identified by its type and
+    id.
+
+    push is the callable used to push the objects, with the same signature
+    as neutron ResourcesPushRpcApi.push.
+    """
+
+    def __init__(self, push, window):
+        self._push = push
+        self.window = window
+        self.events = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.pushes = 0
+        self.pushed = 0
+        self.failures = 0
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def push(self, context, objects, event_type):
+        with self._lock:
+            for obj in objects:
+                self.events += 1
+                key = (obj.obj_name(), obj.id)
+                previous = self._pending.pop(key, None)
+                event = event_type
+                if previous is not None:
+                    self.coalesced += 1
+                    event = net_effect(previous[0], event_type)
+                    if event is None:
+                        self.cancelled += 1
+                        continue
+                self._pending[key] = (event, obj)
+            if self._pending and self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Push the objects collected so far"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        objects = {}
+        for event, obj in pending.values():
+            objects.setdefault(event, []).append(obj)
+        # the objects are already built, the context is only used to
+        # send the notifications
+        context = n_context.get_admin_context()
+        for event in PUSH_ORDER:
+            if event not in objects:
+                continue
+            try:
+                self._push(context, objects[event], event)
+                failed = False
+            except Exception:
+                LOG.exception("Error pushing %d objects (%s)",
+                              len(objects[event]), event)
+                failed = True
+            with self._lock:
+                self.pushes += 1
+                self.pushed += len(objects[event])
+                self.failures += failed
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending),
+                    'events': self.events,
+                    'coalesced': self.coalesced,
+                    'cancelled': self.cancelled,
+                    'pushes': self.pushes,
+                    'pushed': self.pushed,
+                    'failures': self.failures}
@@ -13,11 +13,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import threading
 
 from neutron_lib.api.definitions import bgpvpn as bgpvpn_def
 from neutron_lib.api.definitions import bgpvpn_routes_control as bgpvpn_rc_def
 from neutron_lib.api.definitions import bgpvpn_vni as bgpvpn_vni_def
 from neutron_lib.plugins import directory
+from oslo_utils import timeutils
 
 
 def rtrd_list2str(list):
@@ -135,3 +138,83 @@ def get_bgpvpn_differences(current_dict, old_dict):
     }
 
     return (added, removed, changed)
+
+
+# BGPVPN attributes holding lists in which order and duplicates don't matter
+BGPVPN_SET_ATTRIBUTES = ('route_targets', 'import_targets', 'export_targets',
+                         'route_distinguishers')
+
+
+def get_bgpvpn_changes(current_dict, old_dict, attributes=None):
+    """Get the attributes whose value differs between 2 BGP VPN
+
+    Contrary to get_bgpvpn_differences, route targets and route
+    distinguishers are compared as sets, and an attribute missing from one
+    of the dictionaries is considered None. If attributes is given, only
+    those attributes are compared.
+    """
+    keys = set(current_dict) | set(old_dict)
+    if attributes is not None:
+        keys &= set(attributes)
+    changed = set()
+    for key in keys:
+        current, old = current_dict.get(key), old_dict.get(key)
+        if key in BGPVPN_SET_ATTRIBUTES:
+            current, old = set(current or ()), set(old or ())
+        if current != old:
+            changed.add(key)
+    return changed
+
+
+class LRUCache():
+    """Cache of a bounded size, evicting least recently used entries first
+
+    An entry can be stored along with a revision, in which case it is only
+    returned if the same revision is requested: looking up an entry at a
+    different revision is a miss. If ttl is set, looking up an entry stored
+    more than ttl seconds ago is a miss as well.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _now(self):
+        return timeutils.utcnow_ts(microsecond=True) if self.ttl else None
+
+    def get(self, key, revision=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None or entry[0] != revision or
+                    (self.ttl and self._now() - entry[2] >= self.ttl)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, revision=None):
+        with self._lock:
+            self._entries[key] = (revision, value, self._now())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries),
+                    'max_size': self.max_size,
+                    'hits': self.hits,
+                    'misses': self.misses}
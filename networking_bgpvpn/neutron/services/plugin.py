@@ -23,8 +23,8 @@ from neutron_lib.api.definitions import bgpvpn as bgpvpn_def
 from neutron_lib.callbacks import events
 from neutron_lib.callbacks import registry
 from neutron_lib.callbacks import resources
-from neutron_lib import constants as const
 from neutron_lib import exceptions as n_exc
+from neutron_lib.exceptions import l3 as l3_exc
 from neutron_lib.plugins import constants as plugin_constants
 from neutron_lib.plugins import directory
 
@@ -71,6 +71,32 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
                         "running multiple drivers in parallel is not yet"
                         "supported")
 
+        self.add_workers(self.driver.get_workers())
+
+    # NOTE: the API checks these (name-mangled) attributes to know if the
+    # plugin does native sorting and pagination, which here depends on the
+    # driver
+    @property
+    def __native_pagination_support(self):
+        return self.driver.native_pagination_support
+
+    @property
+    def __native_sorting_support(self):
+        return self.driver.native_pagination_support
+
+    # NOTE: only the association collections allow bulk creation
+    @property
+    def __native_bulk_support(self):
+        return self.driver.native_bulk_support
+
+    def _pagination_args(self, sorts, limit, marker, page_reverse):
+        if not self.driver.native_pagination_support:
+            return {}
+        return {'sorts': sorts,
+                'limit': limit,
+                'marker': marker,
+                'page_reverse': page_reverse}
+
     @property
     def supported_extension_aliases(self):
         exts = copy.copy(super().supported_extension_aliases)
@@ -83,24 +109,29 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
         context = payload.context
         network_id = payload.metadata.get('network_id')
         router_id = payload.resource_id
-        try:
-            routers_bgpvpns = self.driver.get_bgpvpns(
+        if self.driver.router_interface_check_support:
+            bound = self.driver.router_and_network_bound_to_bgpvpns(
+                context, router_id, network_id)
+        else:
+            try:
+                routers_bgpvpns = self.driver.get_bgpvpns(
+                    context,
+                    filters={
+                        'routers': [router_id],
+                    },
+                )
+            except bgpvpn.BGPVPNRouterAssociationNotSupported:
+                return
+            nets_bgpvpns = self.driver.get_bgpvpns(
                 context,
                 filters={
-                    'routers': [router_id],
+                    'networks': [network_id],
+                    'type': [constants.BGPVPN_L3],
                 },
             )
-        except bgpvpn.BGPVPNRouterAssociationNotSupported:
-            return
-        nets_bgpvpns = self.driver.get_bgpvpns(
-            context,
-            filters={
-                'networks': [network_id],
-                'type': [constants.BGPVPN_L3],
-            },
-        )
-
-        if routers_bgpvpns and nets_bgpvpns:
+            bound = bool(routers_bgpvpns and nets_bgpvpns)
+
+        if bound:
             msg = _('It is not allowed to add an interface to a router if '
                     'both the router and the network are bound to an '
                     'L3 BGPVPN.')
@@ -109,32 +140,28 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
     def _validate_network(self, context, net_id):
         plugin = directory.get_plugin()
         network = plugin.get_network(context, net_id)
-        self._validate_network_has_router_assoc(context, network, plugin)
+        self._validate_network_has_router_assoc(context, network)
         return network
 
-    def _validate_network_has_router_assoc(self, context, network, plugin):
-        filter = {'network_id': [network['id']],
-                  'device_owner': [const.DEVICE_OWNER_ROUTER_INTF]}
-        router_port = plugin.get_ports(context, filters=filter)
-        if router_port:
-            router_id = router_port[0]['device_id']
-            filter = {'project_id': [network['project_id']]}
-            bgpvpns = self.driver.get_bgpvpns(context, filters=filter)
-            bgpvpns = [str(bgpvpn['id']) for bgpvpn in bgpvpns
-                       if router_id in bgpvpn['routers']]
-            if bgpvpns:
-                msg = ('Network %(net_id)s is linked to a router which is '
-                       'already associated to bgpvpn(s) %(bgpvpns)s'
-                       % {'net_id': network['id'],
-                          'bgpvpns': bgpvpns}
-                       )
-                raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
+    def _validate_network_has_router_assoc(self, context, network):
+        self._validate_networks_have_router_assocs(context, [network])
+
+    def _validate_networks_have_router_assocs(self, context, networks):
+        networks_bgpvpns = self.driver.get_networks_router_bgpvpns(
+            context, networks)
+        if networks_bgpvpns:
+            net_id, bgpvpn_ids = min(networks_bgpvpns.items())
+            msg = ('Network %(net_id)s is linked to a router which '
+                   'is already associated to bgpvpn(s) %(bgpvpns)s'
+                   % {'net_id': net_id,
+                      'bgpvpns': sorted(bgpvpn_ids)}
+                   )
+            raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
 
     def _validate_router(self, context, router_id):
         l3_plugin = directory.get_plugin(plugin_constants.L3)
         router = l3_plugin.get_router(context, router_id)
-        plugin = directory.get_plugin()
-        self._validate_router_has_net_assocs(context, router, plugin)
+        self._validate_router_has_net_assocs(context, router)
         return router
 
     def _validate_port(self, context, port_id):
@@ -142,24 +169,31 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
         port = plugin.get_port(context, port_id)
         return port
 
-    def _validate_router_has_net_assocs(self, context, router, plugin):
-        filter = {'device_id': [router['id']],
-                  'device_owner': [const.DEVICE_OWNER_ROUTER_INTF]}
-        router_ports = plugin.get_ports(context, filters=filter)
-        if router_ports:
-            filter = {'project_id': [router['project_id']]}
-            bgpvpns = self.driver.get_bgpvpns(context, filters=filter)
-            for port in router_ports:
-                bgpvpns = [str(bgpvpn['id']) for bgpvpn in bgpvpns
-                           if port['network_id'] in bgpvpn['networks']]
-                if bgpvpns:
-                    msg = ('router %(rtr_id)s has an attached network '
-                           '%(net_id)s which is already associated to '
-                           'bgpvpn(s) %(bgpvpns)s'
-                           % {'rtr_id': router['id'],
-                              'net_id': port['network_id'],
-                              'bgpvpns': bgpvpns})
-                    raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
+    def _validate_router_has_net_assocs(self, context, router):
+        self._validate_routers_have_net_assocs(context, [router])
+
+    def _validate_routers_have_net_assocs(self, context, routers):
+        routers_bgpvpns = self.driver.get_routers_network_bgpvpns(
+            context, routers)
+        if routers_bgpvpns:
+            (rtr_id, net_id), bgpvpn_ids = min(routers_bgpvpns.items())
+            msg = ('router %(rtr_id)s has an attached network '
+                   '%(net_id)s which is already associated to '
+                   'bgpvpn(s) %(bgpvpns)s'
+                   % {'rtr_id': rtr_id,
+                      'net_id': net_id,
+                      'bgpvpns': sorted(bgpvpn_ids)})
+            raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
+
+    @staticmethod
+    def _get_resources_by_id(get_resources, context, ids, not_found):
+        """Get resources by id in one call, raise not_found(id) if missing"""
+        resources = {resource['id']: resource for resource in
+                     get_resources(context, filters={'id': list(set(ids))})}
+        for id in ids:
+            if id not in resources:
+                raise not_found(id)
+        return resources
 
     def get_plugin_type(self):
         return bgpvpn_def.ALIAS
@@ -171,8 +205,11 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
         bgpvpn = bgpvpn['bgpvpn']
         return self.driver.create_bgpvpn(context, bgpvpn)
 
-    def get_bgpvpns(self, context, filters=None, fields=None):
-        return self.driver.get_bgpvpns(context, filters, fields)
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
+        return self.driver.get_bgpvpns(
+            context, filters, fields,
+            **self._pagination_args(sorts, limit, marker, page_reverse))
 
     def get_bgpvpn(self, context, id, fields=None):
         return self.driver.get_bgpvpn(context, id, fields)
@@ -184,13 +221,9 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
     def delete_bgpvpn(self, context, id):
         self.driver.delete_bgpvpn(context, id)
 
-    def create_bgpvpn_network_association(self, context, bgpvpn_id,
-                                          network_association):
-        net_assoc = network_association['network_association']
-        # check net exists
-        net = self._validate_network(context, net_assoc['network_id'])
+    @staticmethod
+    def _validate_net_assoc_project(net_assoc, net, bgpvpn):
         # check every resource belong to the same project
-        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
         if net['project_id'] != bgpvpn['project_id']:
             msg = 'network doesn\'t belong to the bgpvpn owner'
             raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
@@ -198,15 +231,43 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
             msg = 'network association and bgpvpn should belong to\
                 the same project'
             raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
+
+    def create_bgpvpn_network_association(self, context, bgpvpn_id,
+                                          network_association):
+        net_assoc = network_association['network_association']
+        # check net exists
+        net = self._validate_network(context, net_assoc['network_id'])
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        self._validate_net_assoc_project(net_assoc, net, bgpvpn)
         return self.driver.create_net_assoc(context, bgpvpn_id, net_assoc)
 
+    def create_bgpvpn_network_association_bulk(self, context, bgpvpn_id,
+                                               network_associations):
+        net_assocs = [item['network_association'] for item in
+                      network_associations['network_associations']]
+        plugin = directory.get_plugin()
+        nets = self._get_resources_by_id(
+            plugin.get_networks, context,
+            [net_assoc['network_id'] for net_assoc in net_assocs],
+            lambda net_id: n_exc.NetworkNotFound(net_id=net_id))
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        for net_assoc in net_assocs:
+            self._validate_net_assoc_project(
+                net_assoc, nets[net_assoc['network_id']], bgpvpn)
+        self._validate_networks_have_router_assocs(context, nets.values())
+        return self.driver.create_net_assocs(context, bgpvpn_id, net_assocs)
+
     def get_bgpvpn_network_association(self, context, assoc_id, bgpvpn_id,
                                        fields=None):
         return self.driver.get_net_assoc(context, assoc_id, bgpvpn_id, fields)
 
     def get_bgpvpn_network_associations(self, context, bgpvpn_id,
-                                        filters=None, fields=None):
-        return self.driver.get_net_assocs(context, bgpvpn_id, filters, fields)
+                                        filters=None, fields=None,
+                                        sorts=None, limit=None, marker=None,
+                                        page_reverse=False):
+        return self.driver.get_net_assocs(
+            context, bgpvpn_id, filters, fields,
+            **self._pagination_args(sorts, limit, marker, page_reverse))
 
     def update_bgpvpn_network_association(self, context, assoc_id, bgpvpn_id,
                                           network_association):
@@ -216,15 +277,15 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
     def delete_bgpvpn_network_association(self, context, assoc_id, bgpvpn_id):
         self.driver.delete_net_assoc(context, assoc_id, bgpvpn_id)
 
-    def create_bgpvpn_router_association(self, context, bgpvpn_id,
-                                         router_association):
-        router_assoc = router_association['router_association']
-        router = self._validate_router(context, router_assoc['router_id'])
-        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+    @staticmethod
+    def _validate_router_assoc_bgpvpn_type(bgpvpn):
         if not bgpvpn['type'] == constants.BGPVPN_L3:
             msg = ("Router associations require the bgpvpn to be of type %s"
                    % constants.BGPVPN_L3)
             raise n_exc.BadRequest(resource='bgpvpn', msg=msg)
+
+    @staticmethod
+    def _validate_router_assoc_project(router_assoc, router, bgpvpn):
         if not router['project_id'] == bgpvpn['project_id']:
             msg = "router doesn't belong to the bgpvpn owner"
             raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
@@ -232,18 +293,46 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
             msg = "router association and bgpvpn should " \
                   "belong to the same project"
             raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
+
+    def create_bgpvpn_router_association(self, context, bgpvpn_id,
+                                         router_association):
+        router_assoc = router_association['router_association']
+        router = self._validate_router(context, router_assoc['router_id'])
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        self._validate_router_assoc_bgpvpn_type(bgpvpn)
+        self._validate_router_assoc_project(router_assoc, router, bgpvpn)
         return self.driver.create_router_assoc(context, bgpvpn_id,
                                                router_assoc)
 
+    def create_bgpvpn_router_association_bulk(self, context, bgpvpn_id,
+                                              router_associations):
+        router_assocs = [item['router_association'] for item in
+                         router_associations['router_associations']]
+        l3_plugin = directory.get_plugin(plugin_constants.L3)
+        routers = self._get_resources_by_id(
+            l3_plugin.get_routers, context,
+            [router_assoc['router_id'] for router_assoc in router_assocs],
+            lambda router_id: l3_exc.RouterNotFound(router_id=router_id))
+        self._validate_routers_have_net_assocs(context, routers.values())
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        self._validate_router_assoc_bgpvpn_type(bgpvpn)
+        for router_assoc in router_assocs:
+            self._validate_router_assoc_project(
+                router_assoc, routers[router_assoc['router_id']], bgpvpn)
+        return self.driver.create_router_assocs(context, bgpvpn_id,
+                                                router_assocs)
+
     def get_bgpvpn_router_association(self, context, assoc_id, bgpvpn_id,
                                       fields=None):
         return self.driver.get_router_assoc(context, assoc_id, bgpvpn_id,
                                             fields)
 
     def get_bgpvpn_router_associations(self, context, bgpvpn_id, filters=None,
-                                       fields=None):
-        return self.driver.get_router_assocs(context, bgpvpn_id, filters,
-                                             fields)
+                                       fields=None, sorts=None, limit=None,
+                                       marker=None, page_reverse=False):
+        return self.driver.get_router_assocs(
+            context, bgpvpn_id, filters, fields,
+            **self._pagination_args(sorts, limit, marker, page_reverse))
 
     def update_bgpvpn_router_association(self, context, assoc_id, bgpvpn_id,
                                          router_association):
@@ -257,37 +346,50 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
     def _validate_port_association_routes_bgpvpn(self, context,
                                                  port_association,
                                                  bgpvpn_id, assoc_id=None):
-        for route in [r for r in port_association.get('routes', []) if
-                      r['type'] == bgpvpn_rc.api_def.BGPVPN_TYPE]:
-            try:
-                route_bgpvpn = self.get_bgpvpn(context, route['bgpvpn_id'])
-            except bgpvpn.BGPVPNNotFound as not_found_exc:
+        routes = [r for r in port_association.get('routes', []) if
+                  r['type'] == bgpvpn_rc.api_def.BGPVPN_TYPE]
+        if not routes:
+            return
+
+        # fetch the type and project of the BGPVPN of the association and
+        # of all the BGPVPNs of the routes at once
+        bgpvpn_ids = {route['bgpvpn_id'] for route in routes} | {bgpvpn_id}
+        bgpvpns = {
+            b['id']: b for b in self.driver.get_bgpvpns(
+                context,
+                filters={'id': list(bgpvpn_ids)},
+                fields=['id', 'type', 'project_id'])
+        }
+        if bgpvpn_id not in bgpvpns:
+            raise bgpvpn.BGPVPNNotFound(id=bgpvpn_id)
+        assoc_bgpvpn = bgpvpns[bgpvpn_id]
+
+        assoc_project_id = port_association.get('project_id')
+        if assoc_project_id is None:
+            # update, rather than create, we need to retrieve the project
+            assoc = self.get_bgpvpn_port_association(context,
+                                                     assoc_id, bgpvpn_id,
+                                                     fields=['project_id'])
+            assoc_project_id = assoc.get('project_id')
+
+        for route in routes:
+            route_bgpvpn = bgpvpns.get(route['bgpvpn_id'])
+            if route_bgpvpn is None:
                 raise bgpvpn_rc.BGPVPNPortAssocRouteNoSuchBGPVPN(
-                    bgpvpn_id=route['bgpvpn_id']) from not_found_exc
+                    bgpvpn_id=route['bgpvpn_id'])
 
-            assoc_bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
             if route_bgpvpn['type'] != assoc_bgpvpn['type']:
                 raise bgpvpn_rc.BGPVPNPortAssocRouteBGPVPNTypeDiffer(
                     route_bgpvpn_type=route_bgpvpn['type'],
                     bgpvpn_type=assoc_bgpvpn['type']
                 )
 
-            assoc_project_id = port_association.get('project_id')
-            if assoc_project_id is None:
-                # update, rather than create, we need to retrieve the project
-                assoc = self.get_bgpvpn_port_association(context,
-                                                         assoc_id, bgpvpn_id)
-                assoc_project_id = assoc.get('project_id')
-
             if route_bgpvpn['project_id'] != assoc_project_id:
                 raise bgpvpn_rc.BGPVPNPortAssocRouteWrongBGPVPNProject(
                     bgpvpn_id=route['bgpvpn_id'])
 
-    def create_bgpvpn_port_association(self, context, bgpvpn_id,
-                                       port_association):
-        port_association = port_association['port_association']
-        port = self._validate_port(context, port_association['port_id'])
-        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+    @staticmethod
+    def _validate_port_assoc_project(port_association, port, bgpvpn):
         if not port['project_id'] == bgpvpn['project_id']:
             msg = "port doesn't belong to the bgpvpn owner"
             raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
@@ -295,19 +397,49 @@ class BGPVPNPlugin(bgpvpn.BGPVPNPluginBase,
             msg = "port association and bgpvpn should " \
                   "belong to the same project"
             raise n_exc.NotAuthorized(resource='bgpvpn', msg=msg)
+
+    def create_bgpvpn_port_association(self, context, bgpvpn_id,
+                                       port_association):
+        port_association = port_association['port_association']
+        port = self._validate_port(context, port_association['port_id'])
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        self._validate_port_assoc_project(port_association, port, bgpvpn)
         self._validate_port_association_routes_bgpvpn(context,
                                                       port_association,
                                                       bgpvpn_id)
         return self.driver.create_port_assoc(context,
                                              bgpvpn_id, port_association)
 
+    def create_bgpvpn_port_association_bulk(self, context, bgpvpn_id,
+                                            port_associations):
+        port_assocs = [item['port_association'] for item in
+                       port_associations['port_associations']]
+        plugin = directory.get_plugin()
+        ports = self._get_resources_by_id(
+            plugin.get_ports, context,
+            [port_assoc['port_id'] for port_assoc in port_assocs],
+            lambda port_id: n_exc.PortNotFound(port_id=port_id))
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        for port_assoc in port_assocs:
+            self._validate_port_assoc_project(
+                port_assoc, ports[port_assoc['port_id']], bgpvpn)
+            self._validate_port_association_routes_bgpvpn(context,
+                                                          port_assoc,
+                                                          bgpvpn_id)
+        return self.driver.create_port_assocs(context, bgpvpn_id,
+                                              port_assocs)
+
     def get_bgpvpn_port_association(self, context, assoc_id, bgpvpn_id,
                                     fields=None):
         return self.driver.get_port_assoc(context, assoc_id, bgpvpn_id, fields)
 
     def get_bgpvpn_port_associations(self, context, bgpvpn_id,
-                                     filters=None, fields=None):
-        return self.driver.get_port_assocs(context, bgpvpn_id, filters, fields)
+                                     filters=None, fields=None, sorts=None,
+                                     limit=None, marker=None,
+                                     page_reverse=False):
+        return self.driver.get_port_assocs(
+            context, bgpvpn_id, filters, fields,
+            **self._pagination_args(sorts, limit, marker, page_reverse))
 
     def update_bgpvpn_port_association(self, context, assoc_id, bgpvpn_id,
                                        port_association):
@@ -13,6 +13,11 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import atexit
+import os
+import threading
+
+import sqlalchemy as sa
 from sqlalchemy import orm
 from sqlalchemy import sql
 
@@ -25,44 +30,158 @@ from neutron_lib.callbacks import registry
 from neutron_lib.callbacks import resources
 from neutron_lib import constants as const
 from neutron_lib.db import api as db_api
+from neutron_lib.db import standard_attr
 
+from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
 
-from networking_bagpipe.agent.bgpvpn import rpc_client
-
 from networking_bgpvpn.neutron.db import bgpvpn_db
 from networking_bgpvpn.neutron.services.common import utils
 from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
     import bagpipe_v2 as v2
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import rpc_batch
 
 
 LOG = logging.getLogger(__name__)
 
+# BGPVPN attributes sent to the agents by update_bgpvpn and delete_bgpvpn
+# RPCs, see _format_bgpvpn
+BGPVPN_RPC_ATTRIBUTES = ('type', 'route_targets', 'import_targets',
+                         'export_targets')
+
+NETWORK_RT_CACHE_SIZE = 4096
+
+GATEWAY_MAC_CACHE_SIZE = 4096
+# Number of seconds after which a cached gateway MAC is looked up again, in
+# case a router interface change made by another process was missed
+GATEWAY_MAC_CACHE_TTL = 60
+
+
+def _network_info_for_port_query(context, port_id, network_id):
+    # the gateway MAC, that of the router interface on the network, is
+    # looked up by a subquery rather than by a query of its own; as with
+    # get_gateway_macs, the lowest MAC is kept if there are several
+    gateway_port = orm.aliased(models_v2.Port)
+    gateway_mac = (
+        sa.select(gateway_port.mac_address).
+        where(gateway_port.network_id == network_id,
+              gateway_port.device_owner == const.DEVICE_OWNER_ROUTER_INTF).
+        order_by(gateway_port.mac_address).
+        limit(1).
+        scalar_subquery()
+    )
+    return (context.session.
+            query(models_v2.Port.mac_address,
+                  models_v2.IPAllocation.ip_address,
+                  models_v2.Subnet.cidr,
+                  models_v2.Subnet.gateway_ip,
+                  gateway_mac.label('gateway_mac')).
+            join(models_v2.IPAllocation,
+                 models_v2.IPAllocation.port_id ==
+                 models_v2.Port.id).
+            join(models_v2.Subnet,
+                 models_v2.IPAllocation.subnet_id ==
+                 models_v2.Subnet.id).
+            filter(models_v2.Subnet.ip_version == 4).
+            filter(models_v2.Port.id == port_id))
+
+
+def _make_network_info(row):
+    return {'mac_address': row.mac_address,
+            'ip_address': row.ip_address + row.cidr[row.cidr.index('/'):],
+            'gateway_ip': row.gateway_ip,
+            'gateway_mac': row.gateway_mac}
+
 
 @log_helpers.log_method_call
 @db_api.CONTEXT_READER
 def get_network_info_for_port(context, port_id, network_id):
     """Get MAC, IP and Gateway IP addresses informations for a specific port"""
     try:
-        net_info = (context.session.
-                    query(models_v2.Port.mac_address,
-                          models_v2.IPAllocation.ip_address,
-                          models_v2.Subnet.cidr,
-                          models_v2.Subnet.gateway_ip).
-                    join(models_v2.IPAllocation,
-                         models_v2.IPAllocation.port_id ==
-                         models_v2.Port.id).
-                    join(models_v2.Subnet,
-                         models_v2.IPAllocation.subnet_id ==
-                         models_v2.Subnet.id).
-                    filter(models_v2.Subnet.ip_version == 4).
-                    filter(models_v2.Port.id == port_id).one())
-
-        (mac_address, ip_address, cidr, gateway_ip) = net_info
+        row = _network_info_for_port_query(context, port_id,
+                                           network_id).one()
     except orm.exc.NoResultFound:
         return
 
+    return _make_network_info(row)
+
+
+@log_helpers.log_method_call
+@db_api.CONTEXT_READER
+def get_bgpvpn_network_info_for_port(context, port_id, network_id):
+    """Get the network informations of a port, and the BGPVPNs of its network
+
+    Same as get_network_info_for_port, along with the type, route targets
+    and revision number of the BGPVPNs associated to the network of the
+    port, or if there are none, of those associated to a router plugged on
+    this network, all fetched by a single query.
+
+    Returns None if the port has no IPv4 address, (network info, BGPVPNs)
+    otherwise.
+    """
+    net_bgpvpn_ids = (
+        sa.select(bgpvpn_db.BGPVPNNetAssociation.bgpvpn_id,
+                  sa.literal(True).label('network_bound')).
+        where(bgpvpn_db.BGPVPNNetAssociation.network_id == network_id)
+    )
+    router_port = orm.aliased(models_v2.Port)
+    router_bgpvpn_ids = (
+        sa.select(bgpvpn_db.BGPVPNRouterAssociation.bgpvpn_id,
+                  sa.literal(False).label('network_bound')).
+        join(l3.RouterPort,
+             l3.RouterPort.router_id ==
+             bgpvpn_db.BGPVPNRouterAssociation.router_id).
+        join(router_port, router_port.id == l3.RouterPort.port_id).
+        where(router_port.network_id == network_id)
+    )
+    # the BGPVPNs are joined on their primary key, to the ids of the
+    # BGPVPNs of both kinds of associations
+    bgpvpn_ids = sa.union(net_bgpvpn_ids, router_bgpvpn_ids).subquery()
+    bgpvpn = bgpvpn_db.BGPVPN
+    rows = (_network_info_for_port_query(context, port_id, network_id).
+            add_columns(bgpvpn.id.label('bgpvpn_id'),
+                        bgpvpn.type,
+                        bgpvpn.route_targets,
+                        bgpvpn.import_targets,
+                        bgpvpn.export_targets,
+                        standard_attr.StandardAttribute.revision_number,
+                        bgpvpn_ids.c.network_bound).
+            outerjoin(bgpvpn_ids, sa.true()).
+            outerjoin(bgpvpn, bgpvpn.id == bgpvpn_ids.c.bgpvpn_id).
+            outerjoin(standard_attr.StandardAttribute,
+                      standard_attr.StandardAttribute.id ==
+                      bgpvpn.standard_attr_id).
+            all())
+    if not rows:
+        return
+
+    bgpvpns = {}
+    for row in rows:
+        if row.bgpvpn_id is None:
+            continue
+        # a BGPVPN associated both to the network and to a router has a
+        # row for each
+        network_bound = bool(row.network_bound) or bgpvpns.get(
+            row.bgpvpn_id, (False,))[0]
+        bgpvpns[row.bgpvpn_id] = (network_bound, {
+            'id': row.bgpvpn_id,
+            'type': row.type,
+            'route_targets': utils.rtrd_str2list(row.route_targets),
+            'import_targets': utils.rtrd_str2list(row.import_targets),
+            'export_targets': utils.rtrd_str2list(row.export_targets),
+            'revision_number': row.revision_number,
+        })
+    # as for _bgpvpns_for_network, the BGPVPNs of router associations are
+    # only used if there are no BGPVPNs associated to the network itself
+    network_bound = [bgpvpn for bound, bgpvpn in bgpvpns.values() if bound]
+    return (_make_network_info(rows[0]),
+            network_bound or [bgpvpn for _bound, bgpvpn in bgpvpns.values()])
+
+
+@db_api.CONTEXT_READER
+def get_gateway_mac(context, network_id):
     gateway_mac = (
         context.session.
         query(models_v2.Port.mac_address).
@@ -74,36 +193,48 @@ def get_network_info_for_port(context, port_id, network_id):
         one_or_none()
     )
 
-    return {'mac_address': mac_address,
-            'ip_address': ip_address + cidr[cidr.index('/'):],
-            'gateway_ip': gateway_ip,
-            'gateway_mac': gateway_mac[0] if gateway_mac else None}
+    return gateway_mac[0] if gateway_mac else None
 
 
 @db_api.CONTEXT_READER
-def get_gateway_mac(context, network_id):
-    gateway_mac = (
+def get_gateway_macs(context, network_ids):
+    """Get the gateway MACs of the given networks, by network id
+
+    Networks without a router interface are left out.
+    """
+    if not network_ids:
+        return {}
+    # for a network with several router interfaces, the lowest MAC is kept
+    return dict(
         context.session.
-        query(models_v2.Port.mac_address).
+        query(models_v2.Port.network_id, models_v2.Port.mac_address).
         filter(
-            models_v2.Port.network_id == network_id,
+            models_v2.Port.network_id.in_(network_ids),
             (models_v2.Port.device_owner ==
              const.DEVICE_OWNER_ROUTER_INTF)
         ).
-        one_or_none()
+        order_by(models_v2.Port.network_id, models_v2.Port.mac_address.desc())
     )
 
-    return gateway_mac[0] if gateway_mac else None
+
+@db_api.CONTEXT_READER
+def network_has_active_ports(context, network_id):
+    """Tell if a network has admin up ports, without loading them"""
+    return context.session.query(sa.exists().where(
+        models_v2.Port.network_id == network_id,
+        models_v2.Port.admin_state_up == sql.true())).scalar()
 
 
 @db_api.CONTEXT_READER
-def get_network_ports(context, network_id):
-    # NOTE(tmorin): currents callers don't look at detailed results
-    # but only test if at least one result exist => can be optimized
-    # by returning a count, rather than all port information
-    return (context.session.query(models_v2.Port).
-            filter(models_v2.Port.network_id == network_id,
-                   models_v2.Port.admin_state_up == sql.true()).all())
+def get_networks_with_active_ports(context, network_ids):
+    """Get which of the given networks have admin up ports"""
+    if not network_ids:
+        return set()
+    return {net_id for (net_id,) in
+            context.session.query(models_v2.Port.network_id).
+            filter(models_v2.Port.network_id.in_(network_ids),
+                   models_v2.Port.admin_state_up == sql.true()).
+            distinct()}
 
 
 @db_api.CONTEXT_READER
@@ -153,11 +284,21 @@ def get_bgpvpns_of_router_assocs_by_network(context, net_id):
 
 @db_api.CONTEXT_READER
 def get_networks_for_router(context, router_id):
-    ports = get_router_ports(context, router_id)
-    if ports:
-        return {port['network_id'] for port in ports}
-    else:
-        return []
+    return get_networks_for_routers(context, [router_id])
+
+
+@db_api.CONTEXT_READER
+def get_networks_for_routers(context, router_ids):
+    """Get the networks on which any of the given routers has an interface"""
+    if not router_ids:
+        return set()
+    return {net_id for (net_id,) in
+            context.session.query(models_v2.Port.network_id).
+            join(l3.RouterPort, l3.RouterPort.port_id == models_v2.Port.id).
+            filter(l3.RouterPort.router_id.in_(router_ids),
+                   l3.RouterPort.port_type ==
+                   const.DEVICE_OWNER_ROUTER_INTF).
+            distinct()}
 
 
 def _log_callback_processing_exception(resource, event, trigger, kwargs, e):
@@ -179,7 +320,52 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
     def __init__(self, service_plugin):
         super().__init__(service_plugin)
 
-        self.agent_rpc = rpc_client.BGPVPNAgentNotifyApi()
+        self.agent_rpc = rpc_batch.BGPVPNAgentNotifyApi()
+        # gateway MACs by network id, wrapped in a tuple to tell a network
+        # without router interface from a cache miss
+        self._gateway_macs = utils.LRUCache(GATEWAY_MAC_CACHE_SIZE,
+                                            ttl=GATEWAY_MAC_CACHE_TTL)
+        # merged route targets by network id, each valid for the ids and
+        # revision numbers of the BGPVPNs they were merged from
+        self._network_rts = utils.LRUCache(NETWORK_RT_CACHE_SIZE)
+        self._port_rpc_batcher = None
+        self._port_rpc_batcher_pid = None
+        self._port_rpc_batcher_lock = threading.Lock()
+
+    def _get_port_rpc(self):
+        """RPC API used for the port and BGPVPN notifications
+
+        The port notifications are batched per host when
+        port_rpc_batch_window is set, and sent before the BGPVPN ones.
+        """
+        window = cfg.CONF.bgpvpn.port_rpc_batch_window
+        if not window:
+            return self.agent_rpc
+        # the flush timers do not survive the fork of the API workers, the
+        # batcher is created by the process using it
+        with self._port_rpc_batcher_lock:
+            if self._port_rpc_batcher_pid != os.getpid():
+                self._port_rpc_batcher = rpc_batch.PortRpcBatcher(
+                    self.agent_rpc, window)
+                self._port_rpc_batcher_pid = os.getpid()
+                atexit.register(self.flush_port_rpcs)
+            return self._port_rpc_batcher
+
+    def flush_port_rpcs(self):
+        """Send the port notifications collected by the batcher, if any"""
+        batcher = self._port_rpc_batcher
+        if batcher is not None and self._port_rpc_batcher_pid == os.getpid():
+            batcher.flush()
+
+    def port_rpc_stats(self):
+        """Counters of the port notification batcher
+
+        Returns None unless port_rpc_batch_window is set.
+        """
+        batcher = self._port_rpc_batcher
+        if batcher is None or self._port_rpc_batcher_pid != os.getpid():
+            return None
+        return batcher.stats()
 
     def _format_bgpvpn(self, context, bgpvpn, network_id):
         """JSON-format BGPVPN
@@ -188,13 +374,36 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
         """
         formatted_bgpvpn = {'id': bgpvpn['id'],
                             'network_id': network_id,
-                            'gateway_mac': get_gateway_mac(context,
-                                                           network_id)}
+                            'gateway_mac': self._get_gateway_macs(
+                                context, [network_id])[network_id]}
         formatted_bgpvpn.update(
             self._format_bgpvpn_network_route_targets([bgpvpn]))
 
         return formatted_bgpvpn
 
+    def _get_gateway_macs(self, context, network_ids):
+        """Get the gateway MACs of networks, None for those without any
+
+        The MACs which are not in the cache are fetched with a single query.
+        """
+        gateway_macs = {}
+        missing = []
+        for net_id in network_ids:
+            cached = self._gateway_macs.get(net_id)
+            if cached is None:
+                missing.append(net_id)
+            else:
+                gateway_macs[net_id] = cached[0]
+        if missing:
+            fetched = get_gateway_macs(context, missing)
+            for net_id in missing:
+                gateway_macs[net_id] = fetched.get(net_id)
+                self._gateway_macs.set(net_id, (gateway_macs[net_id],))
+        return gateway_macs
+
+    def gateway_mac_cache_stats(self):
+        return self._gateway_macs.stats()
+
     def _format_bgpvpn_network_route_targets(self, bgpvpns):
         """Format BGPVPN network informations (VPN type and route targets)
 
@@ -228,39 +437,36 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
         }
 
         """
-        bgpvpn_rts = {}
+        merged = {}
         for bgpvpn in bgpvpns:
-            # Add necessary keys to BGP VPN route targets dictionary
-            if bgpvpn['type'] + 'vpn' not in bgpvpn_rts:
-                bgpvpn_rts.update(
-                    {bgpvpn['type'] + 'vpn': {'import_rt': [],
-                                              'export_rt': []}}
-                )
-
-            if 'route_targets' in bgpvpn:
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['import_rt'] += (
-                    bgpvpn['route_targets']
-                )
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['export_rt'] += (
-                    bgpvpn['route_targets']
-                )
-
-            if 'import_targets' in bgpvpn:
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['import_rt'] += (
-                    bgpvpn['import_targets']
-                )
-
-            if 'export_targets' in bgpvpn:
-                bgpvpn_rts[bgpvpn['type'] + 'vpn']['export_rt'] += (
-                    bgpvpn['export_targets']
-                )
-
-            for attribute in ('import_rt', 'export_rt'):
-                if bgpvpn_rts[bgpvpn['type'] + 'vpn'][attribute]:
-                    bgpvpn_rts[bgpvpn['type'] + 'vpn'][attribute] = list(
-                        set(bgpvpn_rts[bgpvpn['type'] + 'vpn'][attribute]))
-
-        return bgpvpn_rts
+            import_rts, export_rts = merged.setdefault(
+                bgpvpn['type'] + 'vpn', (set(), set()))
+            route_targets = bgpvpn.get('route_targets', ())
+            import_rts.update(route_targets, bgpvpn.get('import_targets', ()))
+            export_rts.update(route_targets, bgpvpn.get('export_targets', ()))
+
+        return {vpn_type: {'import_rt': list(import_rts),
+                           'export_rt': list(export_rts)}
+                for vpn_type, (import_rts, export_rts) in merged.items()}
+
+    def _get_network_route_targets(self, network_id, bgpvpns):
+        """Merged route targets of the BGPVPNs of a network
+
+        The merged route targets are cached, and only merged again if the
+        BGPVPNs of the network, or their revision numbers, change.
+        """
+        revision = frozenset((bgpvpn['id'], bgpvpn['revision_number'])
+                             for bgpvpn in bgpvpns)
+        bgpvpn_rts = self._network_rts.get(network_id, revision)
+        if bgpvpn_rts is None:
+            bgpvpn_rts = self._format_bgpvpn_network_route_targets(bgpvpns)
+            self._network_rts.set(network_id, bgpvpn_rts, revision)
+        # callers get their own copy, which they are free to modify
+        return {vpn_type: {key: list(rts) for key, rts in vpn_rts.items()}
+                for vpn_type, vpn_rts in bgpvpn_rts.items()}
+
+    def network_rt_cache_stats(self):
+        return self._network_rts.stats()
 
     def _bgpvpns_for_network(self, context, network_id):
         return (
@@ -274,11 +480,9 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
         )
 
     def _networks_for_bgpvpn(self, context, bgpvpn):
-        networks = []
-        networks.extend(bgpvpn['networks'])
-        for router_id in bgpvpn['routers']:
-            networks.extend(get_networks_for_router(context, router_id))
-        return list(set(networks))
+        networks = set(bgpvpn['networks'])
+        networks.update(get_networks_for_routers(context, bgpvpn['routers']))
+        return list(networks)
 
     def _retrieve_bgpvpn_network_info_for_port(self, context, port):
         """Retrieve BGP VPN network informations for a specific port
@@ -300,7 +504,14 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
 
         bgpvpn_network_info = {}
 
-        bgpvpns = self._bgpvpns_for_network(context, network_id)
+        LOG.debug("Getting port %s network details", port_id)
+        info = get_bgpvpn_network_info_for_port(context, port_id, network_id)
+
+        if not info:
+            LOG.warning("No network information for net %s", network_id)
+            return
+
+        network_info, bgpvpns = info
 
         # NOTE(tmorin): We currently need to send 'network_id', 'mac_address',
         #   'ip_address', 'gateway_ip' to the agent, even in the absence of
@@ -309,20 +520,12 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
         #   to retrieve this info by itself, we'll change this method
         #   to return {} if there is no bound bgpvpn.
 
-        bgpvpn_rts = self._format_bgpvpn_network_route_targets(bgpvpns)
+        bgpvpn_rts = self._get_network_route_targets(network_id, bgpvpns)
 
         LOG.debug("Port connected on BGPVPN network %s with route targets "
                   "%s", (network_id, bgpvpn_rts))
 
         bgpvpn_network_info.update(bgpvpn_rts)
-
-        LOG.debug("Getting port %s network details", port_id)
-        network_info = get_network_info_for_port(context, port_id, network_id)
-
-        if not network_info:
-            LOG.warning("No network information for net %s", network_id)
-            return
-
         bgpvpn_network_info.update(network_info)
 
         return bgpvpn_network_info
@@ -334,36 +537,40 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
                 get_bgpvpns_of_router_assocs_by_network(context, network_id)]
 
     def delete_bgpvpn_postcommit(self, context, bgpvpn):
-        for net_id in self._networks_for_bgpvpn(context, bgpvpn):
-            if get_network_ports(context, net_id):
-                # Format BGPVPN before sending notification
-                self.agent_rpc.delete_bgpvpn(
-                    context,
-                    self._format_bgpvpn(context, bgpvpn, net_id))
+        net_ids = get_networks_with_active_ports(
+            context, self._networks_for_bgpvpn(context, bgpvpn))
+        # fetch the gateway MACs of all the networks at once
+        self._get_gateway_macs(context, net_ids)
+        for net_id in net_ids:
+            # Format BGPVPN before sending notification
+            self._get_port_rpc().delete_bgpvpn(
+                context,
+                self._format_bgpvpn(context, bgpvpn, net_id))
 
     def update_bgpvpn_postcommit(self, context, old_bgpvpn, new_bgpvpn):
+        # as for the BGPVPN dict cache, entries are also keyed by revision
+        # number, for the updates made by other processes
+        self._network_rts.clear()
         super().update_bgpvpn_postcommit(
             context, old_bgpvpn, new_bgpvpn)
 
-        (added_keys, removed_keys, changed_keys) = (
-            utils.get_bgpvpn_differences(new_bgpvpn, old_bgpvpn))
-        ATTRIBUTES_TO_IGNORE = set('name')
-        moving_keys = added_keys | removed_keys | changed_keys
-        if len(moving_keys ^ ATTRIBUTES_TO_IGNORE):
-            for net_id in self._networks_for_bgpvpn(context, new_bgpvpn):
-                if (get_network_ports(context, net_id)):
-                    self._update_bgpvpn_for_network(context, net_id,
-                                                    new_bgpvpn)
+        if utils.get_bgpvpn_changes(new_bgpvpn, old_bgpvpn,
+                                    BGPVPN_RPC_ATTRIBUTES):
+            net_ids = get_networks_with_active_ports(
+                context, self._networks_for_bgpvpn(context, new_bgpvpn))
+            # fetch the gateway MACs of all the networks at once
+            self._get_gateway_macs(context, net_ids)
+            for net_id in net_ids:
+                self._update_bgpvpn_for_network(context, net_id, new_bgpvpn)
 
     def _update_bgpvpn_for_net_with_id(self, context, network_id, bgpvpn_id):
-        if get_network_ports(context, network_id):
+        if network_has_active_ports(context, network_id):
             bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
             self._update_bgpvpn_for_network(context, network_id, bgpvpn)
 
     def _update_bgpvpn_for_network(self, context, net_id, bgpvpn):
         formated_bgpvpn = self._format_bgpvpn(context, bgpvpn, net_id)
-        self.agent_rpc.update_bgpvpn(context,
-                                     formated_bgpvpn)
+        self._get_port_rpc().update_bgpvpn(context, formated_bgpvpn)
 
     def create_net_assoc_postcommit(self, context, net_assoc):
         super().create_net_assoc_postcommit(context, net_assoc)
@@ -371,12 +578,33 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
                                             net_assoc['network_id'],
                                             net_assoc['bgpvpn_id'])
 
+    def _update_bgpvpn_for_nets_with_id(self, context, network_ids,
+                                        bgpvpn_id):
+        net_ids = get_networks_with_active_ports(context, network_ids)
+        if not net_ids:
+            return
+        bgpvpn = self.get_bgpvpn(context, bgpvpn_id)
+        # fetch the gateway MACs of all the networks at once
+        self._get_gateway_macs(context, net_ids)
+        for net_id in net_ids:
+            self._update_bgpvpn_for_network(context, net_id, bgpvpn)
+
+    def create_net_assocs_postcommit(self, context, net_assocs):
+        # the associations of a bulk request all belong to the same BGPVPN
+        super().create_net_assocs_postcommit(context, net_assocs)
+        for bgpvpn_id in {net_assoc['bgpvpn_id'] for net_assoc in net_assocs}:
+            self._update_bgpvpn_for_nets_with_id(
+                context,
+                {net_assoc['network_id'] for net_assoc in net_assocs
+                 if net_assoc['bgpvpn_id'] == bgpvpn_id},
+                bgpvpn_id)
+
     def delete_net_assoc_postcommit(self, context, net_assoc):
-        if get_network_ports(context, net_assoc['network_id']):
+        if network_has_active_ports(context, net_assoc['network_id']):
             bgpvpn = self.get_bgpvpn(context, net_assoc['bgpvpn_id'])
             formated_bgpvpn = self._format_bgpvpn(context, bgpvpn,
                                                   net_assoc['network_id'])
-            self.agent_rpc.delete_bgpvpn(context, formated_bgpvpn)
+            self._get_port_rpc().delete_bgpvpn(context, formated_bgpvpn)
 
     def _ignore_port(self, context, port):
         if (port['device_owner'].startswith(
@@ -385,7 +613,7 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
                      port['id'])
             return True
 
-        if v2.network_is_external(context, port['network_id']):
+        if self._network_is_external(context, port['network_id']):
             LOG.info("Port %s is on an external network, we'll do nothing",
                      port['id'])
             return True
@@ -414,9 +642,9 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
             if bgpvpn_network_info:
                 port_bgpvpn_info.update(bgpvpn_network_info)
 
-                self.agent_rpc.attach_port_on_bgpvpn(context,
-                                                     port_bgpvpn_info,
-                                                     agent_host)
+                self._get_port_rpc().attach_port_on_bgpvpn(context,
+                                                           port_bgpvpn_info,
+                                                           agent_host)
             else:
                 # currently not reached, because we need
                 # _retrieve_bgpvpn_network_info_for_port to always
@@ -427,9 +655,9 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
         elif (port['status'] == const.PORT_STATUS_DOWN and
               original_port['status'] != const.PORT_STATUS_DOWN):
             LOG.debug("notify_port_updated, port became DOWN")
-            self.agent_rpc.detach_port_from_bgpvpn(context,
-                                                   port_bgpvpn_info,
-                                                   agent_host)
+            self._get_port_rpc().detach_port_from_bgpvpn(context,
+                                                         port_bgpvpn_info,
+                                                         agent_host)
         else:
             LOG.debug("new port status is %s, origin status was %s,"
                       " => no action", port['status'], original_port['status'])
@@ -442,9 +670,8 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
         if self._ignore_port(context, port):
             return
 
-        self.agent_rpc.detach_port_from_bgpvpn(context,
-                                               port_bgpvpn_info,
-                                               port[portbindings.HOST_ID])
+        self._get_port_rpc().detach_port_from_bgpvpn(
+            context, port_bgpvpn_info, port[portbindings.HOST_ID])
 
     def create_router_assoc_postcommit(self, context, router_assoc):
         super().create_router_assoc_postcommit(
@@ -455,6 +682,19 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
                                                 net_id,
                                                 router_assoc['bgpvpn_id'])
 
+    def create_router_assocs_postcommit(self, context, router_assocs):
+        super().create_router_assocs_postcommit(context, router_assocs)
+        for bgpvpn_id in {router_assoc['bgpvpn_id']
+                          for router_assoc in router_assocs}:
+            self._update_bgpvpn_for_nets_with_id(
+                context,
+                get_networks_for_routers(
+                    context,
+                    [router_assoc['router_id'] for router_assoc in
+                     router_assocs
+                     if router_assoc['bgpvpn_id'] == bgpvpn_id]),
+                bgpvpn_id)
+
     def delete_router_assoc_postcommit(self, context, router_assoc):
         for net_id in get_networks_for_router(context,
                                               router_assoc['router_id']):
@@ -464,6 +704,7 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
 
     @log_helpers.log_method_call
     def notify_router_interface_created(self, context, router_id, net_id):
+        self._gateway_macs.invalidate(net_id)
         super().notify_router_interface_created(
             context, router_id, net_id)
 
@@ -485,6 +726,7 @@ class BaGPipeBGPVPNDriver(v2.BaGPipeBGPVPNDriver):
 
     @log_helpers.log_method_call
     def notify_router_interface_deleted(self, context, router_id, net_id):
+        self._gateway_macs.invalidate(net_id)
         super().notify_router_interface_deleted(
             context, router_id, net_id)
 
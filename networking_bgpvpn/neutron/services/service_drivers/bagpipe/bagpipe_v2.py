@@ -13,14 +13,19 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import atexit
+import os
+import threading
+
+import sqlalchemy as sa
 from sqlalchemy import orm
 
 from neutron.api.rpc.callbacks import events as rpc_events
-from neutron.api.rpc.handlers import resources_rpc
 from neutron.db.models import external_net
 
 from neutron_lib.api.definitions import bgpvpn_routes_control as bgpvpn_rc_def
 from neutron_lib.api.definitions import bgpvpn_vni as bgpvpn_vni_def
+from neutron_lib.api.definitions import external_net as extnet_def
 from neutron_lib.callbacks import events
 from neutron_lib.callbacks import registry
 from neutron_lib.callbacks import resources
@@ -30,11 +35,16 @@ from neutron_lib.plugins import directory
 
 from networking_bagpipe.objects import bgpvpn as bgpvpn_objects
 
+from oslo_config import cfg
 from oslo_log import helpers as log_helpers
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from networking_bgpvpn.neutron.extensions import bgpvpn as bgpvpn_ext
+from networking_bgpvpn.neutron.services.common import push_queue
 from networking_bgpvpn.neutron.services.common import utils
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import host_push
 from networking_bgpvpn.neutron.services.service_drivers import driver_api
 
 
@@ -43,6 +53,16 @@ LOG = logging.getLogger(__name__)
 
 BAGPIPE_DRIVER_NAME = "bagpipe"
 
+# BGPVPN attributes carried by the associations pushed to the agents, and
+# used by them
+BGPVPN_PUSHED_ATTRIBUTES = ('type', 'route_targets', 'import_targets',
+                            'export_targets', 'route_distinguishers',
+                            bgpvpn_vni_def.VNI, bgpvpn_rc_def.LOCAL_PREF_KEY)
+
+# Number of seconds after which the external network ids known by a driver
+# are loaded again, in case a change was missed
+EXTERNAL_NETWORKS_CACHE_TTL = 60
+
 
 class BGPVPNExternalNetAssociation(n_exc.NeutronException):
     message = _("driver does not support associating an external"
@@ -59,6 +79,106 @@ def network_is_external(context, net_id):
         return False
 
 
+@db_api.CONTEXT_READER
+def any_network_is_external(context, net_ids):
+    return context.session.query(sa.exists().where(
+        external_net.ExternalNetwork.network_id.in_(net_ids))).scalar()
+
+
+class ExternalNetworkCache():
+    """Process-local set of the ids of the external networks
+
+    The set is loaded lazily, kept current by the driver from the network
+    callbacks, and loaded again ttl seconds after it was last loaded, as a
+    safety net for changes made by other processes.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._net_ids = None
+        self._loaded_at = None
+        # bumped on each change, so that a set loaded concurrently with a
+        # change is not kept
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _valid(self):
+        return (self._net_ids is not None and
+                timeutils.utcnow_ts(microsecond=True) - self._loaded_at <
+                self.ttl)
+
+    @db_api.CONTEXT_READER
+    def _load(self, context):
+        return {net_id for (net_id,) in context.session.query(
+            external_net.ExternalNetwork.network_id)}
+
+    def is_external(self, context, net_id):
+        with self._lock:
+            if self._valid():
+                self.hits += 1
+                return net_id in self._net_ids
+            self.misses += 1
+            generation = self._generation
+        net_ids = self._load(context)
+        with self._lock:
+            if generation == self._generation:
+                self._net_ids = net_ids
+                self._loaded_at = timeutils.utcnow_ts(microsecond=True)
+        return net_id in net_ids
+
+    def update(self, net_id, external):
+        with self._lock:
+            self._generation += 1
+            if self._net_ids is None:
+                return
+            if external:
+                self._net_ids.add(net_id)
+            else:
+                self._net_ids.discard(net_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._net_ids = None
+
+    def stats(self):
+        with self._lock:
+            return {'size': (len(self._net_ids)
+                             if self._net_ids is not None else 0),
+                    'hits': self.hits,
+                    'misses': self.misses}
+
+
+def iter_bgpvpn_associations(context, obj_cls, bgpvpn_id, chunk_size):
+    """Yield the associations of a BGPVPN, at most chunk_size at a time
+
+    The associations are paged through in the order of their ids, each page
+    starting after the last id of the previous one: an association deleted
+    meanwhile is skipped, and one created meanwhile is included if its id
+    comes after the current page.
+    """
+    model = obj_cls.db_model
+    marker = None
+    while True:
+        with db_api.CONTEXT_READER.using(context):
+            query = context.session.query(model.id).filter(
+                model.bgpvpn_id == bgpvpn_id)
+            if marker is not None:
+                query = query.filter(model.id > marker)
+            ids = [id_ for (id_,) in
+                   query.order_by(model.id).limit(chunk_size)]
+            if not ids:
+                return
+            associations = obj_cls.get_objects(context, id=ids)
+        if associations:
+            yield associations
+        if len(ids) < chunk_size:
+            return
+        marker = ids[-1]
+
+
 def _log_callback_processing_exception(resource, event, trigger, metadata, e):
     LOG.exception("Error during notification processing "
                   "%(resource)s %(event)s, %(trigger)s, "
@@ -81,7 +201,31 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
     def __init__(self, service_plugin):
         super().__init__(service_plugin)
 
-        self._push_rpc = resources_rpc.ResourcesPushRpcApi()
+        self._push_rpc = host_push.HostScopedPushRpcApi()
+        self._host_pusher = host_push.HostScopedPusher(self._push_rpc)
+        self._push_queue = None
+        self._push_queue_pid = None
+        self._push_queue_lock = threading.Lock()
+        self._external_networks = ExternalNetworkCache(
+            EXTERNAL_NETWORKS_CACHE_TTL)
+
+    def _network_is_external(self, context, net_id):
+        return self._external_networks.is_external(context, net_id)
+
+    def external_network_cache_stats(self):
+        return self._external_networks.stats()
+
+    def _get_push_queue(self):
+        # the flush timers do not survive the fork of the API workers, the
+        # queue is created by the process using it
+        with self._push_queue_lock:
+            if self._push_queue_pid != os.getpid():
+                self._push_queue = push_queue.CoalescingPushQueue(
+                    self._send_push,
+                    cfg.CONF.bgpvpn.push_coalesce_window)
+                self._push_queue_pid = os.getpid()
+                atexit.register(self.flush_pushes)
+            return self._push_queue
 
     def _push_association(self, context, association, event_type):
         self._push_associations(context, [association], event_type)
@@ -91,7 +235,42 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
             return
         for assoc in associations:
             LOG.debug("pushing %s %s (%s)", event_type, assoc, assoc.bgpvpn)
-        self._push_rpc.push(context, associations, event_type)
+        if cfg.CONF.bgpvpn.push_coalesce_window:
+            self._get_push_queue().push(context, associations, event_type)
+        else:
+            self._send_push(context, associations, event_type)
+
+    def _send_push(self, context, associations, event_type):
+        if cfg.CONF.bgpvpn.host_scoped_push:
+            self._host_pusher.push(context, associations, event_type)
+        else:
+            self._push_rpc.push(context, associations, event_type)
+
+    def flush_pushes(self):
+        """Push the associations collected by the push queue, if any"""
+        queue = self._push_queue
+        if queue is not None and self._push_queue_pid == os.getpid():
+            queue.flush()
+
+    def push_stats(self):
+        """Counters of the push queue
+
+        The number of push calls saved is the number of events minus the
+        number of pushes. Returns None unless push_coalesce_window is set.
+        """
+        queue = self._push_queue
+        if queue is None or self._push_queue_pid != os.getpid():
+            return None
+        return queue.stats()
+
+    def host_push_stats(self):
+        """Counters of the host-scoped pushes
+
+        Returns None unless host_scoped_push is set.
+        """
+        if not cfg.CONF.bgpvpn.host_scoped_push:
+            return None
+        return self._host_pusher.stats()
 
     def _common_precommit_checks(self, bgpvpn):
         # No support yet for specifying route distinguishers
@@ -109,15 +288,25 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
         self._common_precommit_checks(new_bgpvpn)
 
     def update_bgpvpn_postcommit(self, context, old_bgpvpn, new_bgpvpn):
-        (added_keys, removed_keys, changed_keys) = (
-            utils.get_bgpvpn_differences(new_bgpvpn, old_bgpvpn))
-        ATTRIBUTES_TO_IGNORE = {'name'}
-        moving_keys = added_keys | removed_keys | changed_keys
-        if len(moving_keys ^ ATTRIBUTES_TO_IGNORE):
+        # the associations are only pushed again if the agents would see a
+        # difference
+        if utils.get_bgpvpn_changes(new_bgpvpn, old_bgpvpn,
+                                    BGPVPN_PUSHED_ATTRIBUTES):
             self._push_bgpvpn_associations(context, new_bgpvpn['id'],
                                            rpc_events.UPDATED)
 
     def _push_bgpvpn_associations(self, context, bgpvpn_id, event_type):
+        chunk_size = cfg.CONF.bgpvpn.push_chunk_size
+        if chunk_size:
+            # stream the associations of large BGPVPNs, rather than loading
+            # them all in memory and pushing them in a single message
+            for obj_cls in (bgpvpn_objects.BGPVPNNetAssociation,
+                            bgpvpn_objects.BGPVPNRouterAssociation):
+                for associations in iter_bgpvpn_associations(
+                        context, obj_cls, bgpvpn_id, chunk_size):
+                    self._push_associations(context, associations,
+                                            event_type)
+            return
         self._push_associations(
             context,
             (bgpvpn_objects.BGPVPNNetAssociation.get_objects(
@@ -141,6 +330,22 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
                 id=net_assoc['id']),
             rpc_events.CREATED)
 
+    # the hooks below are called for the associations created by a bulk
+    # request, whose objects are built and pushed all at once
+
+    def create_net_assocs_precommit(self, context, net_assocs):
+        if any_network_is_external(context, [net_assoc['network_id']
+                                             for net_assoc in net_assocs]):
+            raise BGPVPNExternalNetAssociation()
+
+    def create_net_assocs_postcommit(self, context, net_assocs):
+        self._push_associations(
+            context,
+            bgpvpn_objects.BGPVPNNetAssociation.get_objects(
+                context,
+                id=[net_assoc['id'] for net_assoc in net_assocs]),
+            rpc_events.CREATED)
+
     def delete_net_assoc_precommit(self, context, net_assoc):
         self._push_association(
             context,
@@ -157,8 +362,17 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
                 id=port_assoc['id']),
             rpc_events.CREATED)
 
+    def create_port_assocs_postcommit(self, context, port_assocs):
+        self._push_associations(
+            context,
+            bgpvpn_objects.BGPVPNPortAssociation.get_objects(
+                context,
+                id=[port_assoc['id'] for port_assoc in port_assocs]),
+            rpc_events.CREATED)
+
     def update_port_assoc_postcommit(self, context,
-                                     old_port_assoc, port_assoc):
+                                     old_port_assoc, port_assoc,
+                                     routes_diff=None):
         self._push_association(
             context,
             bgpvpn_objects.BGPVPNPortAssociation.get_object(
@@ -182,6 +396,14 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
                 id=router_assoc['id']),
             rpc_events.CREATED)
 
+    def create_router_assocs_postcommit(self, context, router_assocs):
+        self._push_associations(
+            context,
+            bgpvpn_objects.BGPVPNRouterAssociation.get_objects(
+                context,
+                id=[router_assoc['id'] for router_assoc in router_assocs]),
+            rpc_events.CREATED)
+
     def delete_router_assoc_precommit(self, context, router_assoc):
         self._push_association(
             context,
@@ -225,6 +447,25 @@ class BaGPipeBGPVPNDriver(driver_api.BGPVPNDriverRC):
 
         self._push_associations(context, associations, rpc_events.UPDATED)
 
+    @registry.receives(resources.NETWORK, [events.AFTER_CREATE,
+                                           events.AFTER_UPDATE,
+                                           events.AFTER_DELETE])
+    def registry_network_changed(self, resource, event, trigger,
+                                 payload=None):
+        try:
+            if event == events.AFTER_DELETE:
+                self._external_networks.update(payload.resource_id, False)
+                return
+            external = payload.latest_state.get(extnet_def.EXTERNAL)
+            if external is None:
+                self._external_networks.invalidate()
+            else:
+                self._external_networks.update(payload.resource_id,
+                                               external)
+        except Exception as e:
+            _log_callback_processing_exception(resource, event, trigger,
+                                               payload.metadata, e)
+
     @registry.receives(resources.ROUTER_INTERFACE, [events.AFTER_CREATE])
     @log_helpers.log_method_call
     def registry_router_interface_created(self, resource, event, trigger,
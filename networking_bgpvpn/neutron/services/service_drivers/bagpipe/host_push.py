@@ -0,0 +1,190 @@
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may
+#  not use this file except in compliance with the License. You may obtain
+#  a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#  License for the specific language governing permissions and limitations
+#  under the License.
+
+import threading
+
+from neutron.api.rpc.callbacks import version_manager
+from neutron.api.rpc.handlers import resources_rpc
+from neutron.db import models_v2
+from neutron.plugins.ml2 import models as ml2_models
+from neutron_lib import constants as const
+from neutron_lib.db import api as db_api
+from neutron_lib.plugins import directory
+from oslo_log import log as logging
+
+from networking_bagpipe.objects import bgpvpn as bgpvpn_objects
+
+
+LOG = logging.getLogger(__name__)
+
+# key of the configurations of the agents consuming the pushed associations
+# on a per-host topic
+HOST_PUSH_AGENT_CONFIG = 'bagpipe_bgpvpn_host_push'
+
+
+def _bound_ports_query(context, *columns):
+    # the agents ignore the ports owned by network:* devices
+    return (context.session.query(*columns).
+            join(ml2_models.PortBinding,
+                 ml2_models.PortBinding.port_id == models_v2.Port.id).
+            filter(ml2_models.PortBinding.host != '',
+                   ~models_v2.Port.device_owner.startswith(
+                       const.DEVICE_OWNER_NETWORK_PREFIX)))
+
+
+@db_api.CONTEXT_READER
+def get_hosts_for_networks(context, network_ids):
+    """Get the hosts on which ports of the given networks are bound
+
+    Returns a dict of sets of hosts, by network id.
+    """
+    hosts = {}
+    if not network_ids:
+        return hosts
+    for net_id, host in (
+            _bound_ports_query(context, models_v2.Port.network_id,
+                               ml2_models.PortBinding.host).
+            filter(models_v2.Port.network_id.in_(network_ids)).
+            distinct()):
+        hosts.setdefault(net_id, set()).add(host)
+    return hosts
+
+
+@db_api.CONTEXT_READER
+def get_hosts_for_ports(context, port_ids):
+    """Get the hosts on which the given ports are bound
+
+    Returns a dict of sets of hosts, by port id.
+    """
+    hosts = {}
+    if not port_ids:
+        return hosts
+    for port_id, host in (
+            _bound_ports_query(context, models_v2.Port.id,
+                               ml2_models.PortBinding.host).
+            filter(models_v2.Port.id.in_(port_ids))):
+        hosts.setdefault(port_id, set()).add(host)
+    return hosts
+
+
+def get_host_push_hosts(context, hosts):
+    """Get those of the given hosts whose agents consume host pushes"""
+    plugin = directory.get_plugin()
+    if not hosts or not hasattr(plugin, 'get_agents'):
+        return set()
+    agents = plugin.get_agents(context, filters={'host': list(hosts)},
+                               fields=['host', 'configurations'])
+    return {agent['host'] for agent in agents
+            if agent['configurations'].get(HOST_PUSH_AGENT_CONFIG)}
+
+
+class HostScopedPushRpcApi(resources_rpc.ResourcesPushRpcApi):
+    """ResourcesPushRpcApi able to push objects to the agents of a host
+
+    The agents consume the resource topics with their host as server, the
+    objects pushed to a host are cast on these topics rather than fanned
+    out.
+    """
+
+    def push_to_host(self, context, resource_list, event_type, host):
+        resources_by_type = self._classify_resources_by_type(resource_list)
+        for resource_type, type_resources in resources_by_type.items():
+            for version in version_manager.get_resource_versions(
+                    resource_type):
+                cctxt = self.client.prepare(
+                    topic=resources_rpc.resource_type_versioned_topic(
+                        resource_type, version),
+                    server=host, version='1.1')
+                cctxt.cast(context, 'push',
+                           resource_list=[
+                               resource.obj_to_primitive(
+                                   target_version=version)
+                               for resource in type_resources],
+                           event_type=event_type)
+
+
+class HostScopedPusher():
+    """Push associations to the hosts having ports bound on their networks
+
+    Offers the push method of ResourcesPushRpcApi, but only sends each
+    association to the hosts on which ports of its networks, or its port,
+    are bound. The associations are fanned out to all the agents instead if
+    the agents of any of these hosts do not advertise that they consume
+    host pushes.
+
+    push_rpc is a HostScopedPushRpcApi.
+    """
+
+    def __init__(self, push_rpc, host_push_hosts=get_host_push_hosts):
+        self.push_rpc = push_rpc
+        self._host_push_hosts = host_push_hosts
+        self.pushes = 0
+        self.fanouts = 0
+        self.host_casts = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _associations_by_host(self, context, associations):
+        network_ids = set()
+        port_ids = set()
+        for assoc in associations:
+            if isinstance(assoc, bgpvpn_objects.BGPVPNNetAssociation):
+                network_ids.add(assoc.network_id)
+            elif isinstance(assoc, bgpvpn_objects.BGPVPNRouterAssociation):
+                network_ids.update(net['network_id']
+                                   for net in assoc.connected_networks)
+            else:
+                port_ids.add(assoc.port_id)
+        network_hosts = get_hosts_for_networks(context, network_ids)
+        port_hosts = get_hosts_for_ports(context, port_ids)
+
+        by_host = {}
+        for assoc in associations:
+            if isinstance(assoc, bgpvpn_objects.BGPVPNNetAssociation):
+                hosts = network_hosts.get(assoc.network_id, ())
+            elif isinstance(assoc, bgpvpn_objects.BGPVPNRouterAssociation):
+                hosts = set().union(*(
+                    network_hosts.get(net['network_id'], ())
+                    for net in assoc.connected_networks))
+            else:
+                hosts = port_hosts.get(assoc.port_id, ())
+            for host in hosts:
+                by_host.setdefault(host, []).append(assoc)
+        return by_host
+
+    def push(self, context, associations, event_type):
+        by_host = self._associations_by_host(context, associations)
+        if set(by_host) - self._host_push_hosts(context, by_host):
+            LOG.debug("Agents of hosts %s do not consume host pushes, "
+                      "fanning out", set(by_host))
+            self.push_rpc.push(context, associations, event_type)
+            with self._lock:
+                self.pushes += 1
+                self.fanouts += 1
+            return
+        for host, host_associations in by_host.items():
+            self.push_rpc.push_to_host(context, host_associations,
+                                       event_type, host)
+        with self._lock:
+            self.pushes += 1
+            self.host_casts += len(by_host)
+            # associations with no port bound on any host are not pushed,
+            # the agents pull them when a port is bound
+            if not by_host:
+                self.skipped += 1
+
+    def stats(self):
+        with self._lock:
+            return {'pushes': self.pushes,
+                    'fanouts': self.fanouts,
+                    'host_casts': self.host_casts,
+                    'skipped': self.skipped}
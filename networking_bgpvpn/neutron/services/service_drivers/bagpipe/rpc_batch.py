@@ -0,0 +1,199 @@
+#  Licensed under the Apache License, Version 2.0 (the "License"); you may
+#  not use this file except in compliance with the License. You may obtain
+#  a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#  WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#  License for the specific language governing permissions and limitations
+#  under the License.
+
+import itertools
+import threading
+
+from neutron_lib import context as n_context
+from neutron_lib.plugins import directory
+from oslo_log import log as logging
+
+from networking_bagpipe.agent.bgpvpn import rpc_client
+
+
+LOG = logging.getLogger(__name__)
+
+ATTACH = 'attach_port_on_bgpvpn'
+DETACH = 'detach_port_from_bgpvpn'
+
+# list-valued variants of the port RPCs, taking a port_bgpvpn_infos list
+BATCH_METHODS = {ATTACH: 'attach_ports_on_bgpvpn',
+                 DETACH: 'detach_ports_from_bgpvpn'}
+
+# key of the configurations of the agents supporting the list-valued RPCs
+BATCH_RPC_AGENT_CONFIG = 'bagpipe_bgpvpn_batch_rpc'
+
+
+def get_batch_rpc_hosts(context, hosts):
+    """Get those of the given hosts whose agents support the batch RPCs
+
+    A host is kept if it has agents, all of them advertising support of the
+    batch RPCs.
+    """
+    plugin = directory.get_plugin()
+    if not hosts or not hasattr(plugin, 'get_agents'):
+        return set()
+    supported = {}
+    for agent in plugin.get_agents(context, filters={'host': list(hosts)},
+                                   fields=['host', 'configurations']):
+        supported[agent['host']] = (
+            supported.get(agent['host'], True) and
+            bool(agent['configurations'].get(BATCH_RPC_AGENT_CONFIG)))
+    return {host for host, batch in supported.items() if batch}
+
+
+class BGPVPNAgentNotifyApi(rpc_client.BGPVPNAgentNotifyApi):
+    """BGPVPNAgentNotifyApi with the list-valued port RPCs"""
+
+    def _notification_host_batch(self, context, method, port_bgpvpn_infos,
+                                 host):
+        LOG.debug('Notify BGP VPN agent %(host)s at %(topic)s '
+                  'the message %(method)s for %(count)d ports',
+                  {'host': host,
+                   'topic': self.topic_bgpvpn_update,
+                   'method': method,
+                   'count': len(port_bgpvpn_infos)})
+
+        cctxt = self.client.prepare(topic=self.topic_bgpvpn_update,
+                                    server=host)
+        cctxt.cast(context, method, port_bgpvpn_infos=port_bgpvpn_infos)
+
+    def attach_ports_on_bgpvpn(self, context, port_bgpvpn_infos, host=None):
+        self._notification_host_batch(context, BATCH_METHODS[ATTACH],
+                                      port_bgpvpn_infos, host)
+
+    def detach_ports_from_bgpvpn(self, context, port_bgpvpn_infos,
+                                 host=None):
+        self._notification_host_batch(context, BATCH_METHODS[DETACH],
+                                      port_bgpvpn_infos, host)
+
+
+class PortRpcBatcher():
+    """Batch the port attach/detach notifications sent to agents
+
+    Offers the attach_port_on_bgpvpn and detach_port_from_bgpvpn methods of
+    BGPVPNAgentNotifyApi, but collects the notifications of each host during
+    a window of time. When it ends, consecutive notifications of a same kind
+    for a host are sent as one list-valued RPC, if the agents of the host
+    support it, or one by one otherwise.
+
+    The BGPVPN update and delete notifications, sent to all the agents, are
+    sent right away, but after the port notifications collected so far, so
+    that an agent does not get a port attachment with route targets older
+    than those of a BGPVPN update it got before.
+
+    agent_rpc is a BGPVPNAgentNotifyApi.
+    """
+
+    def __init__(self, agent_rpc, window,
+                 batch_rpc_hosts=get_batch_rpc_hosts):
+        self.agent_rpc = agent_rpc
+        self.window = window
+        self._batch_rpc_hosts = batch_rpc_hosts
+        self.notifications = 0
+        self.casts = 0
+        self.batch_casts = 0
+        self.failures = 0
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.Lock()
+        # held while sending notifications, so that they are sent in order
+        self._send_lock = threading.RLock()
+
+    def _add(self, method, port_bgpvpn_info, host):
+        with self._lock:
+            self.notifications += 1
+            self._pending.setdefault(host, []).append(
+                (method, port_bgpvpn_info))
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def attach_port_on_bgpvpn(self, context, port_bgpvpn_info, host=None):
+        if port_bgpvpn_info:
+            self._add(ATTACH, port_bgpvpn_info, host)
+
+    def detach_port_from_bgpvpn(self, context, port_bgpvpn_info, host=None):
+        self._add(DETACH, port_bgpvpn_info, host)
+
+    def _fanout(self, method, context, bgpvpn):
+        with self._send_lock:
+            # the fanout reaches the agents of all the hosts
+            self.flush()
+            getattr(self.agent_rpc, method)(context, bgpvpn)
+
+    def update_bgpvpn(self, context, bgpvpn):
+        self._fanout('update_bgpvpn', context, bgpvpn)
+
+    def delete_bgpvpn(self, context, bgpvpn):
+        self._fanout('delete_bgpvpn', context, bgpvpn)
+
+    def _flush_host(self, context, host, notifications, batch):
+        casts = batch_casts = failures = 0
+        # notifications are sent in order, only consecutive ones of the same
+        # kind being grouped
+        for method, group in itertools.groupby(notifications,
+                                               key=lambda n: n[0]):
+            infos = [info for _method, info in group]
+            try:
+                if batch and len(infos) > 1:
+                    getattr(self.agent_rpc, BATCH_METHODS[method])(
+                        context, infos, host)
+                    batch_casts += 1
+                    casts += 1
+                else:
+                    for info in infos:
+                        getattr(self.agent_rpc, method)(context, info, host)
+                        casts += 1
+            except Exception:
+                LOG.exception("Error sending %s to %s", method, host)
+                failures += 1
+        return casts, batch_casts, failures
+
+    def flush(self):
+        """Send the notifications collected so far"""
+        with self._send_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        context = n_context.get_admin_context()
+        # the agents of all the hosts are checked at once
+        try:
+            batch_hosts = self._batch_rpc_hosts(context, set(pending))
+        except Exception:
+            LOG.exception("Error checking the batch RPC support of the "
+                          "agents of %s", set(pending))
+            batch_hosts = set()
+        for host, notifications in pending.items():
+            casts, batch_casts, failures = self._flush_host(
+                context, host, notifications, host in batch_hosts)
+            with self._lock:
+                self.casts += casts
+                self.batch_casts += batch_casts
+                self.failures += failures
+
+    def stats(self):
+        with self._lock:
+            return {'pending': sum(len(notifications) for notifications
+                                   in self._pending.values()),
+                    'notifications': self.notifications,
+                    'casts': self.casts,
+                    'batch_casts': self.batch_casts,
+                    'failures': self.failures}
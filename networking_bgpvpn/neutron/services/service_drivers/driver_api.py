@@ -14,13 +14,42 @@
 #    under the License.
 
 import abc
+import atexit
+import collections
 import copy
-
+import datetime
+import functools
+import inspect
+import os
+import threading
+
+from neutron import worker as neutron_worker
+from neutron_lib import constants as const
+from neutron_lib import context as n_context
 from neutron_lib.db import api as db_api
+from neutron_lib.plugins import directory
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_log import versionutils
+from oslo_utils import timeutils
 
 from networking_bgpvpn.neutron.db import bgpvpn_db
 from networking_bgpvpn.neutron.extensions \
     import bgpvpn_routes_control as bgpvpn_rc
+from networking_bgpvpn.neutron.services.common import config
+from networking_bgpvpn.neutron.services.common import constants
+from networking_bgpvpn.neutron.services.common import postcommit
+
+config.register_bgpvpn_opts()
+
+LOG = logging.getLogger(__name__)
+
+# the postcommit hooks for which consecutive journal entries of a same
+# resource can be run as a single one, from the first old state to the last
+# new state
+JOURNAL_MERGEABLE_OPERATIONS = ('update_bgpvpn_postcommit',
+                                'update_router_assoc_postcommit',
+                                'update_port_assoc_postcommit')
 
 
 class BGPVPNDriverBase(metaclass=abc.ABCMeta):
@@ -31,9 +60,30 @@ class BGPVPNDriverBase(metaclass=abc.ABCMeta):
     """
     more_supported_extension_aliases = []
 
+    # True if get_bgpvpns, get_net_assocs, get_router_assocs and
+    # get_port_assocs accept the sorts, limit, marker and page_reverse
+    # parameters, in which case the API relies on the driver for sorting
+    # and pagination rather than emulating them
+    native_pagination_support = False
+
+    # True if the driver implements create_net_assocs, create_router_assocs
+    # (and create_port_assocs if it supports bgpvpn-routes-control), to
+    # create a batch of associations at once, in which case the API does
+    # not emulate bulk creation of associations
+    native_bulk_support = False
+
+    # True if the driver implements router_and_network_bound_to_bgpvpns,
+    # to check if a router and a network are both bound to BGPVPNs
+    # without listing them, each time an interface is added to a router
+    router_interface_check_support = False
+
     def __init__(self, service_plugin):
         self.service_plugin = service_plugin
 
+    def get_workers(self):
+        """Workers needed by the driver, run along with the API workers"""
+        return []
+
     @property
     def service_type(self):
         pass
@@ -90,6 +140,77 @@ class BGPVPNDriverBase(metaclass=abc.ABCMeta):
     def delete_router_assoc(self, context, assoc_id, bgpvpn_id):
         pass
 
+    def get_networks_router_bgpvpns(self, context, networks):
+        """Find the L3 BGPVPNs associated to a router of some networks
+
+        Returns a dict mapping the id of each of the networks having an
+        interface on a router associated to L3 BGPVPN(s) of the project of
+        the network, to the ids of these BGPVPNs.
+
+        Drivers persisting BGPVPNs in a database are expected to override
+        this with a single query; this default relies on get_ports and
+        get_bgpvpns.
+        """
+        networks = {network['id']: network for network in networks}
+        router_ports = directory.get_plugin().get_ports(
+            context,
+            filters={'network_id': list(networks),
+                     'device_owner': [const.DEVICE_OWNER_ROUTER_INTF]},
+            fields=['network_id', 'device_id'])
+        if not router_ports:
+            return {}
+        bgpvpns = self.get_bgpvpns(
+            context,
+            filters={'project_id': list({network['project_id']
+                                         for network in networks.values()}),
+                     'type': [constants.BGPVPN_L3]},
+            fields=['id', 'project_id', 'routers'])
+        result = collections.defaultdict(list)
+        for port in router_ports:
+            network = networks[port['network_id']]
+            for bgpvpn in bgpvpns:
+                if (bgpvpn['project_id'] == network['project_id'] and
+                        port['device_id'] in bgpvpn['routers'] and
+                        bgpvpn['id'] not in result[network['id']]):
+                    result[network['id']].append(bgpvpn['id'])
+        return {net_id: ids for net_id, ids in result.items() if ids}
+
+    def get_routers_network_bgpvpns(self, context, routers):
+        """Find the L3 BGPVPNs associated to a network of some routers
+
+        Returns a dict mapping (router_id, network_id) tuples, for each of
+        the routers having an interface on a network associated to L3
+        BGPVPN(s) of the project of the router, to the ids of these BGPVPNs.
+
+        Drivers persisting BGPVPNs in a database are expected to override
+        this with a single query; this default relies on get_ports and
+        get_bgpvpns.
+        """
+        routers = {router['id']: router for router in routers}
+        router_ports = directory.get_plugin().get_ports(
+            context,
+            filters={'device_id': list(routers),
+                     'device_owner': [const.DEVICE_OWNER_ROUTER_INTF]},
+            fields=['network_id', 'device_id'])
+        if not router_ports:
+            return {}
+        bgpvpns = self.get_bgpvpns(
+            context,
+            filters={'project_id': list({router['project_id']
+                                         for router in routers.values()}),
+                     'type': [constants.BGPVPN_L3]},
+            fields=['id', 'project_id', 'networks'])
+        result = collections.defaultdict(list)
+        for port in router_ports:
+            router = routers[port['device_id']]
+            key = (router['id'], port['network_id'])
+            for bgpvpn in bgpvpns:
+                if (bgpvpn['project_id'] == router['project_id'] and
+                        port['network_id'] in bgpvpn['networks'] and
+                        bgpvpn['id'] not in result[key]):
+                    result[key].append(bgpvpn['id'])
+        return {key: ids for key, ids in result.items() if ids}
+
 
 class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
     """BGPVPNDriverDB Mixin to provision the database on behalf of the driver
@@ -98,20 +219,250 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
     the result to postcommit methods
     """
 
+    native_pagination_support = True
+    native_bulk_support = True
+    router_interface_check_support = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.bgpvpn_db = bgpvpn_db.BGPVPNPluginDb()
+        self._postcommit_executor = None
+        self._postcommit_executor_pid = None
+        self._postcommit_lock = threading.Lock()
+
+    def _get_postcommit_executor(self):
+        # threads do not survive the fork of the API workers, the executor
+        # is started by the process using it
+        with self._postcommit_lock:
+            if self._postcommit_executor_pid != os.getpid():
+                conf = cfg.CONF.bgpvpn
+                self._postcommit_executor = postcommit.PostcommitExecutor(
+                    conf.postcommit_workers, conf.postcommit_max_pending)
+                self._postcommit_executor_pid = os.getpid()
+                atexit.register(self.drain_postcommit,
+                                conf.postcommit_drain_timeout)
+            return self._postcommit_executor
+
+    def _run_postcommit(self, bgpvpn_id, hook, context, *args,
+                        coalesce_key=None, merge=None, journal_entry=None,
+                        **kwargs):
+        """Run a postcommit hook, in a worker if async_postcommit is set
+
+        The hooks relating to a same BGPVPN are run in order. journal_entry
+        is the journal entry recorded for the hook, if any.
+        """
+        if journal_entry is not None:
+            hook = functools.partial(self._run_journaled_postcommit,
+                                     bgpvpn_id, journal_entry, hook)
+            # each journal entry is deleted by the run of its own hook
+            coalesce_key = merge = None
+        if not cfg.CONF.bgpvpn.async_postcommit:
+            hook(context, *args, **kwargs)
+            return
+        # the hook is run once the request is answered, with a context of
+        # its own rather than one sharing the session of the request
+        context = n_context.Context.from_dict(context.to_dict())
+        self._get_postcommit_executor().submit(
+            bgpvpn_id, hook, context, *args,
+            coalesce_key=coalesce_key, merge=merge, **kwargs)
+
+    @staticmethod
+    def _merge_bgpvpn_updates(previous_args, previous_kwargs, args, kwargs):
+        # two updates of a BGPVPN pending in a row are run as a single one,
+        # from the state before the first one to the state after the second
+        context, _old_bgpvpn, new_bgpvpn = args
+        return (context, previous_args[1], new_bgpvpn), kwargs
+
+    def drain_postcommit(self, timeout=None):
+        """Run the pending postcommit hooks and stop the postcommit workers
+
+        Returns False if some hooks are still pending after timeout seconds.
+        """
+        with self._postcommit_lock:
+            executor = self._postcommit_executor
+            if executor is None or (self._postcommit_executor_pid !=
+                                    os.getpid()):
+                return True
+            self._postcommit_executor = None
+            self._postcommit_executor_pid = None
+        return executor.stop(timeout)
+
+    def _record_postcommit(self, context, bgpvpn_id, resource_id, operation,
+                           *args, **kwargs):
+        """Record a postcommit hook in the journal, if it is enabled
+
+        To be called in the transaction of the change the hook relates to,
+        returns the id and next attempt time of the journal entry.
+        """
+        if not cfg.CONF.bgpvpn.postcommit_journal:
+            return None
+        # the entry is left to the journal worker until the hook is run
+        # right after the commit
+        next_attempt_at = self._journal_next_attempt(0)
+        entry_id = self.bgpvpn_db.create_journal_entry(
+            context, bgpvpn_id, resource_id, operation, list(args), kwargs,
+            next_attempt_at)
+        return {'id': entry_id, 'next_attempt_at': next_attempt_at}
+
+    @staticmethod
+    def _journal_next_attempt(attempts):
+        conf = cfg.CONF.bgpvpn
+        delay = min(conf.journal_retry_interval * 2 ** attempts,
+                    conf.journal_max_retry_interval)
+        # as stored by the database, for claim_journal_entry to match it
+        return (timeutils.utcnow() +
+                datetime.timedelta(seconds=delay)).replace(microsecond=0)
+
+    def _run_journaled_postcommit(self, bgpvpn_id, journal_entry, hook,
+                                  context, *args, **kwargs):
+        admin_context = n_context.get_admin_context()
+        journal_id = journal_entry['id']
+        if self.bgpvpn_db.journal_has_older_entries(admin_context, bgpvpn_id,
+                                                    journal_id):
+            # the hooks of a BGPVPN are run in order, the journal worker
+            # will run this one after the ones which failed before
+            return
+        # the entry is leased as by the journal worker, so that it does not
+        # run the hook concurrently if it is run late
+        lease_until = timeutils.utcnow() + datetime.timedelta(
+            seconds=cfg.CONF.bgpvpn.journal_max_retry_interval)
+        if not self.bgpvpn_db.claim_journal_entry(
+                admin_context, journal_id, journal_entry['next_attempt_at'],
+                lease_until):
+            LOG.debug("Journal entry %s was claimed by the journal worker",
+                      journal_id)
+            return
+        try:
+            hook(context, *args, **kwargs)
+        except Exception as e:
+            LOG.exception("Postcommit hook %(hook)s for BGPVPN %(bgpvpn)s "
+                          "failed, it will be run again by the journal "
+                          "worker", {'hook': getattr(hook, '__name__', hook),
+                                     'bgpvpn': bgpvpn_id})
+            self.bgpvpn_db.journal_entries_failed(
+                admin_context, [journal_id], str(e),
+                self._journal_next_attempt(1))
+        else:
+            self.bgpvpn_db.delete_journal_entries(admin_context,
+                                                  [journal_id])
+
+    def get_workers(self):
+        if not cfg.CONF.bgpvpn.postcommit_journal:
+            return []
+        interval = cfg.CONF.bgpvpn.journal_retry_interval
+        return [neutron_worker.PeriodicWorker(self.replay_journal,
+                                              interval, interval,
+                                              desc='bgpvpn journal worker')]
+
+    def replay_journal(self):
+        """Run the postcommit hooks left in the journal
+
+        The hooks of a BGPVPN are run in the order they were recorded, a
+        failure postponing the following ones with an exponential backoff.
+        Hooks are run at least once: a hook may be run again if the
+        process running it stops before its journal entry is deleted.
+        """
+        try:
+            context = n_context.get_admin_context()
+            now = timeutils.utcnow()
+            entries = collections.defaultdict(list)
+            for entry in self.bgpvpn_db.get_journal_entries(
+                    context, cfg.CONF.bgpvpn.journal_batch_size):
+                entries[entry['bgpvpn_id']].append(entry)
+            for bgpvpn_entries in entries.values():
+                self._replay_bgpvpn_journal(context, bgpvpn_entries, now)
+        except Exception:
+            # not stopping the journal worker
+            LOG.exception("Error while replaying the BGPVPN journal")
+
+    def _replay_bgpvpn_journal(self, context, entries, now):
+        lease_until = now + datetime.timedelta(
+            seconds=cfg.CONF.bgpvpn.journal_max_retry_interval)
+        entries = collections.deque(entries)
+        while entries and entries[0]['next_attempt_at'] <= now:
+            batch = [entries.popleft()]
+            while (entries and entries[0]['next_attempt_at'] <= now and
+                   self._journal_entries_mergeable(batch[-1], entries[0])):
+                batch.append(entries.popleft())
+            entry_ids = [entry['id'] for entry in batch]
+            # another server may be replaying the same entries
+            if not self.bgpvpn_db.claim_journal_entries(context, entry_ids,
+                                                        now, lease_until):
+                return
+            args, kwargs = self._merge_journal_entries(batch)
+            try:
+                getattr(self, batch[0]['operation'])(context, *args,
+                                                     **kwargs)
+            except Exception as e:
+                LOG.exception("Postcommit hook %(hook)s for BGPVPN "
+                              "%(bgpvpn)s failed again",
+                              {'hook': batch[0]['operation'],
+                               'bgpvpn': batch[0]['bgpvpn_id']})
+                self.bgpvpn_db.journal_entries_failed(
+                    context, entry_ids, str(e),
+                    self._journal_next_attempt(batch[-1]['attempts'] + 1))
+                return
+            self.bgpvpn_db.delete_journal_entries(context, entry_ids)
+
+    @staticmethod
+    def _journal_entries_mergeable(entry, next_entry):
+        return (entry['operation'] in JOURNAL_MERGEABLE_OPERATIONS and
+                entry['operation'] == next_entry['operation'] and
+                entry['resource_id'] == next_entry['resource_id'])
+
+    @staticmethod
+    def _merge_journal_entries(entries):
+        if len(entries) == 1:
+            return entries[0]['args'], entries[0]['kwargs']
+        # the update hooks take the old and new state of the resource
+        old, new = entries[0]['args'][0], entries[-1]['args'][1]
+        kwargs = entries[-1]['kwargs']
+        if 'routes_diff' in kwargs:
+            kwargs = dict(kwargs, routes_diff=bgpvpn_db.port_assoc_routes_diff(
+                old['routes'], new['routes']))
+        return [old, new], kwargs
+
+    def postcommit_stats(self):
+        """Queue depth, latency and failure counters of the postcommit hooks
+
+        Returns None unless postcommit hooks are run asynchronously.
+        """
+        executor = self._postcommit_executor
+        if executor is None or self._postcommit_executor_pid != os.getpid():
+            return None
+        return executor.stats()
 
     def create_bgpvpn(self, context, bgpvpn):
         with db_api.CONTEXT_WRITER.using(context):
             bgpvpn = self.bgpvpn_db.create_bgpvpn(
                 context, bgpvpn)
             self.create_bgpvpn_precommit(context, bgpvpn)
-        self.create_bgpvpn_postcommit(context, bgpvpn)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn['id'], bgpvpn['id'],
+                'create_bgpvpn_postcommit', bgpvpn)
+        self._run_postcommit(bgpvpn['id'], self.create_bgpvpn_postcommit,
+                             context, bgpvpn, journal_entry=journal_entry)
         return bgpvpn
 
-    def get_bgpvpns(self, context, filters=None, fields=None):
-        return self.bgpvpn_db.get_bgpvpns(context, filters, fields)
+    def get_bgpvpns(self, context, filters=None, fields=None, sorts=None,
+                    limit=None, marker=None, page_reverse=False):
+        return self.bgpvpn_db.get_bgpvpns(context, filters, fields,
+                                          sorts=sorts, limit=limit,
+                                          marker=marker,
+                                          page_reverse=page_reverse)
+
+    def router_and_network_bound_to_bgpvpns(self, context, router_id,
+                                            network_id):
+        return self.bgpvpn_db.router_and_network_bound_to_bgpvpns(
+            context, router_id, network_id)
+
+    def get_networks_router_bgpvpns(self, context, networks):
+        return self.bgpvpn_db.get_networks_router_bgpvpns(
+            context, [network['id'] for network in networks])
+
+    def get_routers_network_bgpvpns(self, context, routers):
+        return self.bgpvpn_db.get_routers_network_bgpvpns(
+            context, [router['id'] for router in routers])
 
     def get_bgpvpn(self, context, id, fields=None):
         return self.bgpvpn_db.get_bgpvpn(context, id, fields)
@@ -123,7 +474,14 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
             new_bgpvpn.update(bgpvpn)
             self.update_bgpvpn_precommit(context, old_bgpvpn, new_bgpvpn)
             bgpvpn = self.bgpvpn_db.update_bgpvpn(context, id, bgpvpn)
-        self.update_bgpvpn_postcommit(context, old_bgpvpn, bgpvpn)
+            journal_entry = self._record_postcommit(
+                context, id, id,
+                'update_bgpvpn_postcommit', old_bgpvpn, bgpvpn)
+        self._run_postcommit(id, self.update_bgpvpn_postcommit,
+                             context, old_bgpvpn, bgpvpn,
+                             coalesce_key='update_bgpvpn',
+                             merge=self._merge_bgpvpn_updates,
+                             journal_entry=journal_entry)
         return bgpvpn
 
     def delete_bgpvpn(self, context, id):
@@ -131,7 +489,11 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
             bgpvpn = self.bgpvpn_db.get_bgpvpn(context, id)
             self.delete_bgpvpn_precommit(context, bgpvpn)
             self.bgpvpn_db.delete_bgpvpn(context, id)
-        self.delete_bgpvpn_postcommit(context, bgpvpn)
+            journal_entry = self._record_postcommit(
+                context, id, id,
+                'delete_bgpvpn_postcommit', bgpvpn)
+        self._run_postcommit(id, self.delete_bgpvpn_postcommit,
+                             context, bgpvpn, journal_entry=journal_entry)
 
     def create_net_assoc(self, context, bgpvpn_id, network_association):
         with db_api.CONTEXT_WRITER.using(context):
@@ -139,16 +501,38 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
                                                     bgpvpn_id,
                                                     network_association)
             self.create_net_assoc_precommit(context, assoc)
-        self.create_net_assoc_postcommit(context, assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc['id'],
+                'create_net_assoc_postcommit', assoc)
+        self._run_postcommit(bgpvpn_id, self.create_net_assoc_postcommit,
+                             context, assoc, journal_entry=journal_entry)
         return assoc
 
+    def create_net_assocs(self, context, bgpvpn_id, network_associations):
+        with db_api.CONTEXT_WRITER.using(context):
+            assocs = self.bgpvpn_db.create_net_assocs(context,
+                                                      bgpvpn_id,
+                                                      network_associations)
+            self.create_net_assocs_precommit(context, assocs)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, bgpvpn_id,
+                'create_net_assocs_postcommit', assocs)
+        self._run_postcommit(bgpvpn_id, self.create_net_assocs_postcommit,
+                             context, assocs, journal_entry=journal_entry)
+        return assocs
+
     def get_net_assoc(self, context, assoc_id, bgpvpn_id, fields=None):
         return self.bgpvpn_db.get_net_assoc(context, assoc_id, bgpvpn_id,
                                             fields)
 
-    def get_net_assocs(self, context, bgpvpn_id, filters=None, fields=None):
+    def get_net_assocs(self, context, bgpvpn_id, filters=None, fields=None,
+                       sorts=None, limit=None, marker=None,
+                       page_reverse=False):
         return self.bgpvpn_db.get_net_assocs(context, bgpvpn_id,
-                                             filters, fields)
+                                             filters, fields,
+                                             sorts=sorts, limit=limit,
+                                             marker=marker,
+                                             page_reverse=page_reverse)
 
     def delete_net_assoc(self, context, assoc_id, bgpvpn_id):
         with db_api.CONTEXT_WRITER.using(context):
@@ -160,23 +544,49 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
             self.bgpvpn_db.delete_net_assoc(context,
                                             assoc_id,
                                             bgpvpn_id)
-        self.delete_net_assoc_postcommit(context, net_assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc_id,
+                'delete_net_assoc_postcommit', net_assoc)
+        self._run_postcommit(bgpvpn_id, self.delete_net_assoc_postcommit,
+                             context, net_assoc, journal_entry=journal_entry)
 
     def create_router_assoc(self, context, bgpvpn_id, router_association):
         with db_api.CONTEXT_WRITER.using(context):
             assoc = self.bgpvpn_db.create_router_assoc(context, bgpvpn_id,
                                                        router_association)
             self.create_router_assoc_precommit(context, assoc)
-        self.create_router_assoc_postcommit(context, assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc['id'],
+                'create_router_assoc_postcommit', assoc)
+        self._run_postcommit(bgpvpn_id, self.create_router_assoc_postcommit,
+                             context, assoc, journal_entry=journal_entry)
         return assoc
 
+    def create_router_assocs(self, context, bgpvpn_id, router_associations):
+        with db_api.CONTEXT_WRITER.using(context):
+            assocs = self.bgpvpn_db.create_router_assocs(context, bgpvpn_id,
+                                                         router_associations)
+            self.create_router_assocs_precommit(context, assocs)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, bgpvpn_id,
+                'create_router_assocs_postcommit', assocs)
+        self._run_postcommit(bgpvpn_id,
+                             self.create_router_assocs_postcommit,
+                             context, assocs, journal_entry=journal_entry)
+        return assocs
+
     def get_router_assoc(self, context, assoc_id, bgpvpn_id, fields=None):
         return self.bgpvpn_db.get_router_assoc(context, assoc_id,
                                                bgpvpn_id, fields)
 
-    def get_router_assocs(self, context, bgpvpn_id, filters=None, fields=None):
+    def get_router_assocs(self, context, bgpvpn_id, filters=None, fields=None,
+                          sorts=None, limit=None, marker=None,
+                          page_reverse=False):
         return self.bgpvpn_db.get_router_assocs(context, bgpvpn_id,
-                                                filters, fields)
+                                                filters, fields,
+                                                sorts=sorts, limit=limit,
+                                                marker=marker,
+                                                page_reverse=page_reverse)
 
     def delete_router_assoc(self, context, assoc_id, bgpvpn_id):
         with db_api.CONTEXT_WRITER.using(context):
@@ -187,8 +597,12 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
             self.bgpvpn_db.delete_router_assoc(context,
                                                assoc_id,
                                                bgpvpn_id)
-
-        self.delete_router_assoc_postcommit(context, router_assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc_id,
+                'delete_router_assoc_postcommit', router_assoc)
+        self._run_postcommit(bgpvpn_id, self.delete_router_assoc_postcommit,
+                             context, router_assoc,
+                             journal_entry=journal_entry)
 
     @abc.abstractmethod
     def create_bgpvpn_postcommit(self, context, bgpvpn):
@@ -218,6 +632,17 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
     def create_net_assoc_postcommit(self, context, net_assoc):
         pass
 
+    # the hooks below are called for a batch of associations created at
+    # once, by default they call the hook of each association
+
+    def create_net_assocs_precommit(self, context, net_assocs):
+        for net_assoc in net_assocs:
+            self.create_net_assoc_precommit(context, net_assoc)
+
+    def create_net_assocs_postcommit(self, context, net_assocs):
+        for net_assoc in net_assocs:
+            self.create_net_assoc_postcommit(context, net_assoc)
+
     @abc.abstractmethod
     def delete_net_assoc_precommit(self, context, net_assoc):
         pass
@@ -234,6 +659,14 @@ class BGPVPNDriverDBMixin(BGPVPNDriverBase, metaclass=abc.ABCMeta):
     def create_router_assoc_postcommit(self, context, router_assoc):
         pass
 
+    def create_router_assocs_precommit(self, context, router_assocs):
+        for router_assoc in router_assocs:
+            self.create_router_assoc_precommit(context, router_assoc)
+
+    def create_router_assocs_postcommit(self, context, router_assocs):
+        for router_assoc in router_assocs:
+            self.create_router_assoc_postcommit(context, router_assoc)
+
     @abc.abstractmethod
     def delete_router_assoc_precommit(self, context, router_assoc):
         pass
@@ -343,8 +776,13 @@ class BGPVPNDriverRCDBMixin(BGPVPNDriverRCBase, BGPVPNDriverDBMixin,
                                                               router_assoc)
             self.update_router_assoc_precommit(context,
                                                old_router_assoc, router_assoc)
-        self.update_router_assoc_postcommit(context,
-                                            old_router_assoc, router_assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc_id,
+                'update_router_assoc_postcommit', old_router_assoc,
+                router_assoc)
+        self._run_postcommit(bgpvpn_id, self.update_router_assoc_postcommit,
+                             context, old_router_assoc, router_assoc,
+                             journal_entry=journal_entry)
         return router_assoc
 
     @abc.abstractmethod
@@ -362,7 +800,11 @@ class BGPVPNDriverRCDBMixin(BGPVPNDriverRCBase, BGPVPNDriverDBMixin,
             port_assoc = self.bgpvpn_db.create_port_assoc(context, bgpvpn_id,
                                                           port_association)
             self.create_port_assoc_precommit(context, port_assoc)
-        self.create_port_assoc_postcommit(context, port_assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, port_assoc['id'],
+                'create_port_assoc_postcommit', port_assoc)
+        self._run_postcommit(bgpvpn_id, self.create_port_assoc_postcommit,
+                             context, port_assoc, journal_entry=journal_entry)
         return port_assoc
 
     @abc.abstractmethod
@@ -373,13 +815,38 @@ class BGPVPNDriverRCDBMixin(BGPVPNDriverRCBase, BGPVPNDriverDBMixin,
     def create_port_assoc_postcommit(self, context, port_assoc):
         pass
 
+    def create_port_assocs(self, context, bgpvpn_id, port_associations):
+        with db_api.CONTEXT_WRITER.using(context):
+            assocs = self.bgpvpn_db.create_port_assocs(context, bgpvpn_id,
+                                                       port_associations)
+            self.create_port_assocs_precommit(context, assocs)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, bgpvpn_id,
+                'create_port_assocs_postcommit', assocs)
+        self._run_postcommit(bgpvpn_id, self.create_port_assocs_postcommit,
+                             context, assocs, journal_entry=journal_entry)
+        return assocs
+
+    def create_port_assocs_precommit(self, context, port_assocs):
+        for port_assoc in port_assocs:
+            self.create_port_assoc_precommit(context, port_assoc)
+
+    def create_port_assocs_postcommit(self, context, port_assocs):
+        for port_assoc in port_assocs:
+            self.create_port_assoc_postcommit(context, port_assoc)
+
     def get_port_assoc(self, context, assoc_id, bgpvpn_id, fields=None):
         return self.bgpvpn_db.get_port_assoc(context, assoc_id,
                                              bgpvpn_id, fields)
 
-    def get_port_assocs(self, context, bgpvpn_id, filters=None, fields=None):
+    def get_port_assocs(self, context, bgpvpn_id, filters=None, fields=None,
+                        sorts=None, limit=None, marker=None,
+                        page_reverse=False):
         return self.bgpvpn_db.get_port_assocs(context, bgpvpn_id,
-                                              filters, fields)
+                                              filters, fields,
+                                              sorts=sorts, limit=limit,
+                                              marker=marker,
+                                              page_reverse=page_reverse)
 
     def update_port_assoc(self, context, assoc_id, bgpvpn_id, port_assoc):
         old_port_assoc = self.get_port_assoc(context, assoc_id, bgpvpn_id)
@@ -387,20 +854,51 @@ class BGPVPNDriverRCDBMixin(BGPVPNDriverRCBase, BGPVPNDriverDBMixin,
             port_assoc = self.bgpvpn_db.update_port_assoc(context, assoc_id,
                                                           bgpvpn_id,
                                                           port_assoc)
-            self.update_port_assoc_precommit(context,
-                                             old_port_assoc, port_assoc)
-        self.update_port_assoc_postcommit(context,
-                                          old_port_assoc, port_assoc)
+            routes_diff = bgpvpn_db.port_assoc_routes_diff(
+                old_port_assoc['routes'], port_assoc['routes'])
+            self.update_port_assoc_precommit(
+                context, old_port_assoc, port_assoc,
+                **self._routes_diff_kwargs(self.update_port_assoc_precommit,
+                                           routes_diff))
+            postcommit_kwargs = self._routes_diff_kwargs(
+                self.update_port_assoc_postcommit, routes_diff)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc_id,
+                'update_port_assoc_postcommit', old_port_assoc, port_assoc,
+                **postcommit_kwargs)
+        self._run_postcommit(bgpvpn_id, self.update_port_assoc_postcommit,
+                             context, old_port_assoc, port_assoc,
+                             journal_entry=journal_entry, **postcommit_kwargs)
         return port_assoc
 
+    @staticmethod
+    def _routes_diff_kwargs(hook, routes_diff):
+        """Keyword arguments giving routes_diff to a hook accepting it"""
+        parameters = inspect.signature(hook).parameters.values()
+        if any(parameter.name == 'routes_diff' or
+               parameter.kind == parameter.VAR_KEYWORD
+               for parameter in parameters):
+            return {'routes_diff': routes_diff}
+        versionutils.report_deprecated_feature(
+            LOG, "%(hook)s of %(driver)s does not accept the routes_diff "
+                 "keyword argument, it will be required in a future "
+                 "release" % {'hook': hook.__name__,
+                              'driver': type(hook.__self__).__name__})
+        return {}
+
+    # routes_diff is a dict with the 'added' and 'removed' routes, allowing
+    # drivers to only process the routes which changed
+
     @abc.abstractmethod
     def update_port_assoc_precommit(self, context,
-                                    old_port_assoc, port_assoc):
+                                    old_port_assoc, port_assoc,
+                                    routes_diff=None):
         pass
 
     @abc.abstractmethod
     def update_port_assoc_postcommit(self, context,
-                                     old_port_assoc, port_assoc):
+                                     old_port_assoc, port_assoc,
+                                     routes_diff=None):
         pass
 
     def delete_port_assoc(self, context, assoc_id, bgpvpn_id):
@@ -412,7 +910,11 @@ class BGPVPNDriverRCDBMixin(BGPVPNDriverRCBase, BGPVPNDriverDBMixin,
             self.bgpvpn_db.delete_port_assoc(context,
                                              assoc_id,
                                              bgpvpn_id)
-        self.delete_port_assoc_postcommit(context, port_assoc)
+            journal_entry = self._record_postcommit(
+                context, bgpvpn_id, assoc_id,
+                'delete_port_assoc_postcommit', port_assoc)
+        self._run_postcommit(bgpvpn_id, self.delete_port_assoc_postcommit,
+                             context, port_assoc, journal_entry=journal_entry)
 
     @abc.abstractmethod
     def delete_port_assoc_precommit(self, context, port_assoc):
@@ -441,11 +943,13 @@ class BGPVPNDriverRC(BGPVPNDriverRCDBMixin, BGPVPNDriver):
         pass
 
     def update_port_assoc_precommit(self, context,
-                                    old_port_assoc, port_assoc):
+                                    old_port_assoc, port_assoc,
+                                    routes_diff=None):
         pass
 
     def update_port_assoc_postcommit(self, context,
-                                     old_port_assoc, port_assoc):
+                                     old_port_assoc, port_assoc,
+                                     routes_diff=None):
         pass
 
     def delete_port_assoc_precommit(self, context, port_assoc):
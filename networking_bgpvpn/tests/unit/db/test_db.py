@@ -13,10 +13,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import datetime
+from unittest import mock
+
 from neutron_lib.api.definitions import bgpvpn_routes_control as bgpvpn_rc_def
 from neutron_lib.api.definitions import bgpvpn_vni as bgpvpn_vni_def
 from neutron_lib import context
+from neutron_lib.db import api as db_api
+from oslo_utils import timeutils
 
+from networking_bgpvpn.neutron.db import bgpvpn_db
 from networking_bgpvpn.neutron.db.bgpvpn_db import BGPVPNPluginDb
 from networking_bgpvpn.neutron.extensions.bgpvpn \
     import BGPVPNNetAssocAlreadyExists
@@ -235,6 +241,34 @@ class BgpvpnDBTestCase(test_plugin.BgpvpnTestCaseMixin):
                                   id, {'project_id': self._project_id,
                                        'network_id': net_id})
 
+    def test_db_create_net_assocs(self):
+        with self.network() as net1, \
+                self.network() as net2, \
+                self.network() as net3, \
+                self.bgpvpn() as bgpvpn:
+            id = bgpvpn['bgpvpn']['id']
+            net_ids = [net['network']['id'] for net in (net1, net2, net3)]
+
+            assocs = self.plugin_db.create_net_assocs(
+                self.ctx, id,
+                [{'project_id': self._project_id, 'network_id': net_id}
+                 for net_id in net_ids[:2]])
+            self.assertEqual(net_ids[:2],
+                             [assoc['network_id'] for assoc in assocs])
+            self.assertCountEqual(
+                assocs, self.plugin_db.get_net_assocs(self.ctx, id))
+
+            # a network already associated, or twice in the same batch
+            for batch in (net_ids[1:], [net_ids[2], net_ids[2]]):
+                self.assertRaises(BGPVPNNetAssocAlreadyExists,
+                                  self.plugin_db.create_net_assocs,
+                                  self.ctx, id,
+                                  [{'project_id': self._project_id,
+                                    'network_id': net_id}
+                                   for net_id in batch])
+            bgpvpn = self.plugin_db.get_bgpvpn(self.ctx, id)
+            self.assertCountEqual(net_ids[:2], bgpvpn['networks'])
+
     def test_db_find_bgpvpn_for_associated_network(self):
         with self.network() as net, \
                 self.bgpvpn(type=constants.BGPVPN_L2) as bgpvpn_l2, \
@@ -310,6 +344,120 @@ class BgpvpnDBTestCase(test_plugin.BgpvpnTestCaseMixin):
                     )
                     self.assertEqual(id, bgpvpn_list[0]['id'])
 
+    def test_db_get_networks_routers_bgpvpns(self):
+        with self.network() as net, \
+                self.subnet(network=net) as subnet, \
+                self.network() as other_net, \
+                self.router(project_id=self._project_id) as router, \
+                self.bgpvpn() as bgpvpn_l3, \
+                self.bgpvpn(type=constants.BGPVPN_L2) as bgpvpn_l2:
+            net_id = net['network']['id']
+            router_id = router['router']['id']
+            l3_id = bgpvpn_l3['bgpvpn']['id']
+            l2_id = bgpvpn_l2['bgpvpn']['id']
+            self._router_interface_action('add', router_id,
+                                          subnet['subnet']['id'], None)
+            self.assertEqual({}, self.plugin_db.get_networks_router_bgpvpns(
+                self.ctx, [net_id, other_net['network']['id']]))
+            self.assertEqual({}, self.plugin_db.get_routers_network_bgpvpns(
+                self.ctx, [router_id]))
+
+            with self.assoc_router(l3_id, router_id):
+                self.assertEqual(
+                    {net_id: [l3_id]},
+                    self.plugin_db.get_networks_router_bgpvpns(
+                        self.ctx, [net_id, other_net['network']['id']]))
+
+            # only associations to L3 BGPVPNs are reported
+            with self.assoc_net(l2_id, net_id):
+                self.assertEqual(
+                    {}, self.plugin_db.get_routers_network_bgpvpns(
+                        self.ctx, [router_id]))
+                with self.assoc_net(l3_id, net_id):
+                    self.assertEqual(
+                        {(router_id, net_id): [l3_id]},
+                        self.plugin_db.get_routers_network_bgpvpns(
+                            self.ctx, [router_id]))
+
+    def test_db_router_and_network_bound_to_bgpvpns(self):
+        with self.network() as net, \
+                self.router(project_id=self._project_id) as router, \
+                self.bgpvpn() as bgpvpn_l3, \
+                self.bgpvpn(type=constants.BGPVPN_L2) as bgpvpn_l2:
+            net_id = net['network']['id']
+            router_id = router['router']['id']
+            l3_id = bgpvpn_l3['bgpvpn']['id']
+
+            def bound():
+                return self.plugin_db.router_and_network_bound_to_bgpvpns(
+                    self.ctx, router_id, net_id)
+
+            self.assertFalse(bound())
+            with self.assoc_router(l3_id, router_id):
+                self.assertFalse(bound())
+                with self.assoc_net(bgpvpn_l2['bgpvpn']['id'], net_id):
+                    self.assertFalse(bound())
+                with self.assoc_net(l3_id, net_id):
+                    self.assertTrue(bound())
+            with self.assoc_net(l3_id, net_id):
+                self.assertFalse(bound())
+
+    def test_db_journal(self):
+        now = timeutils.utcnow()
+        later = now + datetime.timedelta(seconds=60)
+        entry_ids = [
+            self.plugin_db.create_journal_entry(
+                self.ctx, 'bgpvpn-1', 'assoc-%d' % i,
+                'create_net_assoc_postcommit', [{'id': 'assoc-%d' % i}], {},
+                now)
+            for i in range(2)]
+        other_id = self.plugin_db.create_journal_entry(
+            self.ctx, 'bgpvpn-2', 'bgpvpn-2', 'update_bgpvpn_postcommit',
+            [{'name': 'a'}, {'name': 'b'}], {}, later)
+
+        entries = self.plugin_db.get_journal_entries(self.ctx)
+        self.assertEqual(entry_ids + [other_id],
+                         [entry['id'] for entry in entries])
+        self.assertEqual([{'id': 'assoc-0'}], entries[0]['args'])
+        self.assertEqual({}, entries[0]['kwargs'])
+        self.assertEqual(2, len(self.plugin_db.get_journal_entries(self.ctx,
+                                                                   2)))
+        self.assertFalse(self.plugin_db.journal_has_older_entries(
+            self.ctx, 'bgpvpn-1', entry_ids[0]))
+        self.assertTrue(self.plugin_db.journal_has_older_entries(
+            self.ctx, 'bgpvpn-1', entry_ids[1]))
+        self.assertFalse(self.plugin_db.journal_has_older_entries(
+            self.ctx, 'bgpvpn-2', other_id))
+
+        # only due entries can be claimed, and only once
+        self.assertFalse(self.plugin_db.claim_journal_entries(
+            self.ctx, [entry_ids[0], other_id], now, later))
+        self.assertTrue(self.plugin_db.claim_journal_entries(
+            self.ctx, [entry_ids[1]], now, later))
+        self.assertFalse(self.plugin_db.claim_journal_entries(
+            self.ctx, [entry_ids[1]], now, later))
+
+        self.plugin_db.journal_entries_failed(self.ctx, [entry_ids[0]],
+                                              'boom', later)
+        entry = self.plugin_db.get_journal_entries(self.ctx, 1)[0]
+        self.assertEqual(1, entry['attempts'])
+        self.assertEqual('boom', entry['last_error'])
+        self.assertEqual(later.replace(microsecond=0),
+                         entry['next_attempt_at'].replace(microsecond=0))
+
+        # an entry is claimed by its own run only if it is not claimed yet
+        lease_until = later + datetime.timedelta(seconds=60)
+        self.assertFalse(self.plugin_db.claim_journal_entry(
+            self.ctx, entry_ids[0], now, lease_until))
+        self.assertTrue(self.plugin_db.claim_journal_entry(
+            self.ctx, entry_ids[0], entry['next_attempt_at'], lease_until))
+        self.assertFalse(self.plugin_db.claim_journal_entry(
+            self.ctx, entry_ids[0], entry['next_attempt_at'], lease_until))
+
+        self.plugin_db.delete_journal_entries(self.ctx,
+                                              entry_ids + [other_id])
+        self.assertEqual([], self.plugin_db.get_journal_entries(self.ctx))
+
     def test_db_delete_router(self):
         with self.bgpvpn() as bgpvpn:
             id = bgpvpn['bgpvpn']['id']
@@ -415,6 +563,241 @@ class BgpvpnDBTestCase(test_plugin.BgpvpnTestCaseMixin):
             self.assertIn(bgpvpn2['bgpvpn']['id'], bgpvpn_id_list)
             self.assertNotIn(bgpvpn3['bgpvpn']['id'], bgpvpn_id_list)
 
+    def test_db_list_bgpvpn_filtering_associated_ports(self):
+        with self.port(project_id=self._project_id) as port1, \
+                self.port(project_id=self._project_id) as port2, \
+                self.bgpvpn() as bgpvpn1, \
+                self.bgpvpn() as bgpvpn2, \
+                self.assoc_port(bgpvpn1['bgpvpn']['id'],
+                                port1['port']['id']), \
+                self.assoc_port(bgpvpn1['bgpvpn']['id'],
+                                port2['port']['id']), \
+                self.assoc_port(bgpvpn2['bgpvpn']['id'],
+                                port2['port']['id']):
+            bgpvpn_id_list = _id_list(
+                self.plugin_db.get_bgpvpns(
+                    self.ctx,
+                    filters={
+                        'ports': [port1['port']['id']],
+                    },
+                )
+            )
+            self.assertEqual([bgpvpn1['bgpvpn']['id']], bgpvpn_id_list)
+
+            # a BGPVPN with several matching associations is listed once
+            bgpvpn_id_list = _id_list(
+                self.plugin_db.get_bgpvpns(
+                    self.ctx,
+                    filters={
+                        'ports': [port1['port']['id'], port2['port']['id']],
+                    },
+                )
+            )
+            self.assertCountEqual([bgpvpn1['bgpvpn']['id'],
+                                   bgpvpn2['bgpvpn']['id']],
+                                  bgpvpn_id_list)
+
+    def test_db_list_bgpvpns_with_associations(self):
+        with self.network() as network1, \
+                self.network() as network2, \
+                self.router(project_id=self._project_id) as router, \
+                self.port(project_id=self._project_id) as port, \
+                self.bgpvpn() as bgpvpn1, \
+                self.bgpvpn() as bgpvpn2, \
+                self.bgpvpn() as bgpvpn3, \
+                self.assoc_net(bgpvpn1['bgpvpn']['id'],
+                               network1['network']['id']), \
+                self.assoc_net(bgpvpn1['bgpvpn']['id'],
+                               network2['network']['id']), \
+                self.assoc_router(bgpvpn2['bgpvpn']['id'],
+                                  router['router']['id']), \
+                self.assoc_port(bgpvpn2['bgpvpn']['id'],
+                                port['port']['id']):
+            bgpvpns = {bgpvpn['id']: bgpvpn
+                       for bgpvpn in self.plugin_db.get_bgpvpns(self.ctx)}
+
+            bgpvpn = bgpvpns[bgpvpn1['bgpvpn']['id']]
+            self.assertCountEqual([network1['network']['id'],
+                                   network2['network']['id']],
+                                  bgpvpn['networks'])
+            self.assertEqual([], bgpvpn['routers'])
+            self.assertEqual([], bgpvpn['ports'])
+
+            bgpvpn = bgpvpns[bgpvpn2['bgpvpn']['id']]
+            self.assertEqual([], bgpvpn['networks'])
+            self.assertEqual([router['router']['id']], bgpvpn['routers'])
+            self.assertEqual([port['port']['id']], bgpvpn['ports'])
+
+            bgpvpn = bgpvpns[bgpvpn3['bgpvpn']['id']]
+            self.assertEqual([], bgpvpn['networks'])
+            self.assertEqual([], bgpvpn['routers'])
+            self.assertEqual([], bgpvpn['ports'])
+
+    def test_db_get_bgpvpns_with_fields(self):
+        with self.network() as net, \
+                self.bgpvpn(route_targets=['64512:1', '64512:2']) as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               net['network']['id']), \
+                mock.patch.object(
+                    self.plugin_db, '_get_bgpvpns_associations',
+                    wraps=self.plugin_db._get_bgpvpns_associations) \
+                as mock_get_assocs:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+
+            bgpvpns = self.plugin_db.get_bgpvpns(self.ctx,
+                                                 fields=['id', 'name'])
+            self.assertEqual([{'id': bgpvpn_id,
+                               'name': bgpvpn['bgpvpn']['name']}],
+                             bgpvpns)
+            mock_get_assocs.assert_not_called()
+
+            bgpvpns = self.plugin_db.get_bgpvpns(
+                self.ctx, fields=['route_targets', 'networks'])
+            self.assertEqual([{'route_targets': ['64512:1', '64512:2'],
+                               'networks': [net['network']['id']]}],
+                             bgpvpns)
+            mock_get_assocs.assert_called_once()
+
+            bgpvpn = self.plugin_db.get_bgpvpn(self.ctx, bgpvpn_id,
+                                               fields=['type', 'routers'])
+            self.assertEqual({'type': 'l3', 'routers': []}, bgpvpn)
+
+            self.assertRaises(BGPVPNNotFound,
+                              self.plugin_db.get_bgpvpn,
+                              self.ctx, 'bogus_bgpvpn_id', fields=['id'])
+
+    def test_db_get_bgpvpn_cached(self):
+        with self.network() as net, \
+                self.bgpvpn(do_delete=False,
+                            route_targets=['64512:1']) as bgpvpn:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+
+            with mock.patch.object(
+                    self.plugin_db, '_make_bgpvpn_dict',
+                    wraps=self.plugin_db._make_bgpvpn_dict) as mock_make:
+                bgpvpn = self.plugin_db.get_bgpvpn(self.ctx, bgpvpn_id)
+                mock_make.assert_called_once()
+                mock_make.reset_mock()
+
+                # not built again, but the associations are up to date
+                with self.assoc_net(bgpvpn_id, net['network']['id']):
+                    bgpvpn2 = self.plugin_db.get_bgpvpn(self.ctx, bgpvpn_id)
+                    mock_make.assert_not_called()
+                    self.assertEqual([net['network']['id']],
+                                     bgpvpn2['networks'])
+                    bgpvpn2['networks'] = []
+                    self.assertEqual(bgpvpn, bgpvpn2)
+
+                    # modifying the returned dict does not alter the cache
+                    bgpvpn2['route_targets'].append('64512:2')
+                    self.assertEqual(
+                        {'route_targets': ['64512:1']},
+                        self.plugin_db.get_bgpvpn(self.ctx, bgpvpn_id,
+                                                  fields=['route_targets']))
+
+                # an update invalidates the cached dict
+                self.plugin_db.update_bgpvpn(self.ctx, bgpvpn_id,
+                                             {'name': 'foo'})
+                mock_make.reset_mock()
+                bgpvpn = self.plugin_db.get_bgpvpn(self.ctx, bgpvpn_id)
+                mock_make.assert_called_once()
+                self.assertEqual('foo', bgpvpn['name'])
+
+            self.plugin_db.delete_bgpvpn(self.ctx, bgpvpn_id)
+            self.assertRaises(BGPVPNNotFound,
+                              self.plugin_db.get_bgpvpn,
+                              self.ctx, bgpvpn_id)
+            stats = self.plugin_db.get_bgpvpn_cache_stats()
+            self.assertGreater(stats['hits'], 0)
+            self.assertGreater(stats['misses'], 0)
+
+    def test_db_list_bgpvpn_filtering_route_targets(self):
+        with self.bgpvpn(route_targets=['64512:1', '64512:2']) as bgpvpn1, \
+                self.bgpvpn(route_targets=['64512:2'],
+                            import_targets=['64512:42']) as bgpvpn2:
+            bgpvpn1_id = bgpvpn1['bgpvpn']['id']
+            bgpvpn2_id = bgpvpn2['bgpvpn']['id']
+
+            bgpvpn_id_list = _id_list(self.plugin_db.get_bgpvpns(
+                self.ctx, filters={'route_targets': ['64512:1']}))
+            self.assertEqual([bgpvpn1_id], bgpvpn_id_list)
+
+            bgpvpn_id_list = _id_list(self.plugin_db.get_bgpvpns(
+                self.ctx, filters={'route_targets': ['64512:2']}))
+            self.assertCountEqual([bgpvpn1_id, bgpvpn2_id], bgpvpn_id_list)
+
+            bgpvpn_id_list = _id_list(self.plugin_db.get_bgpvpns(
+                self.ctx, filters={'import_targets': ['64512:42']}))
+            self.assertEqual([bgpvpn2_id], bgpvpn_id_list)
+
+            bgpvpn_id_list = _id_list(self.plugin_db.get_bgpvpns(
+                self.ctx, filters={'route_targets': ['64512:42']}))
+            self.assertEqual([], bgpvpn_id_list)
+
+            self.plugin_db.update_bgpvpn(self.ctx, bgpvpn1_id,
+                                         {'route_targets': ['64512:3']})
+
+            bgpvpn_id_list = _id_list(self.plugin_db.get_bgpvpns(
+                self.ctx, filters={'route_targets': ['64512:1', '64512:3']}))
+            self.assertEqual([bgpvpn1_id], bgpvpn_id_list)
+
+            bgpvpn_id_list = _id_list(self.plugin_db.get_bgpvpns(
+                self.ctx, filters={'route_targets': ['64512:2']}))
+            self.assertEqual([bgpvpn2_id], bgpvpn_id_list)
+
+    def test_db_list_bgpvpns_paginated(self):
+        with self.bgpvpn(name='bgpvpn-a') as bgpvpn_a, \
+                self.bgpvpn(name='bgpvpn-b') as bgpvpn_b, \
+                self.bgpvpn(name='bgpvpn-c') as bgpvpn_c:
+            ids = [bgpvpn['bgpvpn']['id']
+                   for bgpvpn in (bgpvpn_a, bgpvpn_b, bgpvpn_c)]
+            sorts = [('name', True)]
+
+            bgpvpns = self.plugin_db.get_bgpvpns(self.ctx, sorts=sorts,
+                                                 limit=2)
+            self.assertEqual(ids[:2], _id_list(bgpvpns))
+
+            bgpvpns = self.plugin_db.get_bgpvpns(self.ctx, sorts=sorts,
+                                                 limit=2, marker=ids[1])
+            self.assertEqual(ids[2:], _id_list(bgpvpns))
+
+            bgpvpns = self.plugin_db.get_bgpvpns(self.ctx, sorts=sorts,
+                                                 limit=2, marker=ids[2],
+                                                 page_reverse=True)
+            self.assertEqual(ids[:2], _id_list(bgpvpns))
+
+            bgpvpns = self.plugin_db.get_bgpvpns(self.ctx,
+                                                 fields=['id', 'networks'],
+                                                 sorts=[('name', False)],
+                                                 limit=1, marker=ids[2])
+            self.assertEqual([{'id': ids[1], 'networks': []}], bgpvpns)
+
+    def test_db_list_port_assocs_paginated(self):
+        with self.port(project_id=self._project_id) as port1, \
+                self.port(project_id=self._project_id) as port2, \
+                self.port(project_id=self._project_id) as port3, \
+                self.bgpvpn() as bgpvpn, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port1['port']['id']) as assoc1, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port2['port']['id']) as assoc2, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port3['port']['id']) as assoc3:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            assoc_ids = sorted(assoc['port_association']['id']
+                               for assoc in (assoc1, assoc2, assoc3))
+
+            sorts = [('id', True)]
+
+            assocs = self.plugin_db.get_port_assocs(self.ctx, bgpvpn_id,
+                                                    sorts=sorts, limit=2)
+            self.assertEqual(assoc_ids[:2], _id_list(assocs))
+
+            assocs = self.plugin_db.get_port_assocs(self.ctx, bgpvpn_id,
+                                                    sorts=sorts, limit=2,
+                                                    marker=assoc_ids[1])
+            self.assertEqual(assoc_ids[2:], _id_list(assocs))
+
     def test_db_associate_disassociate_port(self):
         with self.port(project_id=self._project_id) as port, \
                 self.bgpvpn() as bgpvpn:
@@ -479,6 +862,66 @@ class BgpvpnDBTestCase(test_plugin.BgpvpnTestCaseMixin):
             )
             self.assertEqual(0, len(res['port_association']['routes']))
 
+    def test_db_update_port_association_routes_diff(self):
+        ROUTE_A = {'type': 'prefix',
+                   'prefix': '12.1.0.0/16',
+                   'local_pref': 50}
+        ROUTE_B = {'type': 'prefix',
+                   'prefix': '14.0.0.0/8',
+                   'local_pref': 200}
+        ROUTE_Bbis = {'type': 'prefix',
+                      'prefix': '14.0.0.0/8',
+                      'local_pref': 100}
+
+        with self.port(project_id=self._project_id) as port, \
+                self.bgpvpn() as bgpvpn, \
+                self.bgpvpn() as bgpvpn2, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port['port']['id'],
+                                routes=[ROUTE_A, ROUTE_B]) as port_assoc:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            assoc_id = port_assoc['port_association']['id']
+            ROUTE_C = {'type': 'bgpvpn',
+                       'bgpvpn_id': bgpvpn2['bgpvpn']['id'],
+                       'local_pref': None}
+
+            def route_ids():
+                with db_api.CONTEXT_READER.using(self.ctx):
+                    port_assoc_db = self.plugin_db._get_port_assoc(
+                        self.ctx, assoc_id, bgpvpn_id)
+                    return {route_db.prefix or route_db.bgpvpn_id:
+                            route_db.id for route_db in port_assoc_db.routes}
+
+            ids_before = route_ids()
+            old_assoc = self.plugin_db.get_port_assoc(self.ctx, assoc_id,
+                                                      bgpvpn_id)
+            update = {'routes': [ROUTE_A, ROUTE_Bbis, ROUTE_C]}
+            new_assoc = self.plugin_db.update_port_assoc(
+                self.ctx, assoc_id, bgpvpn_id, update)
+            # the dict of the caller is left untouched
+            self.assertEqual({'routes': [ROUTE_A, ROUTE_Bbis, ROUTE_C]},
+                             update)
+            self.assertCountEqual([ROUTE_A, ROUTE_Bbis, ROUTE_C],
+                                  new_assoc['routes'])
+            # the row of the unchanged route was kept
+            self.assertEqual(ids_before['12.1.0.0/16'],
+                             route_ids()['12.1.0.0/16'])
+            self.assertNotEqual(ids_before['14.0.0.0/8'],
+                                route_ids()['14.0.0.0/8'])
+
+            routes_diff = bgpvpn_db.port_assoc_routes_diff(
+                old_assoc['routes'], new_assoc['routes'])
+            self.assertCountEqual([ROUTE_Bbis, ROUTE_C],
+                                  routes_diff['added'])
+            self.assertEqual([ROUTE_B], routes_diff['removed'])
+
+            # routes are left untouched if not updated
+            new_assoc = self.plugin_db.update_port_assoc(
+                self.ctx, assoc_id, bgpvpn_id, {'advertise_fixed_ips': False})
+            self.assertFalse(new_assoc['advertise_fixed_ips'])
+            self.assertCountEqual([ROUTE_A, ROUTE_Bbis, ROUTE_C],
+                                  new_assoc['routes'])
+
 
 class BgpvpnDBTestCaseWithVNI(BgpvpnDBTestCase):
 
@@ -19,6 +19,7 @@ from unittest import mock
 import webob.exc
 
 from oslo_config import cfg
+from oslo_utils import timeutils
 
 from neutron.api.rpc.handlers import resources_rpc
 from neutron.db import agents_db
@@ -34,6 +35,12 @@ from neutron_lib import context as n_context
 from neutron_lib.plugins import directory
 
 from networking_bgpvpn.neutron.services.service_drivers.bagpipe import bagpipe
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import bagpipe_v2
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import host_push
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import rpc_batch
 from networking_bgpvpn.tests.unit.services import test_plugin
 
 from networking_bagpipe.objects import bgpvpn as objs
@@ -58,8 +65,8 @@ class TestBagpipeCommon(test_plugin.BgpvpnTestCaseMixin):
               driver=('networking_bgpvpn.neutron.services.service_drivers.'
                       'bagpipe.bagpipe.BaGPipeBGPVPNDriver')):
         self.mocked_rpc = mock.patch(
-            'networking_bagpipe.agent.bgpvpn.rpc_client'
-            '.BGPVPNAgentNotifyApi').start().return_value
+            'networking_bgpvpn.neutron.services.service_drivers.bagpipe.'
+            'rpc_batch.BGPVPNAgentNotifyApi').start().return_value
 
         self.mock_attach_rpc = self.mocked_rpc.attach_port_on_bgpvpn
         self.mock_detach_rpc = self.mocked_rpc.detach_port_from_bgpvpn
@@ -331,6 +338,65 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                         mock.ANY,
                         _expected_formatted_bgpvpn(id, net_id, rt))
 
+    def _create_assocs_bulk(self, bgpvpn_id, collection, assocs):
+        req = self.new_create_request(
+            'bgpvpn/bgpvpns',
+            data={collection: [{collection[:-1]: dict(
+                assoc, project_id=self._project_id)} for assoc in assocs]},
+            fmt='json',
+            id=bgpvpn_id,
+            subresource=collection,
+            as_admin=True)
+        res = req.get_response(self.ext_api)
+        self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+
+    def test_bagpipe_associate_nets_bulk(self):
+        with self.port() as port1, \
+                self.port() as port2, \
+                self.network() as net3, \
+                self.bgpvpn() as bgpvpn:
+            id = bgpvpn['bgpvpn']['id']
+            rt = bgpvpn['bgpvpn']['route_targets']
+            net_ids = [port1['port']['network_id'],
+                       port2['port']['network_id']]
+            self.mock_update_rpc.reset_mock()
+            self._create_assocs_bulk(
+                id, 'network_associations',
+                [{'network_id': net_id}
+                 for net_id in net_ids + [net3['network']['id']]])
+            # the network without ports is left out
+            self.mock_update_rpc.assert_has_calls(
+                [mock.call(mock.ANY, _expected_formatted_bgpvpn(id, net_id,
+                                                                rt))
+                 for net_id in net_ids], any_order=True)
+            self.assertEqual(2, self.mock_update_rpc.call_count)
+
+    def test_bagpipe_associate_routers_bulk(self):
+        with self.router(project_id=self._project_id) as router1, \
+                self.router(project_id=self._project_id) as router2, \
+                self.subnet(cidr='10.0.1.0/24') as subnet1, \
+                self.subnet(cidr='10.0.2.0/24') as subnet2, \
+                self.port(subnet=subnet1), \
+                self.port(subnet=subnet2), \
+                self.bgpvpn() as bgpvpn:
+            for router, subnet in ((router1, subnet1), (router2, subnet2)):
+                self._router_interface_action('add',
+                                              router['router']['id'],
+                                              subnet['subnet']['id'],
+                                              None)
+            id = bgpvpn['bgpvpn']['id']
+            rt = bgpvpn['bgpvpn']['route_targets']
+            self.mock_update_rpc.reset_mock()
+            self._create_assocs_bulk(
+                id, 'router_associations',
+                [{'router_id': router['router']['id']}
+                 for router in (router1, router2)])
+            self.mock_update_rpc.assert_has_calls(
+                [mock.call(mock.ANY, _expected_formatted_bgpvpn(
+                    id, subnet['subnet']['network_id'], rt))
+                 for subnet in (subnet1, subnet2)], any_order=True)
+            self.assertEqual(2, self.mock_update_rpc.call_count)
+
     def test_bagpipe_associate_external_net_failed(self):
         net_id = self.external_net['network']['id']
         with self.bgpvpn(project_id='another_project') as bgpvpn:
@@ -412,6 +478,52 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                         mock.ANY,
                         _expected_formatted_bgpvpn(id, net_id, rt))
 
+    def test_bagpipe_update_bgpvpn_no_agent_change(self):
+        with self.port() as port1, \
+                self.bgpvpn(route_targets=['6543:21', '6543:22']) as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               port1['port']['network_id']):
+            self.mock_update_rpc.reset_mock()
+            for update_data in ({'name': 'newname'},
+                                {'route_targets': ['6543:22', '6543:21']}):
+                self._update('bgpvpn/bgpvpns',
+                             bgpvpn['bgpvpn']['id'],
+                             {'bgpvpn': update_data},
+                             as_admin=True)
+            self.mock_update_rpc.assert_not_called()
+
+    def test_bagpipe_update_bgpvpn_gateway_mac_cache(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.network() as net, \
+                self.subnet(network=net) as subnet, \
+                self.router(project_id=self._project_id) as router, \
+                self.port(subnet=subnet), \
+                self.bgpvpn() as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               net['network']['id']):
+            def update_rt(rt):
+                self.mock_update_rpc.reset_mock()
+                self._update('bgpvpn/bgpvpns', bgpvpn['bgpvpn']['id'],
+                             {'bgpvpn': {'route_targets': [rt]}},
+                             as_admin=True)
+                self.mock_update_rpc.assert_called_once_with(mock.ANY,
+                                                             mock.ANY)
+                return self.mock_update_rpc.call_args[0][1]['gateway_mac']
+
+            self.assertIsNone(update_rt('6543:21'))
+            stats = driver.gateway_mac_cache_stats()
+            self.assertIsNone(update_rt('6543:22'))
+            self.assertEqual(stats['misses'],
+                             driver.gateway_mac_cache_stats()['misses'])
+
+            # the cached MAC is invalidated by the router interface callback
+            itf = self._router_interface_action('add',
+                                                router['router']['id'],
+                                                subnet['subnet']['id'],
+                                                None)
+            itf_port = self.plugin.get_port(self.ctxt, itf['port_id'])
+            self.assertEqual(itf_port['mac_address'], update_rt('6543:23'))
+
     def test_bagpipe_update_bgpvpn_with_router_assoc(self):
         with self.network() as net, \
                 self.subnet(network=net) as subnet, \
@@ -500,6 +612,37 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
 
                 self.assertEqual(expected, actual)
 
+    def test_bagpipe_network_route_targets_cache(self):
+        driver = self.bgpvpn_plugin.driver
+        with self.port() as port, \
+                self.bgpvpn(route_targets=['12345:1'],
+                            import_targets=['12345:2']) as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               port['port']['network_id']):
+            def retrieve_rts():
+                info = driver._retrieve_bgpvpn_network_info_for_port(
+                    self.ctxt, port['port'])
+                return {key: sorted(rts)
+                        for key, rts in info['l3vpn'].items()}
+
+            self.assertEqual({'import_rt': ['12345:1', '12345:2'],
+                              'export_rt': ['12345:1']},
+                             retrieve_rts())
+            stats = driver.network_rt_cache_stats()
+            retrieve_rts()
+            self.assertEqual(stats['hits'] + 1,
+                             driver.network_rt_cache_stats()['hits'])
+
+            # the route targets are merged again once the BGPVPN is updated
+            self._update('bgpvpn/bgpvpns', bgpvpn['bgpvpn']['id'],
+                         {'bgpvpn': {'export_targets': ['12345:3']}},
+                         as_admin=True)
+            self.assertEqual({'import_rt': ['12345:1', '12345:2'],
+                              'export_rt': ['12345:1', '12345:3']},
+                             retrieve_rts())
+            self.assertEqual(stats['misses'] + 1,
+                             driver.network_rt_cache_stats()['misses'])
+
     def test_bagpipe_get_network_info_for_port(self):
         with self.network() as net, \
                 self.subnet(network=net) as subnet, \
@@ -523,6 +666,133 @@ class TestBagpipeServiceDriver(TestBagpipeCommon):
                 'gateway_mac': itf_port['mac_address']
             }, r)
 
+    def test_bagpipe_networks_with_active_ports(self):
+        with self.network() as net1, \
+                self.network() as net2, \
+                self.network() as net3, \
+                self.subnet(network=net1) as subnet1, \
+                self.subnet(network=net2, cidr='10.0.1.0/24') as subnet2, \
+                self.port(subnet=subnet1), \
+                self.port(subnet=subnet2, admin_state_up=False):
+            net_ids = [net['network']['id'] for net in (net1, net2, net3)]
+            self.assertEqual(
+                [True, False, False],
+                [bagpipe.network_has_active_ports(self.ctxt, net_id)
+                 for net_id in net_ids])
+            self.assertEqual(
+                {net_ids[0]},
+                bagpipe.get_networks_with_active_ports(self.ctxt, net_ids))
+            self.assertEqual(
+                set(), bagpipe.get_networks_with_active_ports(self.ctxt, []))
+
+    def test_bagpipe_get_networks_for_routers(self):
+        with self.network() as net1, \
+                self.network() as net2, \
+                self.network() as net3, \
+                self.subnet(network=net1) as subnet1, \
+                self.subnet(network=net2, cidr='10.0.1.0/24') as subnet2, \
+                self.subnet(network=net3, cidr='10.0.2.0/24') as subnet3, \
+                self.router(project_id=self._project_id) as router1, \
+                self.router(project_id=self._project_id) as router2, \
+                self.router(project_id=self._project_id) as router3, \
+                self.port(subnet=subnet2) as port2:
+            for router, subnet in ((router1, subnet1), (router1, subnet2),
+                                   (router3, subnet3)):
+                self._router_interface_action('add',
+                                              router['router']['id'],
+                                              subnet['subnet']['id'],
+                                              None)
+            self._router_interface_action('add',
+                                          router2['router']['id'],
+                                          None,
+                                          port2['port']['id'])
+            self.assertEqual(
+                {net1['network']['id'], net2['network']['id']},
+                bagpipe.get_networks_for_routers(
+                    self.ctxt,
+                    [router1['router']['id'], router2['router']['id']]))
+            self.assertEqual(set(),
+                             bagpipe.get_networks_for_routers(self.ctxt, []))
+
+    def test_bagpipe_get_bgpvpn_network_info_for_port(self):
+        with self.network() as net, \
+                self.subnet(network=net) as subnet, \
+                self.router(project_id=self._project_id) as router, \
+                self.port(subnet=subnet) as port, \
+                self.bgpvpn(route_targets=['12345:1']) as bgpvpn1, \
+                self.bgpvpn(route_targets=['12345:2'],
+                            type='l2') as bgpvpn2, \
+                self.assoc_net(bgpvpn2['bgpvpn']['id'],
+                               net['network']['id'],
+                               do_disassociate=False) as net_assoc, \
+                self.assoc_router(bgpvpn1['bgpvpn']['id'],
+                                  router['router']['id']):
+            itf = self._router_interface_action('add',
+                                                router['router']['id'],
+                                                subnet['subnet']['id'],
+                                                None)
+            itf_port = self.plugin.get_port(self.ctxt, itf['port_id'])
+            expected_info = {
+                'mac_address': port['port']['mac_address'],
+                'ip_address': (port['port']['fixed_ips'][0]['ip_address'] +
+                               "/24"),
+                'gateway_ip': subnet['subnet']['gateway_ip'],
+                'gateway_mac': itf_port['mac_address']
+            }
+
+            # the BGPVPNs of router associations are only used when the
+            # network has no BGPVPN of its own
+            info, bgpvpns = bagpipe.get_bgpvpn_network_info_for_port(
+                self.ctxt, port['port']['id'], net['network']['id'])
+            self.assertEqual(expected_info, info)
+            self.assertEqual([bgpvpn2['bgpvpn']['id']],
+                             [bgpvpn['id'] for bgpvpn in bgpvpns])
+            self.assertEqual('l2', bgpvpns[0]['type'])
+
+            self._delete('bgpvpn/bgpvpns/%s/network_associations' %
+                         bgpvpn2['bgpvpn']['id'],
+                         net_assoc['network_association']['id'])
+            info, bgpvpns = bagpipe.get_bgpvpn_network_info_for_port(
+                self.ctxt, port['port']['id'], net['network']['id'])
+            self.assertEqual(expected_info, info)
+            self.assertEqual([bgpvpn1['bgpvpn']['id']],
+                             [bgpvpn['id'] for bgpvpn in bgpvpns])
+            self.assertEqual(['12345:1'], bgpvpns[0]['route_targets'])
+
+            # no such port
+            self.assertIsNone(bagpipe.get_bgpvpn_network_info_for_port(
+                self.ctxt, router['router']['id'], net['network']['id']))
+
+    def test_bagpipe_gateway_mac_several_router_interfaces(self):
+        with self.network() as net, \
+                self.subnet(network=net) as subnet, \
+                self.router(project_id=self._project_id) as router1, \
+                self.router(project_id=self._project_id) as router2, \
+                self.port(subnet=subnet) as port, \
+                self.port(subnet=subnet) as itf_port2:
+            itf1 = self._router_interface_action('add',
+                                                 router1['router']['id'],
+                                                 subnet['subnet']['id'],
+                                                 None)
+            self._router_interface_action('add',
+                                          router2['router']['id'],
+                                          None,
+                                          itf_port2['port']['id'])
+            net_id = net['network']['id']
+            expected_mac = min(
+                self.plugin.get_port(self.ctxt,
+                                     itf1['port_id'])['mac_address'],
+                itf_port2['port']['mac_address'])
+
+            # both lookups keep the same gateway MAC
+            self.assertEqual(
+                expected_mac,
+                bagpipe.get_network_info_for_port(
+                    self.ctxt, port['port']['id'], net_id)['gateway_mac'])
+            self.assertEqual(
+                {net_id: expected_mac},
+                bagpipe.get_gateway_macs(self.ctxt, [net_id]))
+
 
 RT = '12345:1'
 
@@ -735,6 +1005,94 @@ class TestBagpipeServiceDriverCallbacks(TestBagpipeCommon,
             self.assertFalse(self.mock_attach_rpc.called)
             self.assertFalse(self.mock_detach_rpc.called)
 
+    def test_bagpipe_callback_to_rpc_batched(self):
+        cfg.CONF.set_override('port_rpc_batch_window', 60, group='bgpvpn')
+        driver = self.bagpipe_driver
+        self.addCleanup(driver.flush_port_rpcs)
+        with self.port(arg_list=(portbindings.HOST_ID,),
+                       **{portbindings.HOST_ID: helpers.HOST},
+                       is_admin=True) as port1, \
+                self.port(arg_list=(portbindings.HOST_ID,),
+                          **{portbindings.HOST_ID: helpers.HOST},
+                          is_admin=True) as port2:
+            self._update_port_status(port1, const.PORT_STATUS_DOWN)
+            self._update_port_status(port2, const.PORT_STATUS_DOWN)
+            driver.flush_port_rpcs()
+            self.mock_attach_rpc.reset_mock()
+            self._update_port_status(port1, const.PORT_STATUS_ACTIVE)
+            self._update_port_status(port2, const.PORT_STATUS_ACTIVE)
+            self.assertFalse(self.mock_attach_rpc.called)
+
+            driver.flush_port_rpcs()
+            # the agent does not advertise support for the batch RPCs
+            self.assertEqual(set(), rpc_batch.get_batch_rpc_hosts(
+                self.ctxt, {helpers.HOST}))
+            self.mock_attach_rpc.assert_has_calls([
+                mock.call(mock.ANY,
+                          self._build_expected_return_active(port['port']),
+                          helpers.HOST)
+                for port in (port1, port2)])
+            self.assertEqual(2, self.mock_attach_rpc.call_count)
+
+    def test_bagpipe_callback_to_rpc_batched_ordering(self):
+        cfg.CONF.set_override('port_rpc_batch_window', 60, group='bgpvpn')
+        driver = self.bagpipe_driver
+        self.addCleanup(driver.flush_port_rpcs)
+        with self.port(arg_list=(portbindings.HOST_ID,),
+                       **{portbindings.HOST_ID: helpers.HOST},
+                       is_admin=True) as port, \
+                self.bgpvpn() as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               port['port']['network_id']):
+            self._update_port_status(port, const.PORT_STATUS_DOWN)
+            driver.flush_port_rpcs()
+            self.mocked_rpc.reset_mock()
+            self._update_port_status(port, const.PORT_STATUS_ACTIVE)
+            self._update('bgpvpn/bgpvpns', bgpvpn['bgpvpn']['id'],
+                         {'bgpvpn': {'route_targets': ['64512:43']}},
+                         as_admin=True)
+            # the queued attachment is sent before the BGPVPN update
+            self.assertEqual(
+                ['attach_port_on_bgpvpn', 'update_bgpvpn'],
+                [call[0] for call in self.mocked_rpc.mock_calls])
+
+    def test_external_network_cache(self):
+        driver = self.bagpipe_driver
+        ext_net_id = self.external_net['network']['id']
+        with self.network() as net:
+            net_id = net['network']['id']
+            stats = driver.external_network_cache_stats()
+            self.assertTrue(driver._network_is_external(self.ctxt,
+                                                        ext_net_id))
+            self.assertFalse(driver._network_is_external(self.ctxt, net_id))
+            new_stats = driver.external_network_cache_stats()
+            self.assertEqual(stats['misses'] + 1, new_stats['misses'])
+            self.assertEqual(stats['hits'] + 1, new_stats['hits'])
+
+            # the cache is kept current by the network callbacks
+            self._update('networks', net_id,
+                         {'network': {'router:external': True}},
+                         as_admin=True)
+            self.assertTrue(driver._network_is_external(self.ctxt, net_id))
+            self._update('networks', net_id,
+                         {'network': {'router:external': False}},
+                         as_admin=True)
+            self.assertFalse(driver._network_is_external(self.ctxt, net_id))
+            self.assertEqual(
+                new_stats['misses'],
+                driver.external_network_cache_stats()['misses'])
+
+            # and loaded again once expired
+            timeutils.set_time_override()
+            self.addCleanup(timeutils.clear_time_override)
+            timeutils.advance_time_seconds(
+                bagpipe_v2.EXTERNAL_NETWORKS_CACHE_TTL + 1)
+            self.assertTrue(driver._network_is_external(self.ctxt,
+                                                        ext_net_id))
+            self.assertEqual(
+                new_stats['misses'] + 1,
+                driver.external_network_cache_stats()['misses'])
+
     def test_bagpipe_callback_to_rpc_deleted_ignore_external_net(self):
         with self.subnet(network=self.external_net) as subnet, \
                 self.port(subnet=subnet,
@@ -1112,3 +1470,164 @@ class TestBagpipeServiceDriverV2RPCs(TestBagpipeCommon,
                     continue
                 for subnet in ovo.all_subnets(net['network']['id']):
                     self.assertIsNone(subnet['gateway_mac'])
+
+    @mock.patch.object(resources_rpc.ResourcesPushRpcApi, 'push')
+    def test_net_assocs_bulk_create(self, mocked_push):
+        with self.network() as net1, \
+                self.network() as net2, \
+                self.bgpvpn() as bgpvpn:
+            mocked_push.reset_mock()
+            net_ids = [net1['network']['id'], net2['network']['id']]
+            req = self.new_create_request(
+                'bgpvpn/bgpvpns',
+                data={'network_associations': [
+                    {'network_association': {
+                        'network_id': net_id,
+                        'project_id': self._project_id}}
+                    for net_id in net_ids]},
+                fmt='json',
+                id=bgpvpn['bgpvpn']['id'],
+                subresource='network_associations',
+                as_admin=True)
+            res = req.get_response(self.ext_api)
+            self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+
+            # all the associations are pushed at once
+            mocked_push.assert_called_once_with(
+                mock.ANY,
+                [AnyOfClass(objs.BGPVPNNetAssociation)] * 2, 'created')
+            self.assertEqual(
+                set(net_ids),
+                {ovo.network_id for ovo in mocked_push.call_args[0][1]})
+
+    @mock.patch.object(resources_rpc.ResourcesPushRpcApi, 'push')
+    def test_bgpvpn_update_no_agent_change(self, mocked_push):
+        with self.network() as net, \
+                self.bgpvpn(route_targets=['64512:1', '64512:2']) as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               net['network']['id']):
+            mocked_push.reset_mock()
+            for update_data in ({'name': 'newname'},
+                                {'route_targets': ['64512:2', '64512:1']}):
+                self._update('bgpvpn/bgpvpns',
+                             bgpvpn['bgpvpn']['id'],
+                             {'bgpvpn': update_data},
+                             as_admin=True)
+            mocked_push.assert_not_called()
+
+    @mock.patch.object(resources_rpc.ResourcesPushRpcApi, 'push')
+    def test_push_coalesce_window(self, mocked_push):
+        cfg.CONF.set_override('push_coalesce_window', 60, group='bgpvpn')
+        driver = self.bgpvpn_plugin.driver
+        self.addCleanup(driver.flush_pushes)
+        with self.network() as net1, \
+                self.network() as net2, \
+                self.bgpvpn() as bgpvpn:
+            mocked_push.reset_mock()
+            with self.assoc_net(bgpvpn['bgpvpn']['id'],
+                                net1['network']['id']):
+                pass
+            with self.assoc_net(bgpvpn['bgpvpn']['id'],
+                                net2['network']['id'],
+                                do_disassociate=False) as assoc:
+                self._update('bgpvpn/bgpvpns',
+                             bgpvpn['bgpvpn']['id'],
+                             {'bgpvpn': {'route_targets': ['64512:43']}},
+                             as_admin=True)
+            mocked_push.assert_not_called()
+
+            driver.flush_pushes()
+            # the first association was created and deleted in the window,
+            # the second one is pushed once, as created
+            mocked_push.assert_called_once_with(
+                mock.ANY, [AnyOfClass(objs.BGPVPNNetAssociation)], 'created')
+            pushed = mocked_push.call_args[0][1][0]
+            self.assertEqual(assoc['network_association']['id'], pushed.id)
+            self.assertEqual(['64512:43'], pushed.bgpvpn.route_targets)
+            stats = driver.push_stats()
+            self.assertEqual(4, stats['events'])
+            self.assertEqual(1, stats['cancelled'])
+            self.assertEqual(1, stats['pushes'])
+
+    @mock.patch.object(host_push.HostScopedPushRpcApi, 'push_to_host')
+    @mock.patch.object(resources_rpc.ResourcesPushRpcApi, 'push')
+    def test_host_scoped_push(self, mocked_push, mocked_push_to_host):
+        cfg.CONF.set_override('host_scoped_push', True, group='bgpvpn')
+        agent = helpers._get_l2_agent_dict('host1', const.AGENT_TYPE_OFA,
+                                           const.AGENT_PROCESS_OVS)
+        agent['configurations'][host_push.HOST_PUSH_AGENT_CONFIG] = True
+        helpers._register_agent(agent)
+        helpers.register_ovs_agent('host2', const.AGENT_TYPE_OFA)
+        with self.subnet() as subnet, \
+                self.port(subnet=subnet,
+                          arg_list=(portbindings.HOST_ID,),
+                          **{portbindings.HOST_ID: 'host1'},
+                          is_admin=True), \
+                self.bgpvpn() as bgpvpn:
+            net_id = subnet['subnet']['network_id']
+            self.assertEqual(
+                {net_id: {'host1'}},
+                host_push.get_hosts_for_networks(self.ctxt, [net_id]))
+            mocked_push.reset_mock()
+            with self.assoc_net(bgpvpn['bgpvpn']['id'], net_id,
+                                do_disassociate=False):
+                pass
+            # the association is only pushed to the host of the port
+            mocked_push.assert_not_called()
+            mocked_push_to_host.assert_called_once_with(
+                mock.ANY, [AnyOfClass(objs.BGPVPNNetAssociation)],
+                'created', 'host1')
+
+            mocked_push_to_host.reset_mock()
+            with self.port(subnet=subnet,
+                           arg_list=(portbindings.HOST_ID,),
+                           **{portbindings.HOST_ID: 'host2'},
+                           is_admin=True):
+                mocked_push.reset_mock()
+                self._update('bgpvpn/bgpvpns',
+                             bgpvpn['bgpvpn']['id'],
+                             {'bgpvpn': {'route_targets': ['64512:43']}},
+                             as_admin=True)
+            # the agent of host2 does not consume host pushes
+            mocked_push_to_host.assert_not_called()
+            mocked_push.assert_called_once_with(
+                mock.ANY, [AnyOfClass(objs.BGPVPNNetAssociation)],
+                'updated')
+            stats = self.bgpvpn_plugin.driver.host_push_stats()
+            self.assertEqual(1, stats['host_casts'])
+            self.assertEqual(1, stats['fanouts'])
+
+    @mock.patch.object(resources_rpc.ResourcesPushRpcApi, 'push')
+    def test_bgpvpn_update_push_chunks(self, mocked_push):
+        cfg.CONF.set_override('push_chunk_size', 2, group='bgpvpn')
+        with self.network() as net1, \
+                self.network() as net2, \
+                self.network() as net3, \
+                self.router(project_id=self._project_id) as router, \
+                self.bgpvpn() as bgpvpn, \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               net1['network']['id']), \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               net2['network']['id']), \
+                self.assoc_net(bgpvpn['bgpvpn']['id'],
+                               net3['network']['id']), \
+                self.assoc_router(bgpvpn['bgpvpn']['id'],
+                                  router['router']['id']):
+            mocked_push.reset_mock()
+            self._update('bgpvpn/bgpvpns',
+                         bgpvpn['bgpvpn']['id'],
+                         {'bgpvpn': {'route_targets': ['64512:43']}},
+                         as_admin=True)
+
+            self.assertEqual(
+                [[objs.BGPVPNNetAssociation] * 2,
+                 [objs.BGPVPNNetAssociation],
+                 [objs.BGPVPNRouterAssociation]],
+                [[type(ovo) for ovo in args[1]]
+                 for args, _kwargs in mocked_push.call_args_list])
+            net_ids = [ovo.network_id
+                       for args, _kwargs in mocked_push.call_args_list[:2]
+                       for ovo in args[1]]
+            self.assertCountEqual([net1['network']['id'],
+                                   net2['network']['id'],
+                                   net3['network']['id']], net_ids)
@@ -0,0 +1,81 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from unittest import mock
+
+from neutron.tests import base
+
+from networking_bagpipe.objects import bgpvpn as bgpvpn_objects
+
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import host_push
+
+
+class TestHostScopedPusher(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.push_rpc = mock.Mock()
+        self.host_push_hosts = {'host1', 'host2', 'host3'}
+        self.pusher = host_push.HostScopedPusher(
+            self.push_rpc,
+            host_push_hosts=lambda context, hosts: (
+                set(hosts) & self.host_push_hosts))
+        mock.patch.object(host_push, 'get_hosts_for_networks',
+                          return_value={'net1': {'host1', 'host2'},
+                                        'net2': {'host2'}}).start()
+        mock.patch.object(host_push, 'get_hosts_for_ports',
+                          return_value={'port1': {'host3'}}).start()
+        self.net_assoc = mock.Mock(spec=bgpvpn_objects.BGPVPNNetAssociation,
+                                   network_id='net1')
+        self.router_assoc = mock.Mock(
+            spec=bgpvpn_objects.BGPVPNRouterAssociation,
+            connected_networks=[{'network_id': 'net2'},
+                                {'network_id': 'net3'}])
+        self.port_assoc = mock.Mock(
+            spec=bgpvpn_objects.BGPVPNPortAssociation,
+            port_id='port1')
+
+    def test_push_to_hosts(self):
+        self.pusher.push(None, [self.net_assoc, self.router_assoc,
+                                self.port_assoc], 'updated')
+
+        self.push_rpc.push.assert_not_called()
+        self.push_rpc.push_to_host.assert_has_calls([
+            mock.call(None, [self.net_assoc], 'updated', 'host1'),
+            mock.call(None, [self.net_assoc, self.router_assoc],
+                      'updated', 'host2'),
+            mock.call(None, [self.port_assoc], 'updated', 'host3')],
+            any_order=True)
+        self.assertEqual(3, self.push_rpc.push_to_host.call_count)
+        stats = self.pusher.stats()
+        self.assertEqual(1, stats['pushes'])
+        self.assertEqual(3, stats['host_casts'])
+        self.assertEqual(0, stats['fanouts'])
+
+    def test_fanout_fallback(self):
+        self.host_push_hosts.discard('host2')
+        associations = [self.net_assoc, self.port_assoc]
+        self.pusher.push(None, associations, 'created')
+
+        self.push_rpc.push.assert_called_once_with(None, associations,
+                                                   'created')
+        self.push_rpc.push_to_host.assert_not_called()
+        self.assertEqual(1, self.pusher.stats()['fanouts'])
+
+    def test_no_bound_port(self):
+        self.net_assoc.network_id = 'net3'
+        self.pusher.push(None, [self.net_assoc], 'deleted')
+
+        self.push_rpc.push.assert_not_called()
+        self.push_rpc.push_to_host.assert_not_called()
+        self.assertEqual(1, self.pusher.stats()['skipped'])
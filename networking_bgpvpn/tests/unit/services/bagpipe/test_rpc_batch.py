@@ -0,0 +1,132 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+from unittest import mock
+
+from neutron.tests import base
+
+from networking_bgpvpn.neutron.services.service_drivers.bagpipe \
+    import rpc_batch
+
+
+class TestPortRpcBatcher(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.agent_rpc = mock.Mock()
+        self.batch_hosts = {'batch-host'}
+        self.batch_rpc_hosts = mock.Mock(
+            side_effect=lambda context, hosts: hosts & self.batch_hosts)
+        # long enough for the tests to flush the batcher themselves
+        self.batcher = rpc_batch.PortRpcBatcher(
+            self.agent_rpc, 60, batch_rpc_hosts=self.batch_rpc_hosts)
+        self.addCleanup(self.batcher.flush)
+
+    def _notify(self, host, *ports):
+        for method, port_id in ports:
+            getattr(self.batcher, method)(None, {'id': port_id}, host)
+
+    def test_batch_host(self):
+        self._notify('batch-host',
+                     (rpc_batch.ATTACH, 'a'), (rpc_batch.ATTACH, 'b'),
+                     (rpc_batch.DETACH, 'c'),
+                     (rpc_batch.ATTACH, 'd'), (rpc_batch.ATTACH, 'e'))
+        self.agent_rpc.attach_ports_on_bgpvpn.assert_not_called()
+
+        self.batcher.flush()
+        self.assertEqual(
+            [mock.call(mock.ANY, [{'id': 'a'}, {'id': 'b'}], 'batch-host'),
+             mock.call(mock.ANY, [{'id': 'd'}, {'id': 'e'}], 'batch-host')],
+            self.agent_rpc.attach_ports_on_bgpvpn.call_args_list)
+        # a single notification is sent with the per-port RPC
+        self.agent_rpc.detach_port_from_bgpvpn.assert_called_once_with(
+            mock.ANY, {'id': 'c'}, 'batch-host')
+        stats = self.batcher.stats()
+        self.assertEqual(5, stats['notifications'])
+        self.assertEqual(3, stats['casts'])
+        self.assertEqual(2, stats['batch_casts'])
+        self.assertEqual(0, stats['pending'])
+
+    def test_no_batch_host(self):
+        self._notify('host',
+                     (rpc_batch.ATTACH, 'a'), (rpc_batch.ATTACH, 'b'))
+        self.batcher.flush()
+        self.agent_rpc.attach_ports_on_bgpvpn.assert_not_called()
+        self.assertEqual(
+            [mock.call(mock.ANY, {'id': 'a'}, 'host'),
+             mock.call(mock.ANY, {'id': 'b'}, 'host')],
+            self.agent_rpc.attach_port_on_bgpvpn.call_args_list)
+
+    def test_hosts_checked_at_once(self):
+        self._notify('batch-host', (rpc_batch.ATTACH, 'a'))
+        self._notify('host', (rpc_batch.ATTACH, 'b'))
+        self.batcher.flush()
+        self.batch_rpc_hosts.assert_called_once_with(
+            mock.ANY, {'batch-host', 'host'})
+
+    def test_fanout_after_port_notifications(self):
+        self._notify('host', (rpc_batch.ATTACH, 'a'))
+        self.batcher.update_bgpvpn(None, {'id': 'bgpvpn'})
+        self.batcher.delete_bgpvpn(None, {'id': 'bgpvpn'})
+        # the queued attachment is sent before the BGPVPN notifications
+        self.assertEqual(
+            [mock.call.attach_port_on_bgpvpn(mock.ANY, {'id': 'a'}, 'host'),
+             mock.call.update_bgpvpn(None, {'id': 'bgpvpn'}),
+             mock.call.delete_bgpvpn(None, {'id': 'bgpvpn'})],
+            self.agent_rpc.mock_calls)
+        self.assertEqual(0, self.batcher.stats()['pending'])
+
+    def test_empty_attach_ignored(self):
+        self.batcher.attach_port_on_bgpvpn(None, {}, 'host')
+        self.assertEqual(0, self.batcher.stats()['pending'])
+
+    def test_window(self):
+        sent = threading.Event()
+        self.agent_rpc.detach_port_from_bgpvpn.side_effect = (
+            lambda *args: sent.set())
+        batcher = rpc_batch.PortRpcBatcher(
+            self.agent_rpc, 0.01,
+            batch_rpc_hosts=lambda context, hosts: set())
+        batcher.detach_port_from_bgpvpn(None, {'id': 'a'}, 'host')
+        self.assertTrue(sent.wait(10))
+
+    def test_failures(self):
+        self.agent_rpc.attach_port_on_bgpvpn.side_effect = Exception('boom')
+        self._notify('host', (rpc_batch.ATTACH, 'a'))
+        self._notify('batch-host',
+                     (rpc_batch.DETACH, 'b'), (rpc_batch.DETACH, 'c'))
+        self.batcher.flush()
+        self.agent_rpc.detach_ports_from_bgpvpn.assert_called_once_with(
+            mock.ANY, [{'id': 'b'}, {'id': 'c'}], 'batch-host')
+        self.assertEqual(1, self.batcher.stats()['failures'])
+
+
+class TestBGPVPNAgentNotifyApi(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        mock.patch('neutron_lib.rpc.get_client').start()
+        self.agent_rpc = rpc_batch.BGPVPNAgentNotifyApi()
+        self.cctxt = self.agent_rpc.client.prepare.return_value
+
+    def test_batch_methods(self):
+        self.agent_rpc.attach_ports_on_bgpvpn(None, [{'id': 'a'}], 'host')
+        self.agent_rpc.detach_ports_from_bgpvpn(None, [{'id': 'b'}], 'host')
+        self.agent_rpc.client.prepare.assert_called_with(
+            topic=self.agent_rpc.topic_bgpvpn_update, server='host')
+        self.assertEqual(
+            [mock.call(None, 'attach_ports_on_bgpvpn',
+                       port_bgpvpn_infos=[{'id': 'a'}]),
+             mock.call(None, 'detach_ports_from_bgpvpn',
+                       port_bgpvpn_infos=[{'id': 'b'}])],
+            self.cctxt.cast.call_args_list)
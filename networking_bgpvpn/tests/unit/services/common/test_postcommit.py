@@ -0,0 +1,125 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from neutron.tests import base
+
+from networking_bgpvpn.neutron.services.common.postcommit import \
+    PostcommitExecutor
+
+
+class TestPostcommitExecutor(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = PostcommitExecutor(4)
+        self.addCleanup(self.executor.stop, 10)
+        self.calls = []
+        self.release = threading.Event()
+
+    def _hook(self, *args):
+        self.calls.append(args)
+
+    def _blocking_hook(self, *args):
+        self.release.wait(10)
+        self.calls.append(args)
+
+    def test_ordered_per_key(self):
+        self.executor.submit('a', self._blocking_hook, 'a', 1)
+        for i in range(2, 6):
+            self.executor.submit('a', self._hook, 'a', i)
+        self.executor.submit('b', self._hook, 'b', 1)
+        # hooks of other keys do not wait for the ones of 'a'
+        self.assertFalse(self.executor.drain(0.1))
+        self.assertEqual([('b', 1)], self.calls)
+        self.release.set()
+        self.assertTrue(self.executor.drain(10))
+        self.assertEqual([('a', i) for i in range(1, 6)],
+                         [call for call in self.calls if call[0] == 'a'])
+
+    def test_coalesce(self):
+        def merge(previous_args, previous_kwargs, args, kwargs):
+            return (previous_args[0], args[1]), kwargs
+
+        self.executor.submit('a', self._blocking_hook, 0, 0)
+        self.executor.submit('a', self._hook, 1, 2, coalesce_key='update',
+                             merge=merge)
+        self.executor.submit('a', self._hook, 2, 3, coalesce_key='update',
+                             merge=merge)
+        self.executor.submit('a', self._hook, 'other')
+        self.executor.submit('a', self._hook, 3, 4, coalesce_key='update',
+                             merge=merge)
+        self.release.set()
+        self.assertTrue(self.executor.drain(10))
+        self.assertEqual([(0, 0), (1, 3), ('other',), (3, 4)], self.calls)
+        self.assertEqual(1, self.executor.stats()['coalesced'])
+
+    def test_coalesce_queued(self):
+        executor = PostcommitExecutor(2)
+        self.addCleanup(executor.stop, 10)
+        # both workers are busy, 'a' stays queued while being coalesced
+        executor.submit('b', self._blocking_hook, 'b')
+        executor.submit('c', self._blocking_hook, 'c')
+        executor.submit('a', self._hook, 'a', 1, coalesce_key='update')
+        executor.submit('a', self._hook, 'a', 2, coalesce_key='update')
+        self.assertEqual(1, list(executor._ready).count('a'))
+        self.release.set()
+        self.assertTrue(executor.drain(10))
+        executor.submit('a', self._hook, 'a', 3)
+        executor.submit('d', self._hook, 'd')
+        self.assertTrue(executor.drain(10))
+        self.assertEqual([('a', 2), ('a', 3)],
+                         [call for call in self.calls if call[0] == 'a'])
+        self.assertEqual(5, executor.stats()['completed'])
+
+    def test_failures(self):
+        def failing_hook():
+            raise Exception('boom')
+
+        self.executor.submit('a', failing_hook)
+        self.executor.submit('a', self._hook, 'a')
+        self.assertTrue(self.executor.drain(10))
+        self.assertEqual([('a',)], self.calls)
+        stats = self.executor.stats()
+        self.assertEqual(2, stats['submitted'])
+        self.assertEqual(2, stats['completed'])
+        self.assertEqual(1, stats['failures'])
+        self.assertEqual(0, stats['pending'])
+        self.assertGreaterEqual(stats['latency_max'], stats['latency_avg'])
+
+    def test_max_pending(self):
+        executor = PostcommitExecutor(1, max_pending=1)
+        self.addCleanup(executor.stop, 10)
+        executor.submit('a', self._blocking_hook, 1)
+        executor.submit('a', self._hook, 2)
+        submitted = threading.Event()
+
+        def submit():
+            executor.submit('a', self._hook, 3)
+            submitted.set()
+
+        threading.Thread(target=submit).start()
+        # the third hook waits for the second one to be started
+        self.assertFalse(submitted.wait(0.1))
+        self.release.set()
+        self.assertTrue(submitted.wait(10))
+        self.assertTrue(executor.drain(10))
+        self.assertEqual([(1,), (2,), (3,)], self.calls)
+
+    def test_stop(self):
+        self.executor.submit('a', self._hook, 1)
+        self.assertTrue(self.executor.stop(10))
+        self.assertEqual([(1,)], self.calls)
+        # hooks submitted once stopped are run by the caller
+        self.executor.submit('a', self._hook, 2)
+        self.assertEqual([(1,), (2,)], self.calls)
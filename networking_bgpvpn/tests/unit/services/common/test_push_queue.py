@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+from unittest import mock
+
+from neutron.api.rpc.callbacks import events as rpc_events
+from neutron.tests import base
+
+from networking_bgpvpn.neutron.services.common.push_queue import \
+    CoalescingPushQueue
+
+
+class FakeObject():
+
+    def __init__(self, id, name='FakeObject', state=None):
+        self.id = id
+        self.name = name
+        self.state = state
+
+    def obj_name(self):
+        return self.name
+
+
+class TestCoalescingPushQueue(base.BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.push = mock.Mock()
+        # long enough for the tests to flush the queue themselves
+        self.queue = CoalescingPushQueue(self.push, 60)
+        self.addCleanup(self.queue.flush)
+
+    def _pushed(self):
+        return [(event, [(obj.id, obj.state) for obj in objects])
+                for ((_context, objects, event), _kwargs)
+                in self.push.call_args_list]
+
+    def test_net_effect(self):
+        a = FakeObject('a')
+        b = FakeObject('b')
+        c = FakeObject('c')
+        d = FakeObject('d')
+        self.queue.push(None, [a, b, c], rpc_events.CREATED)
+        self.queue.push(None, [FakeObject('a', state=1)],
+                        rpc_events.UPDATED)
+        self.queue.push(None, [b, d], rpc_events.DELETED)
+        self.queue.push(None, [FakeObject('d', state=2)],
+                        rpc_events.UPDATED)
+        self.push.assert_not_called()
+
+        self.queue.flush()
+        self.assertEqual([(rpc_events.CREATED, [('c', None), ('a', 1)]),
+                          (rpc_events.UPDATED, [('d', 2)])],
+                         self._pushed())
+        stats = self.queue.stats()
+        self.assertEqual(7, stats['events'])
+        self.assertEqual(3, stats['coalesced'])
+        self.assertEqual(1, stats['cancelled'])
+        self.assertEqual(2, stats['pushes'])
+        self.assertEqual(3, stats['pushed'])
+        self.assertEqual(0, stats['pending'])
+
+    def test_keyed_by_type(self):
+        self.queue.push(None, [FakeObject('a', 'Net')], rpc_events.CREATED)
+        self.queue.push(None, [FakeObject('a', 'Router')],
+                        rpc_events.DELETED)
+        self.queue.flush()
+        self.assertEqual([(rpc_events.CREATED, [('a', None)]),
+                          (rpc_events.DELETED, [('a', None)])],
+                         self._pushed())
+
+    def test_update_then_delete(self):
+        self.queue.push(None, [FakeObject('a')], rpc_events.UPDATED)
+        self.queue.push(None, [FakeObject('a')], rpc_events.UPDATED)
+        self.queue.push(None, [FakeObject('a')], rpc_events.DELETED)
+        self.queue.flush()
+        self.assertEqual([(rpc_events.DELETED, [('a', None)])],
+                         self._pushed())
+
+    def test_window(self):
+        pushed = threading.Event()
+        self.push.side_effect = lambda *args: pushed.set()
+        queue = CoalescingPushQueue(self.push, 0.01)
+        queue.push(None, [FakeObject('a')], rpc_events.UPDATED)
+        self.assertTrue(pushed.wait(10))
+        self.assertEqual([(rpc_events.UPDATED, [('a', None)])],
+                         self._pushed())
+
+    def test_push_failure(self):
+        self.push.side_effect = [Exception('boom'), None]
+        self.queue.push(None, [FakeObject('a')], rpc_events.UPDATED)
+        self.queue.push(None, [FakeObject('b')], rpc_events.DELETED)
+        self.queue.flush()
+        self.assertEqual(2, self.push.call_count)
+        self.assertEqual(1, self.queue.stats()['failures'])
@@ -14,8 +14,12 @@
 #    under the License.
 
 from neutron.tests import base
+from oslo_utils import timeutils
 
 from networking_bgpvpn.neutron.services.common.utils import filter_resource
+from networking_bgpvpn.neutron.services.common.utils import \
+    get_bgpvpn_changes
+from networking_bgpvpn.neutron.services.common.utils import LRUCache
 
 
 class TestFilterResource(base.BaseTestCase):
@@ -59,3 +63,83 @@ class TestFilterResource(base.BaseTestCase):
             'fake_attribute': ['wrong_fake_value1', 'fake_value2'],
         }
         self.assertFalse(filter_resource(self._fake_resource_list, filters))
+
+
+class TestGetBGPVPNChanges(base.BaseTestCase):
+
+    def test_changes(self):
+        old = {'name': 'foo', 'type': 'l3',
+               'route_targets': ['1:1', '1:2'],
+               'import_targets': [],
+               'local_pref': None}
+        new = {'name': 'bar', 'type': 'l3',
+               'route_targets': ['1:2', '1:1', '1:1'],
+               'export_targets': [],
+               'local_pref': 100}
+        self.assertEqual({'name', 'local_pref'},
+                         get_bgpvpn_changes(new, old))
+        self.assertEqual({'local_pref'},
+                         get_bgpvpn_changes(new, old,
+                                            ('type', 'route_targets',
+                                             'local_pref')))
+        new['route_targets'] = ['1:1']
+        self.assertEqual({'route_targets'},
+                         get_bgpvpn_changes(new, old, ('route_targets',)))
+
+
+class TestLRUCache(base.BaseTestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual({'size': 1, 'max_size': 2, 'hits': 1, 'misses': 1},
+                         cache.stats())
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # 'a' becomes the most recently used entry
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, cache.stats()['size'])
+
+    def test_revision(self):
+        cache = LRUCache(2)
+        cache.set('a', 1, revision=3)
+        self.assertEqual(1, cache.get('a', 3))
+        self.assertIsNone(cache.get('a', 4))
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 2, revision=4)
+        self.assertEqual(2, cache.get('a', 4))
+        self.assertIsNone(cache.get('a', 3))
+        self.assertEqual(2, cache.stats()['hits'])
+        self.assertEqual(3, cache.stats()['misses'])
+
+    def test_invalidate(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.invalidate('a')
+        cache.invalidate('unknown')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
+        cache.clear()
+        self.assertIsNone(cache.get('b'))
+
+    def test_ttl(self):
+        cache = LRUCache(2, ttl=10)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        cache.set('a', 1)
+        timeutils.advance_time_seconds(9)
+        self.assertEqual(1, cache.get('a'))
+        timeutils.advance_time_seconds(1)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 2)
+        self.assertEqual(2, cache.get('a'))
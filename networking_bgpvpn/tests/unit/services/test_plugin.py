@@ -15,11 +15,15 @@
 
 import contextlib
 import copy
+import datetime
 from unittest import mock
 
 import webob.exc
 
+from neutron_lib import context
 from neutron_lib.plugins import directory
+from oslo_config import cfg
+from oslo_utils import timeutils
 from oslo_utils import uuidutils
 
 from neutron.api import extensions as api_extensions
@@ -824,6 +828,70 @@ class TestBGPVPNServicePlugin(BgpvpnTestCaseMixin):
             self.assertIn("differing from type of associated BGPVPN",
                           str(res.body))
 
+    def test_bgpvpn_port_assoc_update_bgpvpn_route_no_such_bgpvpn(self):
+        with self.network() as net, \
+                self.subnet(network={'network': net['network']}) as subnet, \
+                self.port(subnet={'subnet': subnet['subnet']}) as port, \
+                self.bgpvpn() as bgpvpn, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port['port']['id']) as port_assoc:
+
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+
+            req = self.new_update_request(
+                'bgpvpn/bgpvpns/%s/port_associations' % bgpvpn_id,
+                {'port_association': {
+                    'routes': [{
+                        'type': 'bgpvpn',
+                        'bgpvpn_id': _uuid()
+                    }]
+                }},
+                port_assoc['port_association']['id'],
+                as_admin=True
+            )
+
+            res = req.get_response(self.ext_api)
+
+            self.assertEqual(res.status_int, webob.exc.HTTPBadRequest.code)
+            self.assertIn("bgpvpn specified in route does not exist",
+                          str(res.body))
+
+    def test_bgpvpn_port_assoc_update_bgpvpn_routes_single_lookup(self):
+        with self.network() as net, \
+                self.subnet(network={'network': net['network']}) as subnet, \
+                self.port(subnet={'subnet': subnet['subnet']}) as port, \
+                self.bgpvpn() as bgpvpn, \
+                self.bgpvpn() as bgpvpn_1, \
+                self.bgpvpn() as bgpvpn_2, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port['port']['id']) as port_assoc:
+
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            routes = [{'type': 'bgpvpn',
+                       'bgpvpn_id': b['bgpvpn']['id'],
+                       'local_pref': local_pref}
+                      for b in (bgpvpn_1, bgpvpn_2)
+                      for local_pref in (100, 200)]
+
+            with mock.patch.object(
+                    self.bgpvpn_plugin.driver, 'get_bgpvpns',
+                    wraps=self.bgpvpn_plugin.driver.get_bgpvpns
+            ) as mock_get_bgpvpns, \
+                    mock.patch.object(self.bgpvpn_plugin.driver,
+                                      'get_bgpvpn') as mock_get_bgpvpn:
+                self._update(
+                    'bgpvpn/bgpvpns/%s/port_associations' % bgpvpn_id,
+                    port_assoc['port_association']['id'],
+                    {'port_association': {'routes': routes}},
+                    as_admin=True)
+
+            mock_get_bgpvpns.assert_called_once()
+            self.assertCountEqual(
+                [bgpvpn_id, bgpvpn_1['bgpvpn']['id'],
+                 bgpvpn_2['bgpvpn']['id']],
+                mock_get_bgpvpns.call_args[1]['filters']['id'])
+            mock_get_bgpvpn.assert_not_called()
+
 
 class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
 
@@ -838,6 +906,18 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
         for key in keys:
             self.assertEqual(ref[key], actual[key])
 
+    def _create_assocs_bulk(self, bgpvpn_id, collection, assocs):
+        data = {collection: [{collection[:-1]: dict(
+            assoc, project_id=self._project_id)} for assoc in assocs]}
+        req = self.new_create_request(
+            'bgpvpn/bgpvpns',
+            data=data,
+            fmt='json',
+            id=bgpvpn_id,
+            subresource=collection,
+            as_admin=True)
+        return req.get_response(self.ext_api)
+
     @mock.patch.object(driver_api.BGPVPNDriver,
                        'create_bgpvpn_postcommit')
     @mock.patch.object(driver_api.BGPVPNDriver,
@@ -846,16 +926,17 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
     def test_create_bgpvpn(self, mock_create_db,
                            mock_create_precommit,
                            mock_create_postcommit):
-        mock_create_db.return_value = self.converted_data['bgpvpn']
+        bgpvpn = dict(self.converted_data['bgpvpn'], id=_uuid())
+        mock_create_db.return_value = bgpvpn
         with self.bgpvpn(do_delete=False):
             self.assertTrue(mock_create_db.called)
             self.assertDictSupersetOf(
                 self.converted_data['bgpvpn'],
                 mock_create_db.call_args[0][1])
             mock_create_precommit.assert_called_once_with(
-                mock.ANY, self.converted_data['bgpvpn'])
+                mock.ANY, bgpvpn)
             mock_create_postcommit.assert_called_once_with(
-                mock.ANY, self.converted_data['bgpvpn'])
+                mock.ANY, bgpvpn)
 
     def test_create_bgpvpn_precommit_fails(self):
         with mock.patch.object(driver_api.BGPVPNDriver,
@@ -973,6 +1054,111 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
             mock_update_postcommit.assert_called_once_with(
                 mock.ANY, old_bgpvpn, new_bgpvpn)
 
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'delete_bgpvpn_postcommit')
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'update_bgpvpn_postcommit')
+    def test_update_delete_bgpvpn_async_postcommit(
+            self, mock_update_postcommit, mock_delete_postcommit):
+        cfg.CONF.set_override('async_postcommit', True, group='bgpvpn')
+        driver = self.bgpvpn_plugin.driver
+        self.addCleanup(driver.drain_postcommit, 10)
+        with self.bgpvpn() as bgpvpn:
+            id = bgpvpn['bgpvpn']['id']
+            for name in ('foo', 'bar'):
+                self._update('bgpvpn/bgpvpns', id,
+                             {'bgpvpn': {'name': name}}, as_admin=True)
+        stats = driver.postcommit_stats()
+        self.assertTrue(driver.drain_postcommit(10))
+        self.assertIsNone(driver.postcommit_stats())
+
+        # the updates may have been coalesced, but are run in order, from
+        # the initial state to the last one, before the deletion
+        self.assertEqual(4, stats['submitted'])
+        first_update = mock_update_postcommit.call_args_list[0][0]
+        last_update = mock_update_postcommit.call_args_list[-1][0]
+        self.assertEqual(bgpvpn['bgpvpn']['name'], first_update[1]['name'])
+        self.assertEqual('bar', last_update[2]['name'])
+        mock_delete_postcommit.assert_called_once_with(mock.ANY, mock.ANY)
+        self.assertEqual(id, mock_delete_postcommit.call_args[0][1]['id'])
+
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'update_bgpvpn_postcommit')
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_bgpvpn_postcommit')
+    def test_bgpvpn_postcommit_journal(self, mock_create_postcommit,
+                                       mock_update_postcommit):
+        cfg.CONF.set_override('postcommit_journal', True, group='bgpvpn')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        driver = self.bgpvpn_plugin.driver
+        ctx = context.get_admin_context()
+        mock_create_postcommit.side_effect = [Exception('boom'), None]
+
+        with self.bgpvpn(do_delete=False) as bgpvpn:
+            id = bgpvpn['bgpvpn']['id']
+            for name in ('foo', 'bar'):
+                self._update('bgpvpn/bgpvpns', id,
+                             {'bgpvpn': {'name': name}}, as_admin=True)
+
+        # the updates are not run before the failed creation
+        mock_update_postcommit.assert_not_called()
+        entries = driver.bgpvpn_db.get_journal_entries(ctx)
+        self.assertEqual(
+            ['create_bgpvpn_postcommit', 'update_bgpvpn_postcommit',
+             'update_bgpvpn_postcommit'],
+            [entry['operation'] for entry in entries])
+        self.assertEqual(1, entries[0]['attempts'])
+        self.assertEqual('boom', entries[0]['last_error'])
+
+        # nothing is due yet
+        driver.replay_journal()
+        self.assertEqual(1, mock_create_postcommit.call_count)
+
+        timeutils.advance_time_seconds(
+            cfg.CONF.bgpvpn.journal_max_retry_interval)
+        driver.replay_journal()
+        self.assertEqual(2, mock_create_postcommit.call_count)
+        self.assertEqual(id, mock_create_postcommit.call_args[0][1]['id'])
+        # the two updates are run as one
+        mock_update_postcommit.assert_called_once_with(mock.ANY, mock.ANY,
+                                                       mock.ANY)
+        _ctx, old_bgpvpn, new_bgpvpn = mock_update_postcommit.call_args[0]
+        self.assertEqual(bgpvpn['bgpvpn']['name'], old_bgpvpn['name'])
+        self.assertEqual('bar', new_bgpvpn['name'])
+        self.assertEqual([], driver.bgpvpn_db.get_journal_entries(ctx))
+
+        # with no failure, the hooks are run right away and not journaled
+        self._delete('bgpvpn/bgpvpns', id, as_admin=True)
+        self.assertEqual([], driver.bgpvpn_db.get_journal_entries(ctx))
+
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_bgpvpn_postcommit')
+    def test_bgpvpn_postcommit_journal_claimed(self, mock_create_postcommit):
+        cfg.CONF.set_override('postcommit_journal', True, group='bgpvpn')
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        driver = self.bgpvpn_plugin.driver
+        ctx = context.get_admin_context()
+        bgpvpn = {'id': uuidutils.generate_uuid()}
+        entry = driver._record_postcommit(ctx, bgpvpn['id'], bgpvpn['id'],
+                                          'create_bgpvpn_postcommit', bgpvpn)
+
+        # the journal worker claims the entry before the hook is run
+        timeutils.advance_time_seconds(
+            cfg.CONF.bgpvpn.journal_retry_interval)
+        now = timeutils.utcnow()
+        self.assertTrue(driver.bgpvpn_db.claim_journal_entries(
+            ctx, [entry['id']], now,
+            now + datetime.timedelta(seconds=60)))
+        driver._run_postcommit(bgpvpn['id'],
+                               driver.create_bgpvpn_postcommit,
+                               ctx, bgpvpn, journal_entry=entry)
+        mock_create_postcommit.assert_not_called()
+        self.assertEqual([entry['id']],
+                         [journal_entry['id'] for journal_entry in
+                          driver.bgpvpn_db.get_journal_entries(ctx)])
+
     def test_update_bgpvpn_precommit_fails(self):
         with self.bgpvpn() as bgpvpn, \
                 mock.patch.object(driver_api.BGPVPNDriver,
@@ -1046,6 +1232,62 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                                     bgpvpn['bgpvpn']['id'])
             self.assertEqual([], bgpvpn_new['bgpvpn']['networks'])
 
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_net_assocs_postcommit')
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_net_assocs_precommit')
+    def test_create_bgpvpn_net_assoc_bulk(self, mock_pre_commit,
+                                          mock_post_commit):
+        with self.bgpvpn() as bgpvpn, \
+                self.network() as net1, \
+                self.network() as net2:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            net_ids = [net1['network']['id'], net2['network']['id']]
+            res = self._create_assocs_bulk(
+                bgpvpn_id, 'network_associations',
+                [{'network_id': net_id} for net_id in net_ids])
+            self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+            assocs = self.deserialize('json', res)['network_associations']
+            self.assertEqual(net_ids,
+                             [assoc['network_id'] for assoc in assocs])
+
+            mock_pre_commit.assert_called_once_with(mock.ANY, mock.ANY)
+            mock_post_commit.assert_called_once_with(mock.ANY, mock.ANY)
+            self.assertEqual(
+                [assoc['id'] for assoc in assocs],
+                [assoc['id'] for assoc in mock_post_commit.call_args[0][1]])
+            bgpvpn_new = self._show('bgpvpn/bgpvpns', bgpvpn_id)
+            self.assertCountEqual(net_ids, bgpvpn_new['bgpvpn']['networks'])
+
+    def test_create_bgpvpn_net_assoc_bulk_fails(self):
+        with self.bgpvpn() as bgpvpn, \
+                self.network() as net:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            res = self._create_assocs_bulk(
+                bgpvpn_id, 'network_associations',
+                [{'network_id': net['network']['id']},
+                 {'network_id': _uuid()}])
+            self.assertEqual(webob.exc.HTTPNotFound.code, res.status_int)
+
+            res = self._create_assocs_bulk(
+                bgpvpn_id, 'network_associations',
+                [{'network_id': net['network']['id']},
+                 {'network_id': net['network']['id']}])
+            self.assertEqual(webob.exc.HTTPBadRequest.code, res.status_int)
+
+            with mock.patch.object(
+                    driver_api.BGPVPNDriver,
+                    'create_net_assoc_precommit',
+                    new=self._raise_bgpvpn_driver_precommit_exc):
+                res = self._create_assocs_bulk(
+                    bgpvpn_id, 'network_associations',
+                    [{'network_id': net['network']['id']}])
+                self.assertEqual(webob.exc.HTTPError.code, res.status_int)
+
+            # Assert that the bgpvpn is not associated to any network
+            bgpvpn_new = self._show('bgpvpn/bgpvpns', bgpvpn_id)
+            self.assertEqual([], bgpvpn_new['bgpvpn']['networks'])
+
     @mock.patch.object(bgpvpn_db.BGPVPNPluginDb, 'get_net_assoc')
     def test_get_bgpvpn_net_assoc(self, mock_get_db):
         with self.bgpvpn() as bgpvpn:
@@ -1072,9 +1314,10 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                     res = 'bgpvpn/bgpvpns/' + bgpvpn_id + \
                           '/network_associations'
                     self._list(res)
-                    mock_get_db.assert_called_once_with(mock.ANY,
-                                                        bgpvpn_id,
-                                                        mock.ANY, mock.ANY)
+                    mock_get_db.assert_called_once_with(
+                        mock.ANY, bgpvpn_id, mock.ANY, mock.ANY,
+                        sorts=mock.ANY, limit=mock.ANY, marker=mock.ANY,
+                        page_reverse=mock.ANY)
 
     @mock.patch.object(driver_api.BGPVPNDriver,
                        'delete_net_assoc_precommit')
@@ -1177,6 +1420,30 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                                     bgpvpn['bgpvpn']['id'])
             self.assertEqual([], bgpvpn_new['bgpvpn']['routers'])
 
+    @mock.patch.object(driver_api.BGPVPNDriver,
+                       'create_router_assocs_postcommit')
+    def test_create_bgpvpn_router_assoc_bulk(self, mock_post_commit):
+        with self.bgpvpn() as bgpvpn, \
+                self.router(project_id=self._project_id) as router1, \
+                self.router(project_id=self._project_id) as router2:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            router_ids = [router1['router']['id'], router2['router']['id']]
+            res = self._create_assocs_bulk(
+                bgpvpn_id, 'router_associations',
+                [{'router_id': router_id} for router_id in router_ids])
+            self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+            assocs = self.deserialize('json', res)['router_associations']
+            self.assertEqual(router_ids,
+                             [assoc['router_id'] for assoc in assocs])
+
+            mock_post_commit.assert_called_once_with(mock.ANY, mock.ANY)
+            self.assertEqual(
+                [assoc['id'] for assoc in assocs],
+                [assoc['id'] for assoc in mock_post_commit.call_args[0][1]])
+            bgpvpn_new = self._show('bgpvpn/bgpvpns', bgpvpn_id)
+            self.assertCountEqual(router_ids,
+                                  bgpvpn_new['bgpvpn']['routers'])
+
     @mock.patch.object(bgpvpn_db.BGPVPNPluginDb, 'get_router_assoc')
     def test_get_bgpvpn_router_assoc(self, mock_get_db):
         with self.bgpvpn() as bgpvpn:
@@ -1204,9 +1471,10 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                     res = 'bgpvpn/bgpvpns/' + bgpvpn_id + \
                           '/router_associations'
                     self._list(res)
-                    mock_get_db.assert_called_once_with(mock.ANY,
-                                                        bgpvpn_id,
-                                                        mock.ANY, mock.ANY)
+                    mock_get_db.assert_called_once_with(
+                        mock.ANY, bgpvpn_id, mock.ANY, mock.ANY,
+                        sorts=mock.ANY, limit=mock.ANY, marker=mock.ANY,
+                        page_reverse=mock.ANY)
 
     @mock.patch.object(driver_api.BGPVPNDriver,
                        'delete_router_assoc_precommit')
@@ -1316,6 +1584,35 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
                                     bgpvpn['bgpvpn']['id'])
             self.assertEqual([], bgpvpn_new['bgpvpn']['ports'])
 
+    @mock.patch.object(driver_api.BGPVPNDriverRC,
+                       'create_port_assocs_postcommit')
+    def test_create_bgpvpn_port_assoc_bulk(self, mock_post_commit):
+        route = {'type': 'prefix',
+                 'prefix': '12.1.0.0/16',
+                 'local_pref': 100}
+        with self.bgpvpn() as bgpvpn, \
+                self.port(project_id=self._project_id) as port1, \
+                self.port(project_id=self._project_id) as port2:
+            bgpvpn_id = bgpvpn['bgpvpn']['id']
+            port_ids = [port1['port']['id'], port2['port']['id']]
+            res = self._create_assocs_bulk(
+                bgpvpn_id, 'port_associations',
+                [{'port_id': port_ids[0], 'routes': [route]},
+                 {'port_id': port_ids[1]}])
+            self.assertEqual(webob.exc.HTTPCreated.code, res.status_int)
+            assocs = self.deserialize('json', res)['port_associations']
+            self.assertEqual(port_ids,
+                             [assoc['port_id'] for assoc in assocs])
+            self.assertEqual([[route], []],
+                             [assoc['routes'] for assoc in assocs])
+
+            mock_post_commit.assert_called_once_with(mock.ANY, mock.ANY)
+            self.assertEqual(
+                [assoc['id'] for assoc in assocs],
+                [assoc['id'] for assoc in mock_post_commit.call_args[0][1]])
+            bgpvpn_new = self._show('bgpvpn/bgpvpns', bgpvpn_id)
+            self.assertCountEqual(port_ids, bgpvpn_new['bgpvpn']['ports'])
+
     @mock.patch.object(bgpvpn_db.BGPVPNPluginDb, 'get_port_assoc')
     def test_get_bgpvpn_port_assoc(self, mock_get_db):
         with self.bgpvpn() as bgpvpn, \
@@ -1343,9 +1640,10 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
             res = 'bgpvpn/bgpvpns/' + bgpvpn_id + \
                   '/port_associations'
             self._list(res)
-            mock_get_db.assert_called_once_with(mock.ANY,
-                                                bgpvpn_id,
-                                                mock.ANY, mock.ANY)
+            mock_get_db.assert_called_once_with(
+                mock.ANY, bgpvpn_id, mock.ANY, mock.ANY,
+                sorts=mock.ANY, limit=mock.ANY, marker=mock.ANY,
+                page_reverse=mock.ANY)
 
     @mock.patch.object(driver_api.BGPVPNDriverRC,
                        'delete_port_assoc_precommit')
@@ -1407,14 +1705,45 @@ class TestBGPVPNServiceDriverDB(BgpvpnTestCaseMixin):
             mock_precommit.assert_called_once_with(
                 mock.ANY,
                 assoc['port_association'],
-                new_port_assoc['port_association']
+                new_port_assoc['port_association'],
+                routes_diff={'added': [], 'removed': []}
             )
             mock_postcommit.assert_called_once_with(
                 mock.ANY,
                 assoc['port_association'],
-                new_port_assoc['port_association']
+                new_port_assoc['port_association'],
+                routes_diff={'added': [], 'removed': []}
             )
 
+    def test_update_bgpvpn_port_assoc_hooks_without_routes_diff(self):
+        calls = []
+
+        # hooks of a driver written before routes_diff was added
+        def update_port_assoc_precommit(self, context, old_port_assoc,
+                                        port_assoc):
+            calls.append('precommit')
+
+        def update_port_assoc_postcommit(self, context, old_port_assoc,
+                                         port_assoc):
+            calls.append('postcommit')
+
+        mock.patch.object(driver_api.BGPVPNDriverRC,
+                          'update_port_assoc_precommit',
+                          update_port_assoc_precommit).start()
+        mock.patch.object(driver_api.BGPVPNDriverRC,
+                          'update_port_assoc_postcommit',
+                          update_port_assoc_postcommit).start()
+        with self.bgpvpn() as bgpvpn, \
+                self.port(project_id=self._project_id) as port, \
+                self.assoc_port(bgpvpn['bgpvpn']['id'],
+                                port['port']['id']) as assoc:
+            self._update('bgpvpn/bgpvpns/%s/port_associations' %
+                         bgpvpn['bgpvpn']['id'],
+                         assoc['port_association']['id'],
+                         {'port_association': {'advertise_fixed_ips': False}},
+                         as_admin=True)
+        self.assertEqual(['precommit', 'postcommit'], calls)
+
     @mock.patch.object(driver_api.BGPVPNDriverRC,
                        'delete_port_assoc_precommit')
     @mock.patch.object(driver_api.BGPVPNDriverRC,